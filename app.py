@@ -2,69 +2,109 @@
 """
 Ponto de entrada principal da aplicação Streamlit "Analisador-IA ProMax".
 """
+import uuid
+
 import streamlit as st
-import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from google.cloud import secretmanager
 
-from firebase_utils import initialize_services, listar_colecoes_salvas, salvar_colecao_atual, carregar_colecao
 from auth_utils import register_user, login_user
-from pdf_processing import obter_vector_store_de_uploads
-from ui_tabs import (
-    render_chat_tab, render_dashboard_tab, render_resumo_tab, 
-    render_riscos_tab, render_prazos_tab, render_conformidade_tab, 
-    render_anomalias_tab
+from config import LLM_CACHE_PARTILHADO
+# Só o necessário para a página de login: os módulos com LangChain, FAISS, PyMuPDF e pandas
+# (firebase_utils, pdf_processing, ui_tabs) são importados em render_main_app
+from services import (
+    aguardar_preaquecimento, initialize_services, ligar_cache_llm_partilhado, obter_embeddings,
+    preaquecer_modulos, setup_api_key
 )
-
-@st.cache_resource
-def setup_api_key():
-    """Obtém a chave de API da Google do Secret Manager e define-a como uma variável de ambiente."""
-    try:
-        project_id = "contratiapy"
-        secret_id = "google-api-key"
-        version_id = "latest"
-        name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-        
-        client = secretmanager.SecretManagerServiceClient()
-        response = client.access_secret_version(name=name)
-        api_key = response.payload.data.decode("UTF-8")
-        
-        # Define a variável de ambiente que todas as bibliotecas irão usar
-        os.environ["GOOGLE_API_KEY"] = api_key
-        return api_key
-    except Exception as e:
-        st.error(f"Não foi possível obter a Chave de API do Secret Manager: {e}")
-        return None
+from telemetry import definir_sessao, iniciar_servidor_metricas
 
 def render_login_page(db):
     st.title("Bem-vindo ao Analisador-IA ProMax")
     # ... (código inalterado)
 
+def _publicar_alteracao(registo, vector_store, nomes_arquivos):
+    """Troca o vector store da sessão pela cópia alterada; o anterior pode estar em uso noutras sessões."""
+    registo.substituir(st.session_state.id_sessao, st.session_state.vector_store, vector_store, nomes_arquivos)
+    st.session_state.vector_store, st.session_state.nomes_arquivos = vector_store, nomes_arquivos
+
 def render_main_app(db, BUCKET_NAME, embeddings):
+    from firebase_utils import (
+        catalogo_colecoes, salvar_colecao_atual, carregar_colecao, adicionar_documentos_a_colecao,
+        remover_documento_da_colecao, compactar_colecao, preaquecer_colecoes, carregar_colecoes_federadas
+    )
+    from vector_store_registry import obter_registo_vector_stores
+
     st.sidebar.title(f"Bem-vindo(a)!")
     st.sidebar.caption(st.session_state.user_email)
     
+    user_id = st.session_state.user_id
+    if not st.session_state.get("colecoes_preaquecidas"):
+        # Uma vez por sessão: deixa as coleções mais recentes do utilizador no cache local
+        preaquecer_colecoes(db, embeddings, user_id)
+        st.session_state.colecoes_preaquecidas = True
+
     with st.sidebar:
         st.header("Gerenciar Documentos")
-        user_id = st.session_state.user_id
-        modo = st.radio("Carregar documentos:", ("Novo Upload", "Carregar Coleção"), key="modo_carregamento")
+        modo = st.radio("Carregar documentos:", ("Novo Upload", "Carregar Coleção", "Pesquisar em Várias Coleções"), key="modo_carregamento")
 
         if modo == "Novo Upload":
             arquivos = st.file_uploader("Selecione PDFs", type="pdf", accept_multiple_files=True, key="upload_arquivos")
             if st.button("Processar Documentos", use_container_width=True, disabled=not arquivos):
+                from pdf_processing import obter_vector_store_de_uploads
                 # Já não precisamos de passar a chave de API
-                vs, nomes = obter_vector_store_de_uploads(arquivos, embeddings)
+                vs, nomes = obter_vector_store_de_uploads(arquivos, embeddings, ambito=user_id)
                 if vs and nomes:
                     st.session_state.messages = []
                     st.session_state.vector_store = vs
                     st.session_state.nomes_arquivos = nomes
                     st.session_state.colecao_ativa = None
+                    st.session_state.pesquisa_federada = False
+                    st.rerun()
+        elif modo == "Pesquisar em Várias Coleções":
+            catalogo = catalogo_colecoes(db, user_id)
+            nomes_colecoes = st.multiselect("Escolha as coleções:", list(catalogo), key="select_colecoes_federadas",
+                                            format_func=lambda nome: catalogo[nome].rotulo())
+            if st.button("Pesquisar nas Coleções", use_container_width=True, disabled=not nomes_colecoes):
+                federadas, nomes = carregar_colecoes_federadas(db, embeddings, user_id, nomes_colecoes)
+                if federadas:
+                    st.session_state.messages = []
+                    st.session_state.vector_store = federadas
+                    st.session_state.nomes_arquivos = nomes
+                    st.session_state.colecao_ativa = ", ".join(federadas.colecoes)
+                    st.session_state.pesquisa_federada = True
                     st.rerun()
         else: # Carregar Coleção
-            # ... (código inalterado)
-            pass
+            catalogo = catalogo_colecoes(db, user_id)
+            nome_colecao = st.selectbox("Escolha uma coleção:", list(catalogo), key="select_colecao", index=None,
+                                        format_func=lambda nome: catalogo[nome].rotulo())
+            if st.button("Carregar Coleção", use_container_width=True, disabled=not nome_colecao):
+                vs, nomes = carregar_colecao(db, embeddings, user_id, nome_colecao)
+                if vs and nomes is not None:
+                    st.session_state.messages = []
+                    st.session_state.vector_store = vs
+                    st.session_state.nomes_arquivos = nomes
+                    st.session_state.colecao_ativa = nome_colecao
+                    st.session_state.pesquisa_federada = False
+                    st.rerun()
+
+            colecao_ativa = st.session_state.get("colecao_ativa")
+            if st.session_state.get("vector_store") and colecao_ativa and not st.session_state.get("pesquisa_federada"):
+                st.markdown("---")
+                st.subheader(f"Atualizar '{colecao_ativa}'")
+                novos_arquivos = st.file_uploader("Adicionar PDFs", type="pdf", accept_multiple_files=True, key="upload_adicionar")
+                if st.button("Adicionar à Coleção", use_container_width=True, disabled=not novos_arquivos):
+                    resultado = adicionar_documentos_a_colecao(db, embeddings, user_id, colecao_ativa, st.session_state.vector_store, st.session_state.nomes_arquivos, novos_arquivos)
+                    if resultado is not None:
+                        _publicar_alteracao(obter_registo_vector_stores(), *resultado)
+                        st.rerun()
+                arquivo_remover = st.selectbox("Remover documento:", st.session_state.nomes_arquivos, key="select_remover", index=None)
+                if st.button("Remover da Coleção", use_container_width=True, disabled=not arquivo_remover):
+                    resultado = remover_documento_da_colecao(db, user_id, colecao_ativa, st.session_state.vector_store, st.session_state.nomes_arquivos, arquivo_remover)
+                    if resultado is not None:
+                        _publicar_alteracao(obter_registo_vector_stores(), *resultado)
+                        st.rerun()
+                if st.button("Compactar Coleção", use_container_width=True, help="Regrava o índice completo e descarta o histórico de alterações."):
+                    compactar_colecao(db, user_id, colecao_ativa, st.session_state.vector_store, st.session_state.nomes_arquivos)
 
-        if st.session_state.get("vector_store") and modo == "Novo Upload":
+        if st.session_state.get("vector_store") and modo == "Novo Upload" and not st.session_state.get("pesquisa_federada"):
             st.markdown("---")
             st.subheader("Salvar Coleção Atual")
             nome_colecao = st.text_input("Nome para a nova coleção:", key="nome_nova_colecao")
@@ -73,13 +113,33 @@ def render_main_app(db, BUCKET_NAME, embeddings):
         
         st.sidebar.markdown("<hr>", unsafe_allow_html=True)
         if st.sidebar.button("Logout"):
+            obter_registo_vector_stores().libertar_sessao(st.session_state.id_sessao)
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
 
+    # O vector store desta sessão conta no orçamento de memória partilhado e não é descartado
+    # enquanto estiver em uso; em cada rerun a sessão renova a sua atividade
+    registo = obter_registo_vector_stores()
+    if st.session_state.get("vector_store"):
+        registo.usar_na_sessao(st.session_state.id_sessao, st.session_state.vector_store, st.session_state.get("nomes_arquivos"))
+    else:
+        registo.libertar_sessao(st.session_state.id_sessao)
+
     st.title("💡 Analisador-IA ProMax")
     if not st.session_state.get("vector_store"):
         st.info("👈 Por favor, carregue documentos ou uma coleção para começar.")
+        return
+
+    from ui_tabs import (
+        render_chat_tab, render_dashboard_tab, render_resumo_tab,
+        render_riscos_tab, render_prazos_tab, render_conformidade_tab,
+        render_anomalias_tab
+    )
+    if st.session_state.get("pesquisa_federada"):
+        # As restantes abas trabalham sobre o texto de uma única coleção
+        st.caption(f"🔎 Pesquisa conjunta em: {st.session_state.colecao_ativa}")
+        render_chat_tab(st.session_state.vector_store, st.session_state.nomes_arquivos)
     else:
         tabs = st.tabs(["💬 Chat", "📈 Dashboard", "📜 Resumo", "🚩 Riscos", "🗓️ Prazos", "⚖️ Conformidade", "📊 Anomalias"])
         vector_store = st.session_state.vector_store
@@ -95,6 +155,11 @@ def render_main_app(db, BUCKET_NAME, embeddings):
 
 def main():
     st.set_page_config(layout="wide", page_title="Analisador-IA ProMax", page_icon="💡")
+    # Cada rerun corre numa thread do Streamlit: a sessão da telemetria é definida em todos
+    if "id_sessao" not in st.session_state:
+        st.session_state.id_sessao = uuid.uuid4().hex
+    definir_sessao(st.session_state.id_sessao)
+    iniciar_servidor_metricas()
     
     # Carrega a chave de API e define a variável de ambiente
     api_key = setup_api_key()
@@ -107,17 +172,22 @@ def main():
         st.error("Falha na conexão com o banco de dados.")
         return
         
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
 
     if not st.session_state.logged_in:
         render_login_page(db)
+        # Enquanto o utilizador preenche o formulário, o resto da aplicação é importado em fundo
+        preaquecer_modulos()
     else:
+        aguardar_preaquecimento()
+        if LLM_CACHE_PARTILHADO:
+            # As respostas do LLM ficam também no Firestore, partilhadas entre instâncias
+            ligar_cache_llm_partilhado(db)
         if "vector_store" not in st.session_state:
             st.session_state.vector_store = None
-        render_main_app(db, BUCKET_NAME, embeddings)
+        # Os embeddings passam pelo cache local (ingestão e perguntas do chat)
+        render_main_app(db, BUCKET_NAME, obter_embeddings())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,818 @@
+# benchmarks.py
+"""
+Medições de desempenho das etapas da aplicação, executáveis fora do Streamlit.
+
+Uso:
+    python benchmarks.py extracao contrato1.pdf contrato2.pdf --workers 1 2 4
+    python benchmarks.py ocr contrato.pdf --latencia 0.5 --rpm 120 --concorrencia 1 4 8
+    python benchmarks.py fusao --vetores 5000 --delta 500
+    python benchmarks.py arranque --repeticoes 5
+    python benchmarks.py suite --contratos 5 20 50 --saida antes.json
+    python benchmarks.py comparar antes.json depois.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest import mock
+from pathlib import Path
+
+import numpy as np
+
+
+def benchmark_extracao(caminhos_pdf, lista_workers=(1, 2, 4), repeticoes=3):
+    """
+    Compara o débito (páginas/s) da extração com PyMuPDF em série (1 worker)
+    com o modo de pool de processos, e confirma que o resultado é idêntico.
+    """
+    from pdf_processing import extrair_textos_pymupdf
+
+    arquivos = [(Path(c).name, Path(c).read_bytes()) for c in caminhos_pdf]
+    referencia = None
+    resultados = []
+    for num_workers in lista_workers:
+        # Primeira execução fora da medição: arranca o pool de processos
+        extrair_textos_pymupdf(arquivos, num_workers)
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            docs = extrair_textos_pymupdf(arquivos, num_workers)
+            tempos.append(time.perf_counter() - inicio)
+        assinatura = {nome: [(d.metadata["page"], d.page_content) for d in lista] for nome, lista in docs.items()}
+        if referencia is None:
+            referencia = assinatura
+        total_paginas = sum(len(lista) for lista in docs.values())
+        melhor = min(tempos)
+        resultados.append({
+            "workers": num_workers,
+            "paginas": total_paginas,
+            "segundos": round(melhor, 4),
+            "paginas_por_segundo": round(total_paginas / melhor, 1) if melhor else None,
+            "igual_ao_serial": assinatura == referencia,
+        })
+    return resultados
+
+
+def benchmark_ocr(caminho_pdf, latencia=0.5, pedidos_por_minuto=120, lista_concorrencia=(1, 4), falhas_429=0):
+    """
+    Mede o OCR com Gemini Vision (a função usada pelo pipeline de ingestão) contra um
+    modelo de visão falso com latência injetável, para cada nível de concorrência, e
+    verifica a ordem das páginas.
+    """
+    from concurrency_utils import TokenBucket
+    from fakes import FakeVisionModel
+    from pdf_processing import _ocr_paginas
+
+    pdf_bytes = Path(caminho_pdf).read_bytes()
+    resultados = []
+    for max_concorrencia in lista_concorrencia:
+        modelo = FakeVisionModel(latencia=latencia, falhas_429=falhas_429)
+        erros = []
+
+        def _pagina_concluida(concluidas, total, page_num, erro):
+            if erro is not None:
+                erros.append(page_num)
+
+        inicio = time.perf_counter()
+        docs = _ocr_paginas(
+            pdf_bytes, Path(caminho_pdf).name, modelo,
+            max_concorrencia=max_concorrencia, limitador=TokenBucket(pedidos_por_minuto),
+            ao_concluir_pagina=_pagina_concluida,
+        )
+        duracao = time.perf_counter() - inicio
+        paginas = [d.metadata["page"] for d in docs]
+        resultados.append({
+            "concorrencia": max_concorrencia,
+            "paginas": len(docs),
+            "paginas_com_erro": len(erros),
+            "chamadas": modelo.chamadas,
+            "concorrencia_observada": modelo.concorrencia_maxima,
+            "segundos": round(duracao, 3),
+            "ordem_preservada": paginas == sorted(paginas),
+        })
+    return resultados
+
+
+def _contrato_sintetico(num_clausulas, palavras_por_clausula=400):
+    """Texto de contrato com 'num_clausulas' cláusulas numeradas, para os benchmarks de LLM."""
+    corpo = " ".join(f"termo{i % 97}" for i in range(palavras_por_clausula))
+    return "\n".join(f"CLÁUSULA {n}ª - DA OBRIGAÇÃO {n}\n{corpo}.\n" for n in range(1, num_clausulas + 1))
+
+
+def benchmark_mapreduce(lista_clausulas=(20, 200, 600), latencia_base=0.2, latencia_por_mil_tokens=0.05,
+                        max_concorrencia=4):
+    """
+    Compara a chamada única com o map-reduce do orçamento de contexto para contratos
+    sintéticos de vários tamanhos, com um LLM falso cuja latência cresce com o prompt.
+    """
+    from context_budget import estimar_tokens, executar_com_orcamento, resumo_do_relatorio
+    from fakes import FakeLLM
+    from llm_cache import CacheRespostasLLM
+    from llm_utils import PROMPT_RISCOS, PROMPT_RISCOS_FINAL, PROMPT_RISCOS_SECAO
+
+    resultados = []
+    for num_clausulas in lista_clausulas:
+        texto = _contrato_sintetico(num_clausulas)
+        variaveis = {"nome_arquivo": "sintetico.pdf"}
+        linha = {"clausulas": num_clausulas, "tokens_estimados": estimar_tokens(texto)}
+        for modo, max_tokens in (("unica", 10 ** 9), ("orcamento", None)):
+            llm = FakeLLM(latencia_base, latencia_por_mil_tokens)
+            # Cache sem armazenamentos: todas as chamadas chegam ao LLM falso
+            opcoes = {"max_concorrencia": max_concorrencia, "cache": CacheRespostasLLM([])}
+            if max_tokens is not None:
+                opcoes["max_tokens"] = max_tokens
+            inicio = time.perf_counter()
+            _, relatorio = executar_com_orcamento(
+                texto, PROMPT_RISCOS, PROMPT_RISCOS_SECAO, PROMPT_RISCOS_FINAL, llm, variaveis=variaveis, **opcoes
+            )
+            linha[modo] = {
+                **resumo_do_relatorio(relatorio),
+                "segundos": round(time.perf_counter() - inicio, 3),
+                "maior_prompt_tokens": max(r["tokens_entrada"] for r in relatorio),
+            }
+        resultados.append(linha)
+    return resultados
+
+
+_CLAUSULAS_RELEVANTES = [
+    "O BANCO EXEMPLO S.A., instituição financeira emissora, concede ao cliente o crédito previsto neste contrato.",
+    "O valor principal do empréstimo é de R$ 50.000,00 (cinquenta mil reais).",
+    "A taxa de juros é de 2,5% ao mês e 34,49% ao ano; os juros do crédito rotativo incidem sobre o saldo não pago.",
+    "O prazo de vigência do contrato é de 36 meses, em 36 parcelas mensais.",
+    "O limite de crédito é definido pelo banco e pode ser alterado mediante aviso prévio.",
+    "Será cobrada tarifa de anuidade de R$ 480,00, em 12 parcelas.",
+    "Em caso de rescisão ou cancelamento antecipado incide multa rescisória de 2% sobre o saldo devedor.",
+]
+
+
+def _colecao_sintetica(num_paginas, embeddings):
+    """Vector store com um contrato de 'num_paginas' páginas e as cláusulas relevantes espalhadas."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    from document_index import IndiceDocumentos, anexar_indice
+    from pdf_processing import CHUNK_OVERLAP, CHUNK_SIZE
+
+    enchimento = ("As partes declaram ter lido e compreendido as disposições gerais deste instrumento, "
+                  "que se rege pela legislação aplicável e pelas normas do órgão regulador competente. ") * 12
+    paginas = []
+    for numero in range(num_paginas):
+        texto = f"Página {numero + 1}. {enchimento}"
+        posicao = numero * len(_CLAUSULAS_RELEVANTES) // max(num_paginas, 1)
+        if numero == 0 or posicao != (numero - 1) * len(_CLAUSULAS_RELEVANTES) // max(num_paginas, 1):
+            texto += "\n" + _CLAUSULAS_RELEVANTES[posicao]
+        paginas.append(Document(page_content=texto, metadata={"source": "sintetico.pdf", "page": numero}))
+    if num_paginas < len(_CLAUSULAS_RELEVANTES):
+        paginas[-1].page_content += "\n" + "\n".join(_CLAUSULAS_RELEVANTES[num_paginas:])
+    divisor = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+    fragmentos = divisor.split_documents(paginas)
+    ids = [f"frag-{i}" for i in range(len(fragmentos))]
+    vector_store = FAISS.from_documents(fragmentos, embeddings, ids=ids)
+    return anexar_indice(vector_store, IndiceDocumentos.construir(paginas, fragmentos, ids))
+
+
+def benchmark_extracao_campos(lista_paginas=(5, 50, 300), latencia_base=0.2, latencia_por_mil_tokens=0.05):
+    """
+    Extração dos campos do Dashboard com o texto completo vs. com os trechos dirigidos,
+    num contrato sintético de cada tamanho (embeddings e LLM falsos, sem cache de respostas).
+    """
+    from fakes import FakeEmbeddings, FakeLLM
+    from llm_cache import CacheRespostasLLM
+    import llm_utils
+
+    resposta = json.dumps({
+        "arquivo_fonte": "sintetico.pdf", "nome_banco_emissor": "Banco Exemplo S.A.",
+        "valor_principal_numerico": 50000.0, "prazo_total_meses": 36, "taxa_juros_anual_numerica": 34.49,
+        "possui_clausula_rescisao_multa": "Sim", "condicao_limite_credito": "Definido pelo banco",
+        "condicao_juros_rotativo": "Sobre o saldo não pago", "condicao_anuidade": "R$ 480,00",
+        "condicao_cancelamento": "Multa de 2%",
+    })
+    sem_cache = CacheRespostasLLM([])
+    invocar_original = llm_utils.invocar_com_cache
+    resultados = []
+    try:
+        llm_utils.invocar_com_cache = lambda llm, prompt, variaveis, cache=None: invocar_original(
+            llm, prompt, variaveis, cache=sem_cache)
+        for num_paginas in lista_paginas:
+            vector_store = _colecao_sintetica(num_paginas, FakeEmbeddings())
+            linha = {"paginas": num_paginas, "fragmentos": vector_store.index.ntotal}
+            for modo in ("completo", "dirigido"):
+                llm = FakeLLM(latencia_base, latencia_por_mil_tokens, resposta=lambda _: resposta)
+                inicio = time.perf_counter()
+                dados, relatorio = llm_utils.extrair_dados_em_paralelo(
+                    vector_store, ["sintetico.pdf"], llm, modo=modo)
+                linha[modo] = {
+                    "segundos": round(time.perf_counter() - inicio, 3),
+                    "tokens_entrada": relatorio[0]["tokens_entrada"],
+                    "modo_usado": relatorio[0]["modo"],
+                    "motivo_texto_completo": relatorio[0]["motivo_texto_completo"],
+                    "semelhanca_minima": relatorio[0]["semelhanca_minima"],
+                    "campos_iguais": dados[0] == json.loads(resposta),
+                }
+            linha["reducao_tokens"] = round(linha["completo"]["tokens_entrada"] / linha["dirigido"]["tokens_entrada"], 1)
+            resultados.append(linha)
+    finally:
+        llm_utils.invocar_com_cache = invocar_original
+    return resultados
+
+
+def benchmark_chat(num_perguntas=5, palavras_resposta=150, latencia_base=0.3, latencia_por_mil_tokens=0.05,
+                   latencia_por_palavra=0.01):
+    """
+    Chat sobre uma coleção sintética: tempo até ao primeiro texto visível com a resposta
+    pedida de uma vez ('invoke', como antes) vs. o motor do chat em streaming.
+    """
+    from chat_engine import PROMPT_CHAT, MotorChat
+    from fakes import FakeEmbeddings, FakeLLM
+
+    vector_store = _colecao_sintetica(50, FakeEmbeddings())
+    resposta = " ".join(["palavra"] * palavras_resposta)
+    llm = FakeLLM(latencia_base, latencia_por_mil_tokens, resposta=lambda _: resposta,
+                  latencia_por_palavra=latencia_por_palavra)
+    perguntas = [f"Qual é a taxa de juros do contrato? ({i})" for i in range(num_perguntas)]
+
+    primeiro_invoke = []
+    for pergunta in perguntas:
+        inicio = time.perf_counter()
+        fontes = vector_store.similarity_search(pergunta, k=5)
+        contexto = "\n\n".join(doc.page_content for doc in fontes)
+        llm.invoke(PROMPT_CHAT.format(context=contexto, question=pergunta))
+        primeiro_invoke.append(time.perf_counter() - inicio)
+
+    motor = MotorChat(vector_store, llm)
+    primeiro_stream, total_stream = [], []
+    for pergunta in perguntas:
+        inicio = time.perf_counter()
+        fontes = motor.recuperar(pergunta)
+        for i, _ in enumerate(motor.transmitir(pergunta, fontes)):
+            if i == 0:
+                primeiro_stream.append(time.perf_counter() - inicio)
+        total_stream.append(time.perf_counter() - inicio)
+
+    media = lambda valores: round(sum(valores) / len(valores), 3)
+    return {
+        "perguntas": num_perguntas,
+        "invoke": {"segundos_ate_primeiro_texto": media(primeiro_invoke)},
+        "stream": {"segundos_ate_primeiro_texto": media(primeiro_stream),
+                   "segundos_resposta_completa": media(total_stream)},
+    }
+
+
+def _vetores_agrupados(num_vetores, dimensao, num_grupos, rng):
+    """Vetores sintéticos à volta de centros aleatórios, mais próximos de embeddings reais do que ruído uniforme."""
+    centros = rng.standard_normal((num_grupos, dimensao)).astype(np.float32)
+    grupos = rng.integers(0, num_grupos, num_vetores)
+    return centros[grupos] + 0.5 * rng.standard_normal((num_vetores, dimensao)).astype(np.float32)
+
+
+def benchmark_indices(lista_vetores=(20000, 100000), dimensao=768, num_consultas=200, k=5,
+                      lista_ef_search=(16, 32, 64, 128), lista_nprobe=(1, 4, 8, 32)):
+    """
+    Índice exato (flat) vs. HNSW e IVF: tempo de construção, latência por consulta
+    (uma pergunta de cada vez, como no chat) e recall@k face aos vizinhos exatos.
+    """
+    from vector_index import construir_indice, definir_parametros_pesquisa
+
+    rng = np.random.default_rng(0)
+    resultados = []
+    for num_vetores in lista_vetores:
+        vetores = _vetores_agrupados(num_vetores + num_consultas, dimensao, max(10, num_vetores // 500), rng)
+        vetores, consultas = vetores[:num_vetores], vetores[num_vetores:]
+
+        def _medir(index):
+            encontrados, inicio = [], time.perf_counter()
+            for consulta in consultas:
+                encontrados.append(index.search(consulta[None, :], k)[1][0])
+            return np.array(encontrados), (time.perf_counter() - inicio) * 1000 / num_consultas
+
+        linha = {"vetores": num_vetores, "dimensao": dimensao, "k": k}
+        inicio = time.perf_counter()
+        plano = construir_indice(vetores, "flat")
+        construcao = time.perf_counter() - inicio
+        exatos, ms = _medir(plano)
+        linha["flat"] = {"segundos_construcao": round(construcao, 2), "ms_por_consulta": round(ms, 3)}
+
+        for tipo, nome_parametro, valores in (("hnsw", "ef_search", lista_ef_search), ("ivf", "nprobe", lista_nprobe)):
+            inicio = time.perf_counter()
+            index = construir_indice(vetores, tipo)
+            linha[tipo] = {"segundos_construcao": round(time.perf_counter() - inicio, 2), "pesquisas": []}
+            for valor in valores:
+                definir_parametros_pesquisa(index, **{nome_parametro: valor})
+                encontrados, ms = _medir(index)
+                recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(encontrados, exatos)])
+                linha[tipo]["pesquisas"].append({
+                    nome_parametro: valor, "recall": round(float(recall), 3), "ms_por_consulta": round(ms, 3),
+                    "aceleracao": round(linha["flat"]["ms_por_consulta"] / ms, 1),
+                })
+        resultados.append(linha)
+    return resultados
+
+
+def benchmark_fusao(num_vetores=5000, num_delta=500, dimensao=64):
+    """
+    Fusão de um delta numa coleção (fundir_vector_stores) para cada combinação de tipo
+    de índice e origem: em memória, pickle antigo (IndexFlatL2 do LangChain) ou mapeado
+    do disco (FAISSPreguicoso). Verifica que o destino fica com todos os vetores e que
+    um vetor do delta se encontra a si próprio.
+    """
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from collection_format import abrir_colecao, guardar_colecao
+    from fakes import FakeEmbeddings
+    from vector_index import construir_indice, fundir_vector_stores
+
+    rng = np.random.default_rng(0)
+    embeddings = FakeEmbeddings()
+    vetores = _vetores_agrupados(num_vetores, dimensao, 20, rng)
+    vetores_delta = _vetores_agrupados(num_delta, dimensao, 20, rng)
+
+    def _vector_store(vetores, tipo, origem, prefixo, pasta):
+        ids = [f"{prefixo}{i}" for i in range(len(vetores))]
+        if origem == "pickle":
+            return FAISS.from_embeddings(list(zip(ids, vetores.tolist())), embeddings, ids=ids)
+        documentos = {doc_id: Document(page_content=doc_id, metadata={"source": prefixo}) for doc_id in ids}
+        vs = FAISS(embeddings, construir_indice(vetores, tipo), InMemoryDocstore(documentos), dict(enumerate(ids)))
+        if origem == "mapeado":
+            guardar_colecao(vs, pasta)
+            vs = abrir_colecao(pasta, embeddings)
+        return vs
+
+    destinos = [("flat", "memoria"), ("flat", "pickle"), ("flat", "mapeado"), ("hnsw", "memoria"), ("hnsw", "mapeado")]
+    deltas = [("flat", "memoria"), ("flat", "mapeado"), ("hnsw", "memoria"), ("hnsw", "mapeado")]
+    resultados = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for n, ((tipo, origem), (tipo_delta, origem_delta)) in enumerate(
+                (destino, delta) for destino in destinos for delta in deltas):
+            vs = _vector_store(vetores, tipo, origem, "a", Path(temp_dir) / f"{n}-destino")
+            vs_delta = _vector_store(vetores_delta, tipo_delta, origem_delta, "b", Path(temp_dir) / f"{n}-delta")
+            inicio = time.perf_counter()
+            fundir_vector_stores(vs, vs_delta)
+            duracao = time.perf_counter() - inicio
+            encontrado = vs.similarity_search_by_vector(vetores_delta[-1].tolist(), k=1)
+            resultados.append({
+                "destino": f"{tipo}/{origem}",
+                "delta": f"{tipo_delta}/{origem_delta}",
+                "segundos": round(duracao, 4),
+                "correto": (vs.index.ntotal == num_vetores + num_delta
+                            and len(vs.index_to_docstore_id) == num_vetores + num_delta
+                            and bool(encontrado) and encontrado[0].page_content == f"b{num_delta - 1}"),
+            })
+    return resultados
+
+
+def _contratos_com_padrao(num_contratos, clausulas_padrao=30, clausulas_proprias=10, palavras_por_clausula=120, rng=None):
+    """
+    Contratos sintéticos do mesmo banco: cláusulas padrão partilhadas (algumas com uma palavra
+    trocada) e cláusulas próprias de cada contrato, com valores e taxas diferentes.
+    """
+    rng = rng or np.random.default_rng(0)
+    # Palavras sem dígitos nem maiúsculas: na deduplicação, só os números e nomes próprios são distintivos
+    letras = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    vocabulario = ["".join(rng.choice(letras, 6)) for _ in range(500)]
+    padrao = [" ".join(rng.choice(vocabulario, palavras_por_clausula)) for _ in range(clausulas_padrao)]
+    contratos = []
+    for c in range(num_contratos):
+        clausulas = []
+        for n, texto in enumerate(padrao):
+            palavras = texto.split()
+            if rng.random() < 0.3:
+                palavras[rng.integers(len(palavras))] = "variante"
+            clausulas.append(f"CLÁUSULA PADRÃO {n}. " + " ".join(palavras))
+        for n in range(clausulas_proprias):
+            clausulas.append(f"CLÁUSULA {n} do contrato {c}: valor de R$ {rng.integers(1000, 99999)} à taxa de "
+                             f"{rng.integers(1, 20)}% ao ano. " + " ".join(rng.choice(vocabulario, palavras_por_clausula)))
+        contratos.append(clausulas)
+    return contratos
+
+
+def benchmark_dedup(lista_contratos=(10, 50, 200), dimensao=768):
+    """
+    Deduplicação de fragmentos: fragmentos embebidos e tamanho do índice com e sem ela,
+    e o custo da classificação (MinHash/LSH) por fragmento.
+    """
+    from chunk_dedup import DeduplicadorFragmentos
+
+    resultados = []
+    for num_contratos in lista_contratos:
+        fragmentos = [clausula for contrato in _contratos_com_padrao(num_contratos) for clausula in contrato]
+        deduplicador = DeduplicadorFragmentos()
+        inicio = time.perf_counter()
+        for texto in fragmentos:
+            deduplicador.classificar(texto)
+        duracao = time.perf_counter() - inicio
+        estatisticas = deduplicador.estatisticas()
+        resultados.append({
+            "contratos": num_contratos,
+            **estatisticas,
+            "ms_por_fragmento": round(duracao * 1000 / len(fragmentos), 3),
+            "mb_indice_sem_dedup": round(len(fragmentos) * dimensao * 4 / 1e6, 2),
+            "mb_indice_com_dedup": round(estatisticas["unicos"] * dimensao * 4 / 1e6, 2),
+        })
+    return resultados
+
+
+# Bibliotecas que a página de login não deve importar
+MODULOS_PESADOS = ("langchain", "langchain_community", "langchain_google_genai", "faiss", "fitz", "pandas",
+                   "google.cloud.secretmanager", "google.cloud.storage")
+
+# Página de login com os serviços externos trocados por valores falsos (sem rede)
+_PAGINA_LOGIN = """
+import app
+app.setup_api_key = lambda: "chave-falsa"
+app.initialize_services = lambda: (object(), "bucket-falso")
+app.main()
+"""
+
+# Executado num interpretador novo: o tempo de importação só é real com os módulos por carregar
+_SCRIPT_ARRANQUE = """
+import importlib, json, sys, time
+MODULOS_PESADOS, MODULOS_APLICACAO, PAGINA_LOGIN = json.loads(sys.argv[1])
+
+inicio = time.perf_counter()
+import app
+importacao = time.perf_counter() - inicio
+pesados = sorted(m for m in MODULOS_PESADOS if m in sys.modules)
+
+from streamlit.testing.v1 import AppTest
+pagina = AppTest.from_string(PAGINA_LOGIN, default_timeout=120)
+inicio = time.perf_counter()
+pagina.run()
+render = time.perf_counter() - inicio
+assert not pagina.exception and pagina.title[0].value.startswith("Bem-vindo"), "A página de login não foi desenhada."
+
+inicio = time.perf_counter()
+for nome in MODULOS_APLICACAO:
+    importlib.import_module(nome)
+pos_login = time.perf_counter() - inicio
+print(json.dumps({"importacao": importacao, "render": render, "pos_login": pos_login, "pesados": pesados}))
+"""
+
+
+def benchmark_arranque(repeticoes=3):
+    """
+    Arranque a frio: tempo de 'import app', tempo até a página de login estar desenhada
+    (importação + primeira execução do script, com serviços falsos) e bibliotecas pesadas
+    já carregadas nesse momento. 'segundos_pos_login' é o que a importação em fundo
+    (CONTRATIA_PREAQUECER_MODULOS) esconde do utilizador; está desativada durante a medição.
+    """
+    from services import MODULOS_APLICACAO
+
+    pasta = Path(__file__).resolve().parent
+    parametros = json.dumps([MODULOS_PESADOS, MODULOS_APLICACAO, _PAGINA_LOGIN])
+    ambiente = {**os.environ, "CONTRATIA_PREAQUECER_MODULOS": "0"}
+    medicoes = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        saida = subprocess.run([sys.executable, "-c", _SCRIPT_ARRANQUE, parametros], cwd=pasta, env=ambiente,
+                               capture_output=True, text=True, check=True).stdout
+        medicao = json.loads(saida.strip().splitlines()[-1])
+        medicao["processo"] = time.perf_counter() - inicio
+        medicoes.append(medicao)
+    mediana = lambda campo: round(float(np.median([m[campo] for m in medicoes])), 3)
+    return {
+        "repeticoes": repeticoes,
+        "segundos_importacao_app": mediana("importacao"),
+        "segundos_ate_pagina_login": round(mediana("importacao") + mediana("render"), 3),
+        "segundos_processo": mediana("processo"),
+        "segundos_pos_login": mediana("pos_login"),
+        "modulos_pesados_no_login": medicoes[-1]["pesados"],
+    }
+
+
+VERSAO_SUITE = 1
+
+PERGUNTAS_SUITE = [
+    "Qual é a taxa de juros anual do contrato?", "Qual é o valor principal concedido?",
+    "Qual é o prazo de vigência?", "Há multa por rescisão antecipada?", "Como é cobrada a anuidade?",
+]
+
+
+def _ficheiro_enviado(nome, dados):
+    """Imita o UploadedFile do Streamlit (read, seek e name)."""
+    arquivo = io.BytesIO(dados)
+    arquivo.name = nome
+    return arquivo
+
+
+@contextlib.contextmanager
+def _servicos_falsos(pasta, latencia_llm, latencia_por_mil_tokens, latencia_visao, latencia_storage, palavras_resposta):
+    """
+    Troca, durante o bloco, todos os serviços externos pelos falsos: modelos Gemini (texto e
+    visão), Storage e caches persistentes (LLM e coleções ficam vazios, numa pasta temporária).
+    Devolve um dicionário com as fábricas de modelos e o bucket, para as contagens.
+    """
+    import collection_cache
+    import llm_cache
+    import llm_utils
+    import pdf_processing
+    import services
+    import vector_store_registry
+    from fakes import FabricaModelosFalsos, FakeBucket, RespostasContrato
+
+    falsos = {
+        "llm": FabricaModelosFalsos(latencia_llm, latencia_por_mil_tokens, RespostasContrato(palavras_resposta)),
+        "visao": FabricaModelosFalsos(latencia_visao, visao=True, texto_visao=(
+            "CLÁUSULA 1ª - DO VALOR. O BANCO concede ao CLIENTE o valor principal de R$ 10.000,00. "
+            "CLÁUSULA 2ª - DO PRAZO. O contrato vigora por 12 meses, de 01/02/2024 até ao pagamento final.")),
+        "bucket": FakeBucket(latencia_storage),
+    }
+    with contextlib.ExitStack() as pilha:
+        pilha.enter_context(mock.patch.object(llm_utils, "ChatGoogleGenerativeAI", falsos["llm"]))
+        pilha.enter_context(mock.patch.object(pdf_processing, "ChatGoogleGenerativeAI", falsos["visao"]))
+        pilha.enter_context(mock.patch.object(llm_cache, "_cache_llm", llm_cache.CacheRespostasLLM([])))
+        pilha.enter_context(mock.patch.object(services, "_bucket", falsos["bucket"]))
+        pilha.enter_context(mock.patch.object(vector_store_registry, "_registo", vector_store_registry.RegistoVectorStores()))
+        pilha.enter_context(mock.patch.object(collection_cache, "_cache_colecoes", collection_cache.CacheColecoes(
+            Path(pasta) / "colecoes", registo=vector_store_registry.obter_registo_vector_stores())))
+        yield falsos
+
+
+def _medir_llm(fabrica, funcao, *args):
+    """
+    Executa uma função do llm_utils e devolve (resultado, {segundos, chamadas ao LLM, tokens enviados}),
+    ou (None, {erro}) se a função falhar.
+    """
+    from context_budget import estimar_tokens
+
+    instancias, chamadas = len(fabrica.instancias), fabrica.chamadas
+    inicio = time.perf_counter()
+    try:
+        resultado = funcao(*args)
+    except Exception as e:
+        # Uma análise que falha fica registada no resultado; as restantes continuam a ser medidas
+        return None, {"erro": f"{type(e).__name__}: {e}"}
+    segundos = time.perf_counter() - inicio
+    # Os modelos são criados dentro de cada função: os prompts enviados estão nas instâncias novas
+    tokens = sum(estimar_tokens(prompt) for modelo in fabrica.instancias[instancias:] for prompt in modelo.prompts)
+    return resultado, {"segundos": round(segundos, 3), "chamadas_llm": fabrica.chamadas - chamadas,
+                       "tokens_entrada": tokens}
+
+
+def _medir_tamanho(num_contratos, paginas_por_contrato, fracao_imagem, embeddings, falsos, db, pasta):
+    import collection_cache
+    import llm_utils
+    import pandas as pd
+    from chat_engine import MotorChat
+    from document_index import texto_completo_do_ficheiro
+    from firebase_utils import carregar_colecao, salvar_colecao_atual
+    from job_queue import ContextoTrabalho, FilaTrabalhos
+    from pdf_processing import obter_vector_store_de_uploads
+    from synthetic_contracts import gerar_corpus
+    from vector_store_registry import RegistoVectorStores
+
+    corpus = gerar_corpus(num_contratos, paginas_por_contrato, fracao_imagem)
+    linha = {"contratos": num_contratos, "paginas": num_contratos * paginas_por_contrato,
+             "bytes_pdf": sum(len(dados) for _, dados in corpus)}
+
+    chamadas_visao, textos_embebidos = falsos["visao"].chamadas, embeddings.textos_embebidos
+    inicio = time.perf_counter()
+    vector_store, nomes = obter_vector_store_de_uploads([_ficheiro_enviado(n, d) for n, d in corpus], embeddings,
+                                                        usar_cache=False)
+    linha["ingestao"] = {
+        "segundos": round(time.perf_counter() - inicio, 3), "ficheiros": len(nomes or []),
+        "fragmentos": vector_store.index.ntotal, "paginas_ocr": falsos["visao"].chamadas - chamadas_visao,
+        "textos_embebidos": embeddings.textos_embebidos - textos_embebidos,
+    }
+
+    motor = MotorChat(vector_store, falsos["llm"]())
+    tempos = []
+    for pergunta in PERGUNTAS_SUITE:
+        inicio = time.perf_counter()
+        motor.recuperar(pergunta)
+        tempos.append(time.perf_counter() - inicio)
+    linha["pesquisa"] = {"consultas": len(tempos), "ms_por_consulta": round(1000 * float(np.mean(tempos)), 3)}
+
+    contexto = ContextoTrabalho(FilaTrabalhos(":memory:", num_workers=1), "benchmark")
+    fabrica = falsos["llm"]
+    textos = [texto_completo_do_ficheiro(vector_store, nome) for nome in nomes[:2]]
+    dashboard, linha["dashboard"] = _medir_llm(fabrica, llm_utils.trabalho_dashboard, contexto, vector_store, nomes)
+    _, linha["resumo"] = _medir_llm(fabrica, llm_utils.gerar_resumo_executivo, textos[0], nomes[0])
+    _, linha["riscos"] = _medir_llm(fabrica, llm_utils.trabalho_riscos, contexto, vector_store, nomes[0])
+    _, linha["prazos"] = _medir_llm(fabrica, llm_utils.trabalho_prazos, contexto, vector_store, nomes)
+    if len(nomes) >= 2:
+        _, linha["conformidade"] = _medir_llm(fabrica, llm_utils.verificar_conformidade_documento,
+                                              textos[0], nomes[0], textos[1], nomes[1])
+    _, linha["anomalias"] = _medir_llm(fabrica, llm_utils.detectar_anomalias_no_dataframe,
+                                       pd.DataFrame(dashboard["dados"] if dashboard else []))
+
+    nome_colecao = f"benchmark-{num_contratos}"
+    bytes_enviados = falsos["bucket"].bytes_enviados
+    inicio = time.perf_counter()
+    salvar_colecao_atual(db, "benchmark", nome_colecao, vector_store, nomes)
+    linha["salvar"] = {"segundos": round(time.perf_counter() - inicio, 3),
+                       "bytes_enviados": falsos["bucket"].bytes_enviados - bytes_enviados}
+
+    # Frio (Storage), com a pasta já em disco (novo processo) e com o vector store em memória
+    linha["carregar"] = {}
+    pasta_cache = Path(pasta) / f"colecoes-{num_contratos}"
+    # Cada cache novo tem o seu registo de vector stores: a memória começa vazia
+    for origem, cache in (("storage", collection_cache.CacheColecoes(pasta_cache, registo=RegistoVectorStores())),
+                          ("disco", collection_cache.CacheColecoes(pasta_cache, registo=RegistoVectorStores())),
+                          ("memoria", None)):
+        with mock.patch.object(collection_cache, "_cache_colecoes", cache or collection_cache._cache_colecoes):
+            inicio = time.perf_counter()
+            carregado, _ = carregar_colecao(db, embeddings, "benchmark", nome_colecao)
+            linha["carregar"][f"segundos_{origem}"] = round(time.perf_counter() - inicio, 3)
+        if origem == "storage":
+            collection_cache._cache_colecoes = cache
+        if carregado is None:
+            raise RuntimeError(f"A coleção '{nome_colecao}' não foi carregada.")
+    return linha
+
+
+def _ambiente():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).resolve().parent,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count(),
+            "commit": commit}
+
+
+def benchmark_suite(lista_contratos=(5, 20, 50), paginas_por_contrato=4, fracao_imagem=0.2, latencia_llm=0.05,
+                    latencia_por_mil_tokens=0.01, latencia_visao=0.05, latencia_embeddings=0.01,
+                    latencia_storage=0.005, latencia_firestore=0.002, palavras_resposta=120):
+    """
+    Percurso completo da aplicação sobre um corpus sintético de cada tamanho, sem rede:
+    ingestão dos PDFs (com uma fração só em imagem, que passa pelo OCR), pesquisa do chat,
+    cada análise do llm_utils, gravação e abertura da coleção (fria, do disco e da memória).
+    Modelos, Storage e Firestore são os falsos do fakes.py; os caches persistentes começam
+    vazios. As páginas só em imagem respeitam o limite de pedidos do OCR (CONTRATIA_OCR_RPM),
+    como em produção. O resultado (JSON) inclui os parâmetros e o ambiente, para 'comparar'.
+    """
+    from fakes import FakeEmbeddings, FakeFirestore
+
+    parametros = {
+        "contratos": list(lista_contratos), "paginas_por_contrato": paginas_por_contrato,
+        "fracao_imagem": fracao_imagem, "latencia_llm": latencia_llm,
+        "latencia_por_mil_tokens": latencia_por_mil_tokens, "latencia_visao": latencia_visao,
+        "latencia_embeddings": latencia_embeddings, "latencia_storage": latencia_storage,
+        "latencia_firestore": latencia_firestore, "palavras_resposta": palavras_resposta,
+    }
+    resultados = []
+    with tempfile.TemporaryDirectory(prefix="contratia-suite-") as pasta:
+        with _servicos_falsos(pasta, latencia_llm, latencia_por_mil_tokens, latencia_visao, latencia_storage,
+                              palavras_resposta) as falsos:
+            embeddings = FakeEmbeddings(dimensao=768, latencia=latencia_embeddings)
+            db = FakeFirestore(latencia_firestore)
+            for num_contratos in lista_contratos:
+                resultados.append(_medir_tamanho(num_contratos, paginas_por_contrato, fracao_imagem,
+                                                 embeddings, falsos, db, pasta))
+    return {"versao": VERSAO_SUITE, "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "ambiente": _ambiente(), "parametros": parametros, "resultados": resultados}
+
+
+def _metricas_suite(resultado):
+    """{"contratos=N/etapa/métrica": valor} com as métricas numéricas de um resultado da suite."""
+    metricas = {}
+
+    def _percorrer(prefixo, valor):
+        if isinstance(valor, dict):
+            for chave, filho in valor.items():
+                _percorrer(f"{prefixo}/{chave}", filho)
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            metricas[prefixo] = valor
+
+    for linha in resultado["resultados"]:
+        for etapa, valor in linha.items():
+            if isinstance(valor, dict):
+                _percorrer(f"contratos={linha['contratos']}/{etapa}", valor)
+    return metricas
+
+
+def comparar_resultados(antes, depois):
+    """
+    Compara dois resultados da suite métrica a métrica. 'razao' é depois/antes: abaixo
+    de 1 nos tempos é uma melhoria. Avisa se os parâmetros das duas execuções diferem.
+    """
+    if antes.get("versao") != depois.get("versao"):
+        raise ValueError("Os resultados vêm de versões diferentes da suite.")
+    metricas_antes, metricas_depois = _metricas_suite(antes), _metricas_suite(depois)
+    comparacao = []
+    for chave in metricas_antes:
+        if chave not in metricas_depois:
+            continue
+        a, d = metricas_antes[chave], metricas_depois[chave]
+        comparacao.append({"metrica": chave, "antes": a, "depois": d, "razao": round(d / a, 3) if a else None})
+    return {
+        "commits": [antes["ambiente"].get("commit"), depois["ambiente"].get("commit")],
+        "parametros_iguais": antes["parametros"] == depois["parametros"],
+        "metricas": comparacao,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Analisador-IA ProMax")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_extracao = sub.add_parser("extracao", help="Extração de texto PyMuPDF: série vs. pool de processos")
+    p_extracao.add_argument("pdfs", nargs="+")
+    p_extracao.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    p_extracao.add_argument("--repeticoes", type=int, default=3)
+
+    p_ocr = sub.add_parser("ocr", help="OCR com Gemini Vision (modelo falso): série vs. concorrente")
+    p_ocr.add_argument("pdf")
+    p_ocr.add_argument("--latencia", type=float, default=0.5)
+    p_ocr.add_argument("--rpm", type=int, default=120)
+    p_ocr.add_argument("--concorrencia", nargs="+", type=int, default=[1, 4])
+    p_ocr.add_argument("--falhas-429", type=int, default=0)
+
+    p_mapreduce = sub.add_parser("mapreduce", help="Resumo/riscos: chamada única vs. map-reduce (LLM falso)")
+    p_mapreduce.add_argument("--clausulas", nargs="+", type=int, default=[20, 200, 600])
+    p_mapreduce.add_argument("--latencia-base", type=float, default=0.2)
+    p_mapreduce.add_argument("--latencia-por-mil-tokens", type=float, default=0.05)
+    p_mapreduce.add_argument("--concorrencia", type=int, default=4)
+
+    p_campos = sub.add_parser("campos", help="Extração do Dashboard: texto completo vs. trechos dirigidos (falsos)")
+    p_campos.add_argument("--paginas", nargs="+", type=int, default=[5, 50, 300])
+    p_campos.add_argument("--latencia-base", type=float, default=0.2)
+    p_campos.add_argument("--latencia-por-mil-tokens", type=float, default=0.05)
+
+    p_chat = sub.add_parser("chat", help="Chat: resposta inteira (invoke) vs. streaming, tempo até ao primeiro texto (falsos)")
+    p_chat.add_argument("--perguntas", type=int, default=5)
+    p_chat.add_argument("--palavras-resposta", type=int, default=150)
+    p_chat.add_argument("--latencia-base", type=float, default=0.3)
+    p_chat.add_argument("--latencia-por-palavra", type=float, default=0.01)
+
+    p_indices = sub.add_parser("indices", help="Pesquisa vetorial: flat vs. HNSW/IVF, recall e latência")
+    p_indices.add_argument("--vetores", nargs="+", type=int, default=[20000, 100000])
+    p_indices.add_argument("--dimensao", type=int, default=768)
+    p_indices.add_argument("--consultas", type=int, default=200)
+    p_indices.add_argument("--k", type=int, default=5)
+    p_indices.add_argument("--ef-search", nargs="+", type=int, default=[16, 32, 64, 128])
+    p_indices.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 8, 32])
+
+    p_fusao = sub.add_parser("fusao", help="Fusão de deltas em coleções: tipos de índice e índices mapeados do disco")
+    p_fusao.add_argument("--vetores", type=int, default=5000)
+    p_fusao.add_argument("--delta", type=int, default=500)
+    p_fusao.add_argument("--dimensao", type=int, default=64)
+
+    p_dedup = sub.add_parser("dedup", help="Deduplicação de fragmentos: embeddings e tamanho do índice com e sem ela")
+    p_dedup.add_argument("--contratos", nargs="+", type=int, default=[10, 50, 200])
+    p_dedup.add_argument("--dimensao", type=int, default=768)
+
+    p_arranque = sub.add_parser("arranque", help="Arranque a frio: importação e tempo até à página de login")
+    p_arranque.add_argument("--repeticoes", type=int, default=3)
+
+    p_suite = sub.add_parser("suite", help="Percurso completo sobre um corpus sintético, com todos os serviços falsos")
+    p_suite.add_argument("--contratos", nargs="+", type=int, default=[5, 20, 50])
+    p_suite.add_argument("--paginas", type=int, default=4)
+    p_suite.add_argument("--fracao-imagem", type=float, default=0.2)
+    p_suite.add_argument("--latencia-llm", type=float, default=0.05)
+    p_suite.add_argument("--latencia-por-mil-tokens", type=float, default=0.01)
+    p_suite.add_argument("--latencia-visao", type=float, default=0.05)
+    p_suite.add_argument("--latencia-embeddings", type=float, default=0.01)
+    p_suite.add_argument("--latencia-storage", type=float, default=0.005)
+    p_suite.add_argument("--latencia-firestore", type=float, default=0.002)
+    p_suite.add_argument("--palavras-resposta", type=int, default=120)
+    p_suite.add_argument("--saida", help="Ficheiro JSON onde guardar o resultado")
+
+    p_comparar = sub.add_parser("comparar", help="Compara dois resultados da suite (ficheiros JSON)")
+    p_comparar.add_argument("antes")
+    p_comparar.add_argument("depois")
+
+    args = parser.parse_args()
+    if args.comando == "extracao":
+        resultados = benchmark_extracao(args.pdfs, args.workers, args.repeticoes)
+    elif args.comando == "ocr":
+        resultados = benchmark_ocr(args.pdf, args.latencia, args.rpm, args.concorrencia, args.falhas_429)
+    elif args.comando == "mapreduce":
+        resultados = benchmark_mapreduce(args.clausulas, args.latencia_base, args.latencia_por_mil_tokens,
+                                         args.concorrencia)
+    elif args.comando == "campos":
+        resultados = benchmark_extracao_campos(args.paginas, args.latencia_base, args.latencia_por_mil_tokens)
+    elif args.comando == "chat":
+        resultados = benchmark_chat(args.perguntas, args.palavras_resposta, args.latencia_base,
+                                    latencia_por_palavra=args.latencia_por_palavra)
+    elif args.comando == "indices":
+        resultados = benchmark_indices(args.vetores, args.dimensao, args.consultas, args.k, args.ef_search, args.nprobe)
+    elif args.comando == "fusao":
+        resultados = benchmark_fusao(args.vetores, args.delta, args.dimensao)
+    elif args.comando == "dedup":
+        resultados = benchmark_dedup(args.contratos, args.dimensao)
+    elif args.comando == "arranque":
+        resultados = benchmark_arranque(args.repeticoes)
+    elif args.comando == "suite":
+        resultados = benchmark_suite(args.contratos, args.paginas, args.fracao_imagem, args.latencia_llm,
+                                     args.latencia_por_mil_tokens, args.latencia_visao, args.latencia_embeddings,
+                                     args.latencia_storage, args.latencia_firestore, args.palavras_resposta)
+        if args.saida:
+            Path(args.saida).write_text(json.dumps(resultados, indent=2, ensure_ascii=False), encoding="utf-8")
+    elif args.comando == "comparar":
+        resultados = comparar_resultados(json.loads(Path(args.antes).read_text(encoding="utf-8")),
+                                         json.loads(Path(args.depois).read_text(encoding="utf-8")))
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# cache_store.py
+"""
+Cache chave → bytes persistido em SQLite, partilhado entre sessões e processos
+da mesma máquina, com limite de tamanho (remoção LRU) e validade opcional (TTL).
+"""
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Total de bytes das entradas, mantido pelo SQLite em cada escrita (de qualquer processo):
+# verificar o limite não obriga a somar a tabela. O 'recursive_triggers' fica desligado, pelo
+# que o INSERT OR REPLACE não dispara o gatilho de DELETE; a linha substituída é descontada antes.
+_GATILHOS_TOTAL = (
+    "CREATE TRIGGER IF NOT EXISTS total_substituir BEFORE INSERT ON entradas BEGIN"
+    " UPDATE totais SET bytes = bytes - COALESCE((SELECT tamanho FROM entradas WHERE chave = NEW.chave), 0)"
+    " WHERE id = 0; END",
+    "CREATE TRIGGER IF NOT EXISTS total_inserir AFTER INSERT ON entradas BEGIN"
+    " UPDATE totais SET bytes = bytes + NEW.tamanho WHERE id = 0; END",
+    "CREATE TRIGGER IF NOT EXISTS total_apagar AFTER DELETE ON entradas BEGIN"
+    " UPDATE totais SET bytes = bytes - OLD.tamanho WHERE id = 0; END",
+)
+
+
+class CacheSQLite:
+    """
+    Armazenamento chave/valor em disco com remoção dos itens menos usados
+    recentemente quando o total ultrapassa 'max_bytes'.
+    """
+
+    def __init__(self, caminho, max_bytes, ttl_segundos=None):
+        self.caminho = Path(caminho)
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self.hits = 0
+        self.misses = 0
+        self.evicoes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.caminho), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entradas ("
+            " chave TEXT PRIMARY KEY, valor BLOB NOT NULL, tamanho INTEGER NOT NULL,"
+            " criado_em REAL NOT NULL, ultimo_acesso REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_acesso ON entradas (ultimo_acesso)")
+        self._conn.commit()
+        # Numa só transação: o total inicial (caches criados antes dos gatilhos) e os gatilhos
+        # ficam consistentes mesmo com outro processo a escrever ao mesmo tempo
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS totais (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO totais (id, bytes) SELECT 0, COALESCE(SUM(tamanho), 0) FROM entradas")
+        for gatilho in _GATILHOS_TOTAL:
+            self._conn.execute(gatilho)
+        self._conn.commit()
+
+    def obter(self, chave):
+        """Devolve o valor guardado ou None (entrada inexistente ou expirada)."""
+        agora = time.time()
+        with self._lock:
+            linha = self._conn.execute("SELECT valor, criado_em FROM entradas WHERE chave = ?", (chave,)).fetchone()
+            if linha is not None and self.ttl_segundos is not None and agora - linha[1] > self.ttl_segundos:
+                self._conn.execute("DELETE FROM entradas WHERE chave = ?", (chave,))
+                self._conn.commit()
+                linha = None
+            if linha is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entradas SET ultimo_acesso = ? WHERE chave = ?", (agora, chave))
+            self._conn.commit()
+            self.hits += 1
+            return bytes(linha[0])
+
+    def obter_varios(self, chaves):
+        """Versão em lote de 'obter': devolve um dicionário só com as chaves encontradas."""
+        agora = time.time()
+        encontrados = {}
+        with self._lock:
+            for i in range(0, len(chaves), 500):
+                lote = chaves[i:i + 500]
+                marcadores = ",".join("?" * len(lote))
+                for chave, valor, criado_em in self._conn.execute(
+                    f"SELECT chave, valor, criado_em FROM entradas WHERE chave IN ({marcadores})", lote
+                ):
+                    if self.ttl_segundos is None or agora - criado_em <= self.ttl_segundos:
+                        encontrados[chave] = bytes(valor)
+            self._conn.executemany(
+                "UPDATE entradas SET ultimo_acesso = ? WHERE chave = ?", [(agora, chave) for chave in encontrados]
+            )
+            self._conn.commit()
+            self.hits += len(encontrados)
+            self.misses += len(set(chaves)) - len(encontrados)
+        return encontrados
+
+    def guardar(self, chave, valor):
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entradas (chave, valor, tamanho, criado_em, ultimo_acesso) VALUES (?, ?, ?, ?, ?)",
+                (chave, sqlite3.Binary(valor), len(valor), agora, agora),
+            )
+            self._remover_excedente()
+            self._conn.commit()
+
+    def guardar_varios(self, itens):
+        agora = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entradas (chave, valor, tamanho, criado_em, ultimo_acesso) VALUES (?, ?, ?, ?, ?)",
+                [(chave, sqlite3.Binary(valor), len(valor), agora, agora) for chave, valor in itens.items()],
+            )
+            self._remover_excedente()
+            self._conn.commit()
+
+    def remover(self, chave):
+        with self._lock:
+            self._conn.execute("DELETE FROM entradas WHERE chave = ?", (chave,))
+            self._conn.commit()
+
+    def _remover_excedente(self):
+        """Remove as entradas menos usadas até o total caber em 'max_bytes'. Chamar com o lock."""
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        for chave, tamanho in self._conn.execute(
+            "SELECT chave, tamanho FROM entradas ORDER BY ultimo_acesso ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entradas WHERE chave = ?", (chave,))
+            total -= tamanho
+            self.evicoes += 1
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT bytes FROM totais WHERE id = 0").fetchone()[0]
+
+    def estatisticas(self):
+        with self._lock:
+            entradas = self._conn.execute("SELECT COUNT(*) FROM entradas").fetchone()[0]
+            total = self._total_bytes()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicoes": self.evicoes,
+            "entradas": entradas,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,201 @@
+# chat_cache.py
+"""
+Cache semântico das respostas do chat, por coleção.
+
+Cada resposta fica guardada com o vetor da pergunta e a impressão digital da
+coleção (document_index.impressao_colecao). Uma nova pergunta cuja semelhança
+de cosseno com uma já respondida na mesma coleção atinja o limiar devolve a
+resposta e as fontes guardadas, sem pesquisa no FAISS nem chamada ao LLM.
+Quando a coleção muda, a impressão digital muda e as respostas antigas deixam
+de ser usadas; saem pelo TTL e pelo limite de respostas por coleção. A versão
+anterior da coleção não é alterada (as sessões que a usam continuam a ter as
+suas respostas válidas).
+
+Os uploads têm o id do utilizador na impressão digital (pdf_processing), pelo
+que um utilizador nunca recebe respostas dadas a outro sobre os mesmos PDFs.
+
+As entradas ficam em SQLite, partilhadas pelas sessões e processos da máquina;
+cada processo mantém em memória a matriz de vetores de cada coleção e só lê
+as linhas novas (ou tudo de novo, se outro processo apagou alguma).
+"""
+import bisect
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config import CACHE_DIR, CHAT_CACHE_LIMIAR, CHAT_CACHE_MAX_POR_COLECAO, CHAT_CACHE_TTL_SEGUNDOS
+
+
+def normalizar_pergunta(pergunta):
+    return " ".join(pergunta.lower().split())
+
+
+def _normalizar(vetor):
+    vetor = np.asarray(vetor, dtype=np.float32)
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
+
+
+class _RespostasDaColecao:
+    """Cópia em memória das respostas de uma coleção: vetores normalizados e dados."""
+
+    def __init__(self):
+        self.ultimo_id = 0
+        self.ids = []
+        self.vetores = None
+        self.perguntas = {}  # pergunta normalizada -> posição
+        self.entradas = []   # (pergunta, resposta, fontes, criado_em)
+
+
+class CacheRespostasChat:
+    """Respostas do chat por coleção, encontradas pela semelhança da pergunta."""
+
+    def __init__(self, caminho=None, limiar=CHAT_CACHE_LIMIAR, max_por_colecao=CHAT_CACHE_MAX_POR_COLECAO,
+                 ttl_segundos=CHAT_CACHE_TTL_SEGUNDOS):
+        self.caminho = Path(caminho or Path(CACHE_DIR) / "chat.sqlite")
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        self.limiar = limiar
+        self.max_por_colecao = max_por_colecao
+        self.ttl_segundos = ttl_segundos
+        self.hits_exatos = 0
+        self.hits_semanticos = 0
+        self.misses = 0
+        self._memoria = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.caminho), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, colecao TEXT NOT NULL, pergunta TEXT NOT NULL,"
+            " vetor BLOB NOT NULL, resposta TEXT NOT NULL, fontes TEXT NOT NULL, criado_em REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_colecao ON respostas (colecao, id)")
+        self._conn.commit()
+
+    def _atualizar(self, colecao):
+        """Acrescenta à cópia em memória as linhas gravadas (por este ou outro processo) desde a última leitura."""
+        copia = self._memoria.setdefault(colecao, _RespostasDaColecao())
+        linhas = self._conn.execute(
+            "SELECT id, pergunta, vetor, resposta, fontes, criado_em FROM respostas WHERE colecao = ? AND id > ? ORDER BY id",
+            (colecao, copia.ultimo_id),
+        ).fetchall()
+        if linhas:
+            novos = []
+            for id_, pergunta, vetor, resposta, fontes, criado_em in linhas:
+                copia.perguntas[pergunta] = len(copia.ids)
+                copia.ids.append(id_)
+                copia.entradas.append((pergunta, resposta, fontes, criado_em))
+                novos.append(np.frombuffer(vetor, dtype=np.float32))
+            novos = np.vstack(novos)
+            copia.vetores = novos if copia.vetores is None else np.vstack([copia.vetores, novos])
+            copia.ultimo_id = linhas[-1][0]
+        primeiro_id, total = self._conn.execute(
+            "SELECT MIN(id), COUNT(*) FROM respostas WHERE colecao = ?", (colecao,)).fetchone()
+        if total and copia.ids and primeiro_id > copia.ids[0]:
+            # O limite por coleção apaga as respostas mais antigas: corta-se o mesmo início em memória
+            self._cortar_inicio(copia, bisect.bisect_left(copia.ids, primeiro_id))
+        if total != len(copia.ids):
+            # Outras remoções (invalidação, talvez noutro processo): relê tudo
+            del self._memoria[colecao]
+            return self._atualizar(colecao)
+        return copia
+
+    @staticmethod
+    def _cortar_inicio(copia, quantas):
+        copia.ids = copia.ids[quantas:]
+        copia.entradas = copia.entradas[quantas:]
+        copia.vetores = copia.vetores[quantas:] if copia.ids else None
+        copia.perguntas = {pergunta: posicao - quantas for pergunta, posicao in copia.perguntas.items()
+                           if posicao >= quantas}
+
+    def _valida(self, entrada):
+        return self.ttl_segundos is None or time.time() - entrada[3] <= self.ttl_segundos
+
+    @staticmethod
+    def _resultado(entrada, semelhanca):
+        pergunta_original, resposta, fontes, _ = entrada
+        documentos = [Document(page_content=f["texto"], metadata=f["metadata"]) for f in json.loads(fontes)]
+        return {"resposta": resposta, "fontes": documentos, "semelhanca": semelhanca, "pergunta_original": pergunta_original}
+
+    def procurar_exata(self, colecao, pergunta):
+        """Procura a mesma pergunta (ignorando maiúsculas e espaços), sem precisar do vetor."""
+        chave = normalizar_pergunta(pergunta)
+        with self._lock:
+            copia = self._atualizar(colecao)
+            posicao = copia.perguntas.get(chave)
+            if posicao is None or not self._valida(copia.entradas[posicao]):
+                return None
+            self.hits_exatos += 1
+            return self._resultado(copia.entradas[posicao], 1.0)
+
+    def procurar(self, colecao, vetor_pergunta):
+        """Devolve a resposta guardada mais semelhante, se atingir o limiar; senão None."""
+        with self._lock:
+            copia = self._atualizar(colecao)
+            if copia.vetores is None:
+                self.misses += 1
+                return None
+            semelhancas = copia.vetores @ _normalizar(vetor_pergunta)
+            for posicao in np.argsort(-semelhancas):
+                if semelhancas[posicao] < self.limiar:
+                    break
+                if self._valida(copia.entradas[posicao]):
+                    self.hits_semanticos += 1
+                    return self._resultado(copia.entradas[posicao], float(semelhancas[posicao]))
+            self.misses += 1
+            return None
+
+    def guardar(self, colecao, pergunta, vetor_pergunta, resposta, fontes):
+        registos = [{"texto": doc.page_content, "metadata": doc.metadata} for doc in fontes or []]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO respostas (colecao, pergunta, vetor, resposta, fontes, criado_em) VALUES (?, ?, ?, ?, ?, ?)",
+                (colecao, normalizar_pergunta(pergunta), sqlite3.Binary(_normalizar(vetor_pergunta).tobytes()),
+                 resposta, json.dumps(registos, ensure_ascii=False, default=str), time.time()),
+            )
+            # Mantém só as respostas mais recentes de cada coleção (a cópia em memória é
+            # cortada na próxima leitura, sem a reler)
+            self._conn.execute(
+                "DELETE FROM respostas WHERE colecao = ? AND id NOT IN "
+                "(SELECT id FROM respostas WHERE colecao = ? ORDER BY id DESC LIMIT ?)",
+                (colecao, colecao, self.max_por_colecao),
+            )
+            self._conn.commit()
+
+    def invalidar(self, colecao):
+        """Apaga as respostas de uma coleção (o seu conteúdo mudou)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM respostas WHERE colecao = ?", (colecao,))
+            self._conn.commit()
+            self._memoria.pop(colecao, None)
+
+    def estatisticas(self):
+        with self._lock:
+            entradas, colecoes = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT colecao) FROM respostas").fetchone()
+        return {
+            "hits_exatos": self.hits_exatos,
+            "hits_semanticos": self.hits_semanticos,
+            "misses": self.misses,
+            "entradas": entradas,
+            "colecoes": colecoes,
+            "limiar": self.limiar,
+        }
+
+
+_cache_chat = None
+_cache_chat_lock = threading.Lock()
+
+
+def obter_cache_chat():
+    """Instância única por processo do cache de respostas do chat."""
+    global _cache_chat
+    with _cache_chat_lock:
+        if _cache_chat is None:
+            _cache_chat = CacheRespostasChat()
+        return _cache_chat
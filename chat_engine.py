@@ -0,0 +1,128 @@
+# chat_engine.py
+"""
+Motor do chat sobre uma coleção: pesquisa dos trechos e resposta do LLM em
+streaming. O cliente do LLM é criado uma vez por processo e o motor (prompt e
+retriever) uma vez por coleção; o Streamlit só desenha o que o motor produz.
+"""
+import threading
+import time
+import weakref
+
+from langchain.prompts import PromptTemplate
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from config import CHAT_K_TRECHOS, INDICE_HNSW_EF_PESQUISA, INDICE_IVF_NPROBE
+from document_index import impressao_colecao
+from llm_cache import descrever_llm, registar_tokens
+from telemetry import etapa, registar_etapa
+from vector_index import pesquisar_com_pontuacao
+
+PROMPT_CHAT = PromptTemplate(
+    template="""
+                Use os seguintes trechos de contexto para responder à pergunta no final.
+                A sua tarefa é sintetizar a informação e fornecer uma resposta precisa e direta.
+                Se não souber a resposta ou se a informação não estiver no contexto, diga apenas que não encontrou a informação, não tente inventar uma resposta.
+                Responda sempre em português do Brasil.
+
+                Contexto:
+                {context}
+
+                Pergunta:
+                {question}
+
+                Resposta Útil:""",
+    input_variables=["context", "question"],
+)
+
+_llm_chat = None
+_llm_chat_lock = threading.Lock()
+
+
+def obter_llm_chat():
+    """Cliente do modelo do chat, partilhado por todas as sessões do processo."""
+    global _llm_chat
+    with _llm_chat_lock:
+        if _llm_chat is None:
+            _llm_chat = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0.2)
+        return _llm_chat
+
+
+class MotorChat:
+    """Pesquisa e resposta em streaming para uma coleção. Pode ser usado por várias sessões."""
+
+    def __init__(self, vector_store, llm, k=CHAT_K_TRECHOS, prompt=PROMPT_CHAT,
+                 ef_search=INDICE_HNSW_EF_PESQUISA, nprobe=INDICE_IVF_NPROBE):
+        self.vector_store = vector_store
+        self.llm = llm
+        self.k = k
+        self.prompt = prompt
+        # Largura da pesquisa nos índices aproximados (HNSW: efSearch; IVF: nprobe)
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.impressao = impressao_colecao(vector_store)
+
+    def recuperar(self, pergunta, vetor_pergunta=None, metricas=None):
+        """Trechos mais relevantes; reutiliza o vetor da pergunta quando já foi calculado."""
+        inicio = time.perf_counter()
+        with etapa("chat_pesquisa", k=self.k, vetor_reutilizado=vetor_pergunta is not None):
+            if vetor_pergunta is None:
+                vetor_pergunta = self.vector_store.embeddings.embed_query(pergunta)
+            # O índice é partilhado com outras sessões: a largura da pesquisa vai em cada consulta
+            if hasattr(self.vector_store, 'index'):
+                pares = pesquisar_com_pontuacao(self.vector_store, vetor_pergunta, self.k, self.ef_search, self.nprobe)
+            else:
+                # Pesquisa federada: cada coleção é pesquisada com os mesmos parâmetros
+                pares = self.vector_store.similarity_search_with_score_by_vector(
+                    vetor_pergunta, k=self.k, ef_search=self.ef_search, nprobe=self.nprobe)
+            fontes = [doc for doc, _ in pares]
+        if metricas is not None:
+            metricas["segundos_pesquisa"] = round(time.perf_counter() - inicio, 3)
+        return fontes
+
+    def transmitir(self, pergunta, fontes, metricas=None):
+        """
+        Gera a resposta aos bocados, à medida que o LLM os envia. Se 'metricas' for um
+        dicionário, recebe o tempo até ao primeiro token e o tempo total da geração.
+        """
+        metricas = metricas if metricas is not None else {}
+        contexto = "\n\n".join(doc.page_content for doc in fontes)
+        texto_prompt = self.prompt.format(context=contexto, question=pergunta)
+        inicio = time.perf_counter()
+        primeiro = None
+        uso = {}
+        for bocado in self.llm.stream(texto_prompt):
+            # Os bocados trazem o uso de tokens de cada parte da resposta
+            for chave, valor in (getattr(bocado, 'usage_metadata', None) or {}).items():
+                if isinstance(valor, int):
+                    uso[chave] = uso.get(chave, 0) + valor
+            texto = bocado.content if hasattr(bocado, 'content') else str(bocado)
+            if not texto:
+                continue
+            if primeiro is None:
+                primeiro = time.perf_counter() - inicio
+                metricas["segundos_primeiro_token"] = round(primeiro, 3)
+            yield texto
+        metricas["segundos_geracao"] = round(time.perf_counter() - inicio, 3)
+        # Um gerador pode ser retomado noutro contexto: a etapa é registada já medida
+        modelo = descrever_llm(self.llm)[0]
+        registar_tokens(modelo, uso)
+        registar_etapa("chat_resposta", metricas["segundos_geracao"], modelo=modelo,
+                       segundos_primeiro_token=metricas.get("segundos_primeiro_token"),
+                       tokens_entrada=uso.get("input_tokens", 0), tokens_saida=uso.get("output_tokens", 0))
+
+
+_motores = weakref.WeakKeyDictionary()
+_motores_lock = threading.Lock()
+
+
+def obter_motor_chat(vector_store, llm=None):
+    """
+    Motor do chat da coleção, criado na primeira pergunta e reutilizado nas seguintes.
+    É recriado se o conteúdo da coleção mudou (documentos adicionados ou removidos).
+    """
+    with _motores_lock:
+        motor = _motores.get(vector_store)
+        if motor is None or motor.impressao != impressao_colecao(vector_store):
+            motor = MotorChat(vector_store, llm or obter_llm_chat())
+            _motores[vector_store] = motor
+        return motor
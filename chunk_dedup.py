@@ -0,0 +1,129 @@
+# chunk_dedup.py
+"""
+Deteção de fragmentos repetidos durante a ingestão.
+
+Os contratos de um banco repetem longas cláusulas padrão. Depois da divisão em
+fragmentos, cada fragmento é comparado com os já vistos na mesma ingestão:
+- cópias exatas (mesmo texto, ignorando maiúsculas e espaços) por hash;
+- quase-cópias por MinHash sobre shingles de palavras, com LSH por bandas
+  para encontrar candidatos sem comparar todos com todos. Um candidato só é
+  aceite se a semelhança de Jaccard estimada atingir o limiar E se tiver
+  exatamente os mesmos números e palavras com maiúscula (valores, taxas,
+  datas, nomes de bancos): duas cláusulas que só diferem na taxa de juros
+  nunca são fundidas.
+
+Cada grupo fica com um único fragmento (e vetor) no índice; as referências de
+todos os ficheiros e páginas onde aparece ficam no metadata 'fontes'.
+"""
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+from config import DEDUP_BANDAS, DEDUP_LIMIAR_JACCARD, DEDUP_PERMUTACOES
+
+# Primo maior do que 2^32, para as permutações (a·x + b) mod p dos hashes de 32 bits
+_PRIMO = np.uint64(4294967311)
+TAMANHO_SHINGLE = 5
+
+_PALAVRA = re.compile(r"\w+(?:[.,/-]\w+)*", re.UNICODE)
+
+
+def _palavras(texto):
+    return _PALAVRA.findall(texto)
+
+
+def _tokens_distintivos(palavras):
+    """Números e palavras com maiúscula: o que não pode mudar entre dois fragmentos fundidos."""
+    return frozenset(p for p in palavras if p[0].isupper() or any(c.isdigit() for c in p))
+
+
+def _hash_exato(palavras):
+    return hashlib.sha1(" ".join(palavras).lower().encode("utf-8")).digest()
+
+
+class DeduplicadorFragmentos:
+    """
+    Agrupa fragmentos iguais ou quase iguais. 'classificar' devolve, para cada texto,
+    o número do grupo e se é o primeiro do grupo (o que será embebido e indexado).
+    Não é seguro entre threads: é usado apenas pela etapa de embedding.
+    """
+
+    def __init__(self, limiar=DEDUP_LIMIAR_JACCARD, num_permutacoes=DEDUP_PERMUTACOES, bandas=DEDUP_BANDAS):
+        if num_permutacoes % bandas:
+            raise ValueError("O número de permutações tem de ser múltiplo do número de bandas.")
+        self.limiar = limiar
+        self.bandas = bandas
+        self._linhas_por_banda = num_permutacoes // bandas
+        rng = np.random.default_rng(20240901)
+        self._a = rng.integers(1, 2 ** 32, num_permutacoes, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, num_permutacoes, dtype=np.uint64)
+        self._por_hash = {}                              # hash exato -> grupo
+        self._baldes = [dict() for _ in range(bandas)]   # banda -> {assinatura da banda -> [grupos]}
+        self._assinaturas = []                           # grupo -> assinatura MinHash
+        self._distintivos = []                           # grupo -> tokens distintivos
+        self.vetores = {}                                # grupo -> vetor do representante
+        self.fragmentos = 0
+        self.exatos = 0
+        self.quase_iguais = 0
+
+    def _assinatura(self, palavras):
+        minusculas = [p.lower() for p in palavras]
+        if len(minusculas) <= TAMANHO_SHINGLE:
+            shingles = [" ".join(minusculas)]
+        else:
+            shingles = [" ".join(minusculas[i:i + TAMANHO_SHINGLE]) for i in range(len(minusculas) - TAMANHO_SHINGLE + 1)]
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in set(shingles)), dtype=np.uint64)
+        return ((np.outer(self._a, x) % _PRIMO + self._b[:, None]) % _PRIMO).min(axis=1)
+
+    def _bandas_de(self, assinatura):
+        r = self._linhas_por_banda
+        return [assinatura[i * r:(i + 1) * r].tobytes() for i in range(self.bandas)]
+
+    def classificar(self, texto):
+        """Devolve (grupo, novo). 'novo' é True se o texto não repete nenhum dos anteriores."""
+        self.fragmentos += 1
+        palavras = _palavras(texto)
+        chave = _hash_exato(palavras)
+        if chave in self._por_hash:
+            self.exatos += 1
+            return self._por_hash[chave], False
+
+        assinatura = self._assinatura(palavras)
+        distintivos = _tokens_distintivos(palavras)
+        bandas = self._bandas_de(assinatura)
+        candidatos = {grupo for banda, valor in zip(self._baldes, bandas) for grupo in banda.get(valor, ())}
+        for grupo in sorted(candidatos):
+            if (self._distintivos[grupo] == distintivos
+                    and np.mean(self._assinaturas[grupo] == assinatura) >= self.limiar):
+                self.quase_iguais += 1
+                self._por_hash[chave] = grupo
+                return grupo, False
+
+        grupo = len(self._assinaturas)
+        self._assinaturas.append(assinatura)
+        self._distintivos.append(distintivos)
+        self._por_hash[chave] = grupo
+        for banda, valor in zip(self._baldes, bandas):
+            banda.setdefault(valor, []).append(grupo)
+        return grupo, True
+
+    def estatisticas(self):
+        repetidos = self.exatos + self.quase_iguais
+        return {
+            "fragmentos": self.fragmentos,
+            "unicos": self.fragmentos - repetidos,
+            "exatos": self.exatos,
+            "quase_iguais": self.quase_iguais,
+            "reducao": round(repetidos / self.fragmentos, 3) if self.fragmentos else 0.0,
+        }
+
+
+def referencia(fragmento):
+    """Referência de um fragmento ao seu ficheiro e página, para o metadata 'fontes'."""
+    return {
+        "source": fragmento.metadata.get('source'),
+        "page": fragmento.metadata.get('page'),
+        "start_index": fragmento.metadata.get('start_index'),
+    }
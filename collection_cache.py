@@ -0,0 +1,120 @@
+# collection_cache.py
+"""
+Cache local, partilhado pelo processo, das coleções descarregadas do Storage.
+
+Dois níveis, ambos LRU com limite em bytes:
+- disco: a pasta extraída de cada blob, identificada por storage_path + geração;
+- memória: o vector store já aberto, identificado pela geração do blob base e
+  pela lista de deltas aplicados. Fica no registo de vector stores do processo
+  (vector_store_registry), cujo orçamento também conta os uploads das sessões e
+  que não descarta os vector stores que alguma sessão tem em uso.
+Voltar a abrir uma coleção que não mudou custa apenas a leitura dos metadados.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from config import CACHE_DIR, COLECOES_CACHE_DISCO_MAX_BYTES
+from vector_store_registry import obter_registo_vector_stores, tamanho_pasta
+
+
+class CacheColecoes:
+    """Cache de coleções em dois níveis (pastas em disco e vector stores em memória), com métricas."""
+
+    def __init__(self, pasta_base=None, max_bytes_disco=COLECOES_CACHE_DISCO_MAX_BYTES, registo=None):
+        self.pasta_base = Path(pasta_base or Path(CACHE_DIR) / "colecoes_cache")
+        self.pasta_base.mkdir(parents=True, exist_ok=True)
+        self.max_bytes_disco = max_bytes_disco
+        self.registo = registo if registo is not None else obter_registo_vector_stores()
+        self._lock = threading.Lock()
+        self._locks_chave = {}
+        self.metricas = {
+            "hits_memoria": 0, "hits_disco": 0, "misses": 0, "evicoes_disco": 0, "bytes_descarregados": 0,
+        }
+
+    # --- nível de disco ---
+
+    def _pasta_da_chave(self, storage_path, geracao):
+        nome = hashlib.sha256(f"{storage_path}#{geracao}".encode("utf-8")).hexdigest()[:32]
+        return self.pasta_base / nome
+
+    def _lock_da_chave(self, chave):
+        with self._lock:
+            return self._locks_chave.setdefault(chave, threading.Lock())
+
+    def pasta_para(self, storage_path, geracao, descarregar):
+        """
+        Devolve a pasta local com o conteúdo do blob. Se não estiver em cache,
+        chama descarregar(destino) e só publica a pasta quando estiver completa.
+        """
+        pasta = self._pasta_da_chave(storage_path, geracao)
+        with self._lock_da_chave(pasta.name):
+            if pasta.exists():
+                os.utime(pasta)  # marca o acesso para o LRU
+                self.metricas["hits_disco"] += 1
+                return pasta
+            self.metricas["misses"] += 1
+            temp = Path(tempfile.mkdtemp(dir=self.pasta_base, prefix=".parcial-"))
+            try:
+                descarregar(temp)
+                self.metricas["bytes_descarregados"] += tamanho_pasta(temp)
+                os.replace(temp, pasta)
+            except Exception:
+                shutil.rmtree(temp, ignore_errors=True)
+                raise
+        self._limitar_disco(manter=pasta)
+        return pasta
+
+    def _limitar_disco(self, manter=None):
+        pastas = [p for p in self.pasta_base.iterdir() if p.is_dir() and not p.name.startswith(".")]
+        tamanhos = {p: tamanho_pasta(p) for p in pastas}
+        total = sum(tamanhos.values())
+        for pasta in sorted(pastas, key=lambda p: p.stat().st_mtime):
+            if total <= self.max_bytes_disco:
+                break
+            if pasta == manter:
+                continue
+            # Em POSIX, vector stores que ainda tenham estes ficheiros mapeados continuam válidos
+            shutil.rmtree(pasta, ignore_errors=True)
+            total -= tamanhos[pasta]
+            self.metricas["evicoes_disco"] += 1
+
+    # --- nível de memória ---
+
+    def obter_em_memoria(self, chave):
+        encontrado = self.registo.obter(("colecao", chave))
+        if encontrado is not None:
+            with self._lock:
+                self.metricas["hits_memoria"] += 1
+        return encontrado
+
+    def guardar_em_memoria(self, chave, vector_store, nomes_arquivos, tamanho):
+        self.registo.guardar(("colecao", chave), vector_store, nomes_arquivos, tamanho)
+
+    def estatisticas(self):
+        memoria = self.registo.estatisticas()
+        pastas = [p for p in self.pasta_base.iterdir() if p.is_dir() and not p.name.startswith(".")]
+        return {
+            **self.metricas,
+            "evicoes_memoria": memoria["evicoes"],
+            "entradas_memoria": memoria["entradas"],
+            "bytes_memoria": memoria["bytes"],
+            "entradas_disco": len(pastas),
+            "bytes_disco": sum(tamanho_pasta(p) for p in pastas),
+        }
+
+
+_cache_colecoes = None
+_cache_colecoes_lock = threading.Lock()
+
+
+def obter_cache_colecoes():
+    """Instância única por processo do cache de coleções."""
+    global _cache_colecoes
+    with _cache_colecoes_lock:
+        if _cache_colecoes is None:
+            _cache_colecoes = CacheColecoes()
+        return _cache_colecoes
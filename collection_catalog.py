@@ -0,0 +1,119 @@
+# collection_catalog.py
+"""
+Catálogo das coleções guardadas de cada utilizador.
+
+Listar as coleções lia todos os documentos de 'users/{uid}/ia_collections', com
+todos os campos (listas de ficheiros e de deltas), em cada rerun do Streamlit.
+O catálogo lê só as estatísticas desnormalizadas que a gravação deixa em cada
+documento ('estatisticas': documentos, fragmentos, bytes) e a data de criação,
+em páginas ordenadas pelo id, e guarda o resultado por utilizador durante
+CATALOGO_TTL_SEGUNDOS. As gravações feitas neste processo invalidam a entrada
+do utilizador; o TTL limita o atraso face a gravações feitas noutras instâncias.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from config import CATALOGO_TAMANHO_PAGINA, CATALOGO_TTL_SEGUNDOS
+
+CAMPOS_CATALOGO = ["estatisticas", "created_at"]
+
+
+@dataclass
+class EntradaCatalogo:
+    """Uma coleção do catálogo. As estatísticas ficam a None em coleções gravadas antes de existirem."""
+    nome: str
+    num_documentos: Optional[int] = None
+    num_fragmentos: Optional[int] = None
+    bytes: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    def rotulo(self):
+        """Nome com os números principais, para as listas da interface."""
+        if self.num_documentos is None:
+            return self.nome
+        partes = [f"{self.num_documentos} doc."]
+        if self.bytes:
+            partes.append(f"{self.bytes / 1e6:.1f} MB" if self.bytes >= 1e5 else f"{self.bytes / 1e3:.0f} KB")
+        return f"{self.nome} ({', '.join(partes)})"
+
+
+def estatisticas_colecao(num_documentos, num_fragmentos, bytes_guardados):
+    """Campo 'estatisticas' gravado no documento da coleção."""
+    return {"num_documentos": int(num_documentos), "num_fragmentos": int(num_fragmentos), "bytes": int(bytes_guardados)}
+
+
+def _entrada_de(snapshot):
+    dados = snapshot.to_dict() or {}
+    estatisticas = dados.get("estatisticas") or {}
+    return EntradaCatalogo(
+        nome=snapshot.id,
+        num_documentos=estatisticas.get("num_documentos"),
+        num_fragmentos=estatisticas.get("num_fragmentos"),
+        bytes=estatisticas.get("bytes"),
+        created_at=dados.get("created_at"),
+    )
+
+
+class CatalogoColecoes:
+    """Cache por utilizador da lista de coleções e das suas estatísticas. Seguro entre threads."""
+
+    def __init__(self, ttl_segundos=CATALOGO_TTL_SEGUNDOS, tamanho_pagina=CATALOGO_TAMANHO_PAGINA, relogio=time.monotonic):
+        self.ttl_segundos = ttl_segundos
+        self.tamanho_pagina = tamanho_pagina
+        self._relogio = relogio
+        self._entradas = {}  # user_id -> (instante da leitura, [EntradaCatalogo])
+        self._invalidado_em = {}  # user_id -> instante da última invalidação
+        self._lock = threading.Lock()
+        self.metricas = {"hits": 0, "misses": 0, "paginas_lidas": 0}
+
+    def _ler(self, db_client, user_id):
+        """Lê o catálogo do Firestore em páginas de 'tamanho_pagina' documentos, só com CAMPOS_CATALOGO."""
+        consulta = (db_client.collection('users').document(user_id).collection('ia_collections')
+                    .select(CAMPOS_CATALOGO).order_by('__name__').limit(self.tamanho_pagina))
+        entradas, ultimo = [], None
+        while True:
+            pagina = list((consulta.start_after(ultimo) if ultimo is not None else consulta).stream())
+            with self._lock:
+                self.metricas["paginas_lidas"] += 1
+            entradas.extend(_entrada_de(doc) for doc in pagina)
+            if len(pagina) < self.tamanho_pagina:
+                return entradas
+            ultimo = pagina[-1]
+
+    def listar(self, db_client, user_id):
+        """Coleções do utilizador, ordenadas pelo nome."""
+        with self._lock:
+            guardado = self._entradas.get(user_id)
+            if guardado is not None and self._relogio() - guardado[0] <= self.ttl_segundos:
+                self.metricas["hits"] += 1
+                return list(guardado[1])
+            self.metricas["misses"] += 1
+        instante = self._relogio()
+        entradas = self._ler(db_client, user_id)
+        with self._lock:
+            # Uma gravação durante a leitura pode não estar refletida nela: não é guardada
+            if instante > self._invalidado_em.get(user_id, float("-inf")):
+                self._entradas[user_id] = (instante, entradas)
+        return list(entradas)
+
+    def invalidar(self, user_id):
+        """Chamado depois de cada gravação de uma coleção do utilizador."""
+        with self._lock:
+            self._entradas.pop(user_id, None)
+            self._invalidado_em[user_id] = self._relogio()
+
+
+_catalogo = None
+_catalogo_lock = threading.Lock()
+
+
+def obter_catalogo_colecoes():
+    """Instância única por processo do catálogo de coleções."""
+    global _catalogo
+    with _catalogo_lock:
+        if _catalogo is None:
+            _catalogo = CatalogoColecoes()
+        return _catalogo
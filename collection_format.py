@@ -0,0 +1,270 @@
+# collection_format.py
+"""
+Formato em disco das coleções, versionado e sem pickle.
+
+Uma coleção é uma pasta com:
+- manifest.json: versão do formato, dimensão, número de vetores e ficheiros;
+- indice.faiss: índice FAISS no formato nativo, plano, HNSW ou IVF (ver
+  vector_index); para um índice plano, um cabeçalho fixo seguido da matriz
+  float32 dos vetores, aberto com mmap;
+- documentos.jsonl + offsets.npy: um documento por linha e o byte inicial de
+  cada linha, para ler só os documentos devolvidos por uma pesquisa;
+- ids.npy, ids_ordenados.npy, linhas_ordenadas.npy: posição -> id e a
+  pesquisa binária id -> linha, também abertos com mmap;
+- indice_documentos.json: o índice fonte -> fragmentos e o texto das páginas.
+
+Abrir uma coleção lê apenas o manifest e mapeia os ficheiros, pelo que o custo
+não depende do tamanho; os dados entram em memória à medida que são usados.
+"""
+import json
+import mmap
+from collections.abc import MutableMapping
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+from document_index import IndiceDocumentos, anexar_indice, obter_indice
+from vector_index import descrever_indice
+
+NOME_FORMATO = "contratia-colecao"
+VERSAO_FORMATO = 1
+NOME_MANIFEST = "manifest.json"
+
+
+def e_formato_colecao(pasta):
+    return (Path(pasta) / NOME_MANIFEST).exists()
+
+
+def guardar_colecao(vector_store, pasta):
+    """Grava um vector store FAISS (em memória ou já aberto deste formato) numa pasta."""
+    pasta = Path(pasta)
+    pasta.mkdir(parents=True, exist_ok=True)
+    index = vector_store.index
+    total = index.ntotal
+    ids = [vector_store.index_to_docstore_id[i] for i in range(total)]
+
+    faiss.write_index(index, str(pasta / "indice.faiss"))
+
+    offsets = np.zeros(total + 1, dtype=np.uint64)
+    with open(pasta / "documentos.jsonl", "wb") as f:
+        for linha, doc_id in enumerate(ids):
+            doc = vector_store.docstore.search(doc_id)
+            registo = {"id": doc_id, "texto": doc.page_content, "metadata": doc.metadata}
+            f.write(json.dumps(registo, ensure_ascii=False).encode("utf-8") + b"\n")
+            offsets[linha + 1] = f.tell()
+    np.save(pasta / "offsets.npy", offsets)
+
+    largura = max((len(doc_id.encode("utf-8")) for doc_id in ids), default=1)
+    ids_arr = np.array([doc_id.encode("utf-8") for doc_id in ids], dtype=f"S{largura}")
+    ordem = np.argsort(ids_arr, kind="stable")
+    np.save(pasta / "ids.npy", ids_arr)
+    np.save(pasta / "ids_ordenados.npy", ids_arr[ordem])
+    np.save(pasta / "linhas_ordenadas.npy", ordem.astype(np.int64))
+
+    obter_indice(vector_store).guardar(pasta)
+
+    manifest = {
+        "formato": NOME_FORMATO,
+        "versao": VERSAO_FORMATO,
+        "dimensao": index.d,
+        "num_vetores": total,
+        "tipo_indice": type(index).__name__,
+        "indice": descrever_indice(index),
+        "distance_strategy": str(getattr(vector_store.distance_strategy, "value", vector_store.distance_strategy)),
+        "normalize_L2": bool(getattr(vector_store, "_normalize_L2", False)),
+        "ficheiros": {
+            "indice": "indice.faiss",
+            "documentos": "documentos.jsonl",
+            "offsets": "offsets.npy",
+            "ids": "ids.npy",
+            "ids_ordenados": "ids_ordenados.npy",
+            "linhas_ordenadas": "linhas_ordenadas.npy",
+        },
+    }
+    if isinstance(index, faiss.IndexFlat):
+        # Posição da matriz float32 dentro de indice.faiss, para leitura direta com numpy.memmap
+        tamanho = (pasta / "indice.faiss").stat().st_size
+        manifest["vetores"] = {"ficheiro": "indice.faiss", "dtype": "float32",
+                               "offset": tamanho - total * index.d * 4, "forma": [total, index.d]}
+    (pasta / NOME_MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+
+class _DocumentosEmDisco:
+    """Leitura preguiçosa dos documentos gravados por guardar_colecao."""
+
+    def __init__(self, pasta):
+        pasta = Path(pasta)
+        self._ficheiro = open(pasta / "documentos.jsonl", "rb")
+        tamanho = (pasta / "documentos.jsonl").stat().st_size
+        self._dados = mmap.mmap(self._ficheiro.fileno(), 0, access=mmap.ACCESS_READ) if tamanho else b""
+        self.offsets = np.load(pasta / "offsets.npy", mmap_mode="r", allow_pickle=False)
+        self.ids = np.load(pasta / "ids.npy", mmap_mode="r", allow_pickle=False)
+        self._ids_ordenados = np.load(pasta / "ids_ordenados.npy", mmap_mode="r", allow_pickle=False)
+        self._linhas_ordenadas = np.load(pasta / "linhas_ordenadas.npy", mmap_mode="r", allow_pickle=False)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def id_na_posicao(self, posicao):
+        return self.ids[posicao].decode("utf-8")
+
+    def linha_do_id(self, doc_id):
+        chave = doc_id.encode("utf-8")
+        if len(chave) > self._ids_ordenados.dtype.itemsize:
+            return None
+        pos = int(np.searchsorted(self._ids_ordenados, chave))
+        if pos < len(self._ids_ordenados) and self._ids_ordenados[pos] == chave:
+            return int(self._linhas_ordenadas[pos])
+        return None
+
+    def ler(self, linha):
+        inicio, fim = int(self.offsets[linha]), int(self.offsets[linha + 1])
+        registo = json.loads(self._dados[inicio:fim].decode("utf-8"))
+        return Document(id=registo["id"], page_content=registo["texto"], metadata=registo["metadata"])
+
+
+class DocstorePreguicoso(Docstore, AddableMixin):
+    """
+    Docstore que lê os documentos do disco a pedido. Documentos adicionados ou
+    removidos depois da abertura ficam numa camada em memória por cima do ficheiro.
+    """
+
+    def __init__(self, documentos):
+        self._documentos = documentos
+        self._adicionados = {}
+        self._removidos = set()
+
+    def search(self, search):
+        if search in self._adicionados:
+            return self._adicionados[search]
+        if search not in self._removidos:
+            linha = self._documentos.linha_do_id(search)
+            if linha is not None:
+                return self._documentos.ler(linha)
+        return f"ID {search} not found."
+
+    def add(self, texts):
+        self._adicionados.update(texts)
+        self._removidos.difference_update(texts)
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self._adicionados.pop(doc_id, None)
+            self._removidos.add(doc_id)
+
+    def __copy__(self):
+        # O ficheiro é só de leitura e pode ser partilhado; a camada em memória não
+        copia = DocstorePreguicoso(self._documentos)
+        copia._adicionados = dict(self._adicionados)
+        copia._removidos = set(self._removidos)
+        return copia
+
+
+class MapaPosicoesPreguicoso(MutableMapping):
+    """index_to_docstore_id lido do disco, com as alterações posteriores em memória."""
+
+    def __init__(self, documentos):
+        self._documentos = documentos
+        self._base = len(documentos)
+        self._extra = {}
+
+    def __getitem__(self, posicao):
+        if posicao in self._extra:
+            return self._extra[posicao]
+        if 0 <= posicao < self._base:
+            return self._documentos.id_na_posicao(posicao)
+        raise KeyError(posicao)
+
+    def __setitem__(self, posicao, doc_id):
+        self._extra[posicao] = doc_id
+
+    def __delitem__(self, posicao):
+        raise TypeError("As posições do índice não podem ser removidas individualmente.")
+
+    def __len__(self):
+        return self._base + sum(1 for posicao in self._extra if posicao >= self._base)
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __copy__(self):
+        copia = MapaPosicoesPreguicoso(self._documentos)
+        copia._base = self._base
+        copia._extra = dict(self._extra)
+        return copia
+
+
+class FAISSPreguicoso(FAISS):
+    """
+    Vector store FAISS aberto a partir do formato em disco. O índice começa mapeado
+    em memória (só leitura) e é copiado para memória na primeira alteração.
+    """
+
+    pasta = None
+    _indice_mapeado = False
+
+    def _tornar_editavel(self):
+        if self._indice_mapeado:
+            # Um índice mapeado não pode crescer nem encolher: serializar cria uma cópia própria
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self._indice_mapeado = False
+
+    def _FAISS__add(self, *args, **kwargs):
+        self._tornar_editavel()
+        return super()._FAISS__add(*args, **kwargs)
+
+    def merge_from(self, target):
+        self._tornar_editavel()
+        # O merge_from do FAISS esvazia o índice de origem, que também não pode estar mapeado
+        if isinstance(target, FAISSPreguicoso):
+            target._tornar_editavel()
+        return super().merge_from(target)
+
+    def delete(self, ids=None, **kwargs):
+        self._tornar_editavel()
+        return super().delete(ids, **kwargs)
+
+
+def _ler_indice_faiss(caminho):
+    """Abre o índice com mmap quando o tipo o permite; caso contrário, lê-o para memória."""
+    for flags in (faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY):
+        try:
+            return faiss.read_index(str(caminho), flags), True
+        except RuntimeError:
+            continue
+    return faiss.read_index(str(caminho)), False
+
+
+def abrir_colecao(pasta, embeddings_obj):
+    """
+    Abre uma coleção gravada por guardar_colecao. Os ficheiros da pasta têm de
+    continuar a existir enquanto o vector store estiver em uso.
+    """
+    pasta = Path(pasta)
+    manifest = json.loads((pasta / NOME_MANIFEST).read_text(encoding="utf-8"))
+    if manifest.get("formato") != NOME_FORMATO:
+        raise ValueError(f"Pasta '{pasta}' não contém uma coleção no formato {NOME_FORMATO}.")
+    if manifest.get("versao", 0) > VERSAO_FORMATO:
+        raise ValueError(f"Versão {manifest.get('versao')} do formato de coleção não suportada (máx. {VERSAO_FORMATO}).")
+
+    index, mapeado = _ler_indice_faiss(pasta / manifest["ficheiros"]["indice"])
+    documentos = _DocumentosEmDisco(pasta)
+    vector_store = FAISSPreguicoso(
+        embeddings_obj,
+        index,
+        DocstorePreguicoso(documentos),
+        MapaPosicoesPreguicoso(documentos),
+        normalize_L2=manifest.get("normalize_L2", False),
+        distance_strategy=DistanceStrategy(manifest.get("distance_strategy", DistanceStrategy.EUCLIDEAN_DISTANCE.value)),
+    )
+    vector_store.pasta = pasta
+    vector_store._indice_mapeado = mapeado
+    indice = IndiceDocumentos.carregar(pasta)
+    if indice is not None:
+        anexar_indice(vector_store, indice)
+    return vector_store
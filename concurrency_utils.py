@@ -0,0 +1,109 @@
+# concurrency_utils.py
+"""
+Utilitários de concorrência partilhados: limitação de pedidos por minuto
+(token bucket), repetição com recuo exponencial para erros de quota (429)
+e execução concorrente de uma função sobre uma lista de itens.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from telemetry import contar, em_contexto
+
+
+class TokenBucket:
+    """
+    Limitador de débito thread-safe. Permite até 'pedidos_por_minuto' pedidos,
+    com rajadas de no máximo 'capacidade' pedidos seguidos.
+    """
+
+    def __init__(self, pedidos_por_minuto, capacidade=None, relogio=time.monotonic, dormir=time.sleep):
+        self.taxa_por_segundo = pedidos_por_minuto / 60.0
+        self.capacidade = capacidade or max(1, int(pedidos_por_minuto // 60) or 1)
+        self._tokens = float(self.capacidade)
+        self._relogio = relogio
+        self._dormir = dormir
+        self._ultimo = relogio()
+        self._lock = threading.Lock()
+
+    def _repor(self):
+        agora = self._relogio()
+        self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa_por_segundo)
+        self._ultimo = agora
+
+    def adquirir(self):
+        """Bloqueia até haver um token disponível e consome-o."""
+        while True:
+            with self._lock:
+                self._repor()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.taxa_por_segundo
+            self._dormir(espera)
+
+
+def erro_de_limite(exc):
+    """Indica se a exceção corresponde a um erro de quota/limite de débito (HTTP 429)."""
+    if getattr(exc, 'code', None) == 429 or getattr(exc, 'status_code', None) == 429:
+        return True
+    if type(exc).__name__ in ("ResourceExhausted", "TooManyRequests", "RateLimitError"):
+        return True
+    mensagem = str(exc).lower()
+    return "429" in mensagem or "resource exhausted" in mensagem or "quota" in mensagem or "rate limit" in mensagem
+
+
+def erro_transitorio(exc):
+    """Erros de quota, de servidor (5xx) ou de rede, que justificam repetir o pedido."""
+    if erro_de_limite(exc):
+        return True
+    codigo = getattr(exc, 'code', None) or getattr(exc, 'status_code', None)
+    if codigo in (500, 502, 503, 504):
+        return True
+    if type(exc).__name__ in ("ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "ServerError"):
+        return True
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+def com_retentativas(funcao, *args, tentativas=5, espera_inicial=1.0, espera_maxima=30.0,
+                     e_retentavel=erro_de_limite, dormir=time.sleep, operacao=None, **kwargs):
+    """
+    Executa 'funcao' e repete-a com recuo exponencial (com jitter) enquanto
+    falhar com um erro considerado retentável. Os outros erros são propagados.
+    Cada repetição conta na métrica de retentativas com o rótulo 'operacao'.
+    """
+    for tentativa in range(tentativas):
+        try:
+            return funcao(*args, **kwargs)
+        except Exception as e:
+            if tentativa == tentativas - 1 or not e_retentavel(e):
+                raise
+            contar("retentativas_total", operacao=operacao or getattr(funcao, '__qualname__', type(funcao).__name__))
+            espera = min(espera_maxima, espera_inicial * (2 ** tentativa))
+            dormir(espera * random.uniform(0.5, 1.0))
+
+
+def mapear_concorrente(funcao, itens, max_concorrencia, ao_concluir=None):
+    """
+    Aplica 'funcao' a cada item num pool de threads com no máximo 'max_concorrencia'
+    execuções em simultâneo. 'ao_concluir(indice, resultado, erro)' é chamado na thread
+    de quem invoca, à medida que cada item termina (pode usar o Streamlit). As threads
+    correm no contexto de telemetria de quem invoca.
+    Devolve [(resultado, erro)] pela ordem dos itens; um erro não interrompe os restantes.
+    """
+    itens = list(itens)
+    saidas = [(None, None)] * len(itens)
+    if not itens:
+        return saidas
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concorrencia, len(itens)))) as executor:
+        funcao = em_contexto(funcao)
+        futuros = {executor.submit(funcao, item): i for i, item in enumerate(itens)}
+        for futuro in as_completed(futuros):
+            i = futuros[futuro]
+            erro = futuro.exception()
+            resultado = None if erro is not None else futuro.result()
+            saidas[i] = (resultado, erro)
+            if ao_concluir is not None:
+                ao_concluir(i, resultado, erro)
+    return saidas
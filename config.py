@@ -0,0 +1,142 @@
+# config.py
+"""
+Parâmetros de desempenho da aplicação, ajustáveis por variáveis de ambiente
+(útil no Cloud Run, onde são definidas na configuração do serviço).
+"""
+import os
+import tempfile
+
+
+def _int_env(nome, padrao):
+    try:
+        return int(os.environ.get(nome, padrao))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def _float_env(nome, padrao):
+    try:
+        return float(os.environ.get(nome, padrao))
+    except (TypeError, ValueError):
+        return padrao
+
+
+# Número de processos usados na extração de texto com PyMuPDF (1 = extração em série)
+EXTRACAO_NUM_WORKERS = _int_env("CONTRATIA_EXTRACAO_WORKERS", os.cpu_count() or 1)
+
+# OCR com Gemini Vision: pedidos por minuto permitidos e número de páginas em simultâneo
+OCR_PEDIDOS_POR_MINUTO = _int_env("CONTRATIA_OCR_RPM", 30)
+OCR_MAX_CONCORRENCIA = _int_env("CONTRATIA_OCR_CONCORRENCIA", 4)
+
+# Pasta dos caches persistentes em disco (no Cloud Run, /tmp fica em memória)
+CACHE_DIR = os.environ.get("CONTRATIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "contratia_cache"))
+
+# Cache de ingestão por hash do PDF: tamanho máximo em bytes
+INGESTAO_CACHE_MAX_BYTES = _int_env("CONTRATIA_INGESTAO_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+
+# Cache de embeddings por (modelo, hash do texto) e tamanho/concorrência dos lotes enviados à API
+EMBEDDINGS_CACHE_MAX_BYTES = _int_env("CONTRATIA_EMBEDDINGS_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+EMBEDDINGS_TAMANHO_LOTE = _int_env("CONTRATIA_EMBEDDINGS_LOTE", 100)
+EMBEDDINGS_MAX_CONCORRENCIA = _int_env("CONTRATIA_EMBEDDINGS_CONCORRENCIA", 4)
+
+# Pipeline de ingestão: capacidade das filas entre etapas e fragmentos por lote de embedding
+PIPELINE_TAMANHO_FILA = _int_env("CONTRATIA_PIPELINE_FILA", 4)
+PIPELINE_FRAGMENTOS_POR_LOTE = _int_env("CONTRATIA_PIPELINE_LOTE", 64)
+
+# Coleções gravadas no formato antigo (save_local do LangChain) só abrem com pickle.
+# Desativar (0) recusa esses blobs; as coleções no formato atual nunca usam pickle.
+PERMITIR_PICKLE_LEGADO = _int_env("CONTRATIA_PERMITIR_PICKLE_LEGADO", 1) == 1
+
+# Cache local de coleções descarregadas: pastas em disco e vector stores em memória
+COLECOES_CACHE_DISCO_MAX_BYTES = _int_env("CONTRATIA_COLECOES_DISCO_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+COLECOES_CACHE_MEMORIA_MAX_BYTES = _int_env("CONTRATIA_COLECOES_MEMORIA_MAX_BYTES", 1024 * 1024 * 1024)
+# Registo dos vector stores em memória (coleções abertas e uploads), partilhado pelas sessões:
+# orçamento global em bytes (o antigo limite da memória das coleções, por omissão) e tempo
+# sem atividade ao fim do qual uma sessão deixa de impedir que os seus sejam descartados
+VECTOR_STORES_MEMORIA_MAX_BYTES = _int_env("CONTRATIA_VECTOR_STORES_MAX_BYTES", COLECOES_CACHE_MEMORIA_MAX_BYTES)
+VECTOR_STORES_SESSAO_TTL_SEGUNDOS = _int_env("CONTRATIA_VECTOR_STORES_SESSAO_TTL", 3600)
+# Número de coleções mais recentes de cada utilizador a pré-carregar após o login (0 = desativado)
+COLECOES_PREAQUECER = _int_env("CONTRATIA_COLECOES_PREAQUECER", 2)
+
+# Transferência de coleções para o Storage: tamanho de cada shard e transferências em paralelo
+TRANSFER_TAMANHO_SHARD = _int_env("CONTRATIA_TRANSFER_SHARD_BYTES", 16 * 1024 * 1024)
+TRANSFER_CONCORRENCIA = _int_env("CONTRATIA_TRANSFER_CONCORRENCIA", 8)
+
+# Orçamento de contexto das análises de um contrato (resumo, riscos): acima de
+# CONTEXTO_MAX_TOKENS estimados, o texto é analisado por secções (map-reduce)
+CONTEXTO_MAX_TOKENS = _int_env("CONTRATIA_CONTEXTO_MAX_TOKENS", 30000)
+CONTEXTO_TOKENS_SECAO = _int_env("CONTRATIA_CONTEXTO_TOKENS_SECAO", 6000)
+MAPREDUCE_MAX_CONCORRENCIA = _int_env("CONTRATIA_MAPREDUCE_CONCORRENCIA", 4)
+
+# Extração estruturada (Dashboard, Prazos): ficheiros analisados em simultâneo pelo LLM
+EXTRACAO_LLM_MAX_CONCORRENCIA = _int_env("CONTRATIA_EXTRACAO_LLM_CONCORRENCIA", 8)
+
+# Cache persistente de respostas do LLM: tamanho local, validade e cópia partilhada no Firestore
+LLM_CACHE_MAX_BYTES = _int_env("CONTRATIA_LLM_CACHE_MAX_BYTES", 128 * 1024 * 1024)
+LLM_CACHE_TTL_SEGUNDOS = _int_env("CONTRATIA_LLM_CACHE_TTL", 30 * 24 * 3600)
+LLM_CACHE_PARTILHADO = _int_env("CONTRATIA_LLM_CACHE_PARTILHADO", 1) == 1
+
+# Extração dos campos do Dashboard: "dirigido" envia ao modelo só os trechos mais
+# relevantes de cada grupo de campos; "completo" envia o texto inteiro do contrato
+EXTRACAO_MODO = os.environ.get("CONTRATIA_EXTRACAO_MODO", "dirigido")
+EXTRACAO_DIRIGIDA_TOP_K = _int_env("CONTRATIA_EXTRACAO_TOP_K", 3)
+# Abaixo desta semelhança (cosseno) num grupo de campos, usa-se o texto completo
+EXTRACAO_DIRIGIDA_SIMILARIDADE_MIN = _float_env("CONTRATIA_EXTRACAO_SIMILARIDADE_MIN", 0.35)
+# Com mais campos por preencher do que este número, repete-se com o texto completo
+EXTRACAO_DIRIGIDA_MAX_CAMPOS_VAZIOS = _int_env("CONTRATIA_EXTRACAO_MAX_CAMPOS_VAZIOS", 4)
+
+# Cache semântico do chat: semelhança de cosseno mínima entre perguntas para reutilizar
+# uma resposta, respostas guardadas por coleção e validade
+CHAT_CACHE_LIMIAR = _float_env("CONTRATIA_CHAT_CACHE_LIMIAR", 0.95)
+CHAT_CACHE_MAX_POR_COLECAO = _int_env("CONTRATIA_CHAT_CACHE_MAX_POR_COLECAO", 500)
+CHAT_CACHE_TTL_SEGUNDOS = _int_env("CONTRATIA_CHAT_CACHE_TTL", 7 * 24 * 3600)
+
+# Chat: número de trechos da coleção enviados ao modelo em cada pergunta
+CHAT_K_TRECHOS = _int_env("CONTRATIA_CHAT_K", 5)
+
+# Índice vetorial das coleções: em "auto", índice exato (flat) até INDICE_LIMIAR_ANN
+# vetores e INDICE_TIPO_ANN ("hnsw" ou "ivf") acima disso; "flat", "hnsw" ou "ivf" forçam o tipo
+INDICE_TIPO = os.environ.get("CONTRATIA_INDICE_TIPO", "auto")
+INDICE_TIPO_ANN = os.environ.get("CONTRATIA_INDICE_TIPO_ANN", "hnsw")
+INDICE_LIMIAR_ANN = _int_env("CONTRATIA_INDICE_LIMIAR_ANN", 50000)
+# HNSW: ligações por nó e largura da pesquisa na construção e nas consultas (efSearch)
+INDICE_HNSW_M = _int_env("CONTRATIA_INDICE_HNSW_M", 32)
+INDICE_HNSW_EF_CONSTRUCAO = _int_env("CONTRATIA_INDICE_HNSW_EF_CONSTRUCAO", 80)
+INDICE_HNSW_EF_PESQUISA = _int_env("CONTRATIA_INDICE_HNSW_EF_PESQUISA", 64)
+# IVF: número de listas (0 = √n) e listas visitadas por consulta (nprobe)
+INDICE_IVF_NLIST = _int_env("CONTRATIA_INDICE_IVF_NLIST", 0)
+INDICE_IVF_NPROBE = _int_env("CONTRATIA_INDICE_IVF_NPROBE", 8)
+
+# Pesquisa federada: coleções abertas e pesquisadas em simultâneo
+FEDERADA_MAX_CONCORRENCIA = _int_env("CONTRATIA_FEDERADA_CONCORRENCIA", 4)
+
+# Deduplicação de fragmentos na ingestão: cópias exatas e quase-cópias (MinHash/LSH) ficam
+# com um único vetor. Limiar de Jaccard estimado e forma das assinaturas (permutações = bandas × linhas)
+DEDUP_ATIVO = _int_env("CONTRATIA_DEDUP", 1) == 1
+DEDUP_LIMIAR_JACCARD = _float_env("CONTRATIA_DEDUP_LIMIAR", 0.85)
+DEDUP_PERMUTACOES = _int_env("CONTRATIA_DEDUP_PERMUTACOES", 64)
+DEDUP_BANDAS = _int_env("CONTRATIA_DEDUP_BANDAS", 16)
+
+# Trabalhos em segundo plano (Dashboard, Prazos, Riscos): executados em simultâneo, segundos
+# entre atualizações do progresso na página e validade dos resultados guardados
+TRABALHOS_NUM_WORKERS = _int_env("CONTRATIA_TRABALHOS_WORKERS", 2)
+TRABALHOS_INTERVALO_ATUALIZACAO = _float_env("CONTRATIA_TRABALHOS_INTERVALO", 2.0)
+TRABALHOS_RETENCAO_SEGUNDOS = _int_env("CONTRATIA_TRABALHOS_RETENCAO", 7 * 24 * 3600)
+
+# Catálogo das coleções de cada utilizador: validade da lista em memória (as gravações
+# deste processo invalidam-na logo) e documentos lidos do Firestore por página
+CATALOGO_TTL_SEGUNDOS = _int_env("CONTRATIA_CATALOGO_TTL", 300)
+CATALOGO_TAMANHO_PAGINA = _int_env("CONTRATIA_CATALOGO_PAGINA", 200)
+
+# Arranque: modelo de embeddings e importação em segundo plano, enquanto a página de login
+# é mostrada, dos módulos pesados usados depois do login (LangChain, FAISS, PyMuPDF, pandas)
+ARRANQUE_MODELO_EMBEDDINGS = os.environ.get("CONTRATIA_MODELO_EMBEDDINGS", "models/embedding-001")
+ARRANQUE_PREAQUECER_MODULOS = _int_env("CONTRATIA_PREAQUECER_MODULOS", 1) == 1
+
+# Telemetria: etapas cronometradas e contadores (tokens, caches, bytes, retentativas), com um
+# traço JSONL por sessão em CACHE_DIR/tracos (tamanho máximo antes de rodar e validade)
+# e a porta onde é servido /metrics no formato do Prometheus (0 = sem servidor)
+TELEMETRIA_ATIVA = _int_env("CONTRATIA_TELEMETRIA", 1) == 1
+TELEMETRIA_TRACOS_MAX_BYTES = _int_env("CONTRATIA_TELEMETRIA_TRACO_MAX_BYTES", 4 * 1024 * 1024)
+TELEMETRIA_TRACOS_RETENCAO_SEGUNDOS = _int_env("CONTRATIA_TELEMETRIA_TRACO_RETENCAO", 2 * 24 * 3600)
+TELEMETRIA_PORTA_METRICAS = _int_env("CONTRATIA_METRICAS_PORTA", 0)
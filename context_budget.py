@@ -0,0 +1,175 @@
+# context_budget.py
+"""
+Orçamento de contexto para as chamadas ao LLM sobre contratos longos.
+
+O número de tokens de cada pedido é estimado antes de o enviar. Se o contrato
+cabe no orçamento, faz-se uma única chamada com o prompt original; se não,
+o texto é dividido em secções do tamanho de cláusulas, cada secção é analisada
+em paralelo (map) e as notas parciais são combinadas numa chamada final
+(reduce) que mantém o formato de saída do prompt original.
+
+Cada chamada fica registada no relatório com a etapa, o modelo, os tokens de
+entrada e saída, a latência e se a resposta veio do cache de respostas.
+"""
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import CONTEXTO_MAX_TOKENS, CONTEXTO_TOKENS_SECAO, MAPREDUCE_MAX_CONCORRENCIA
+from llm_cache import invocar_com_cache
+
+# Estimativa conservadora para texto em português (o tokenizer do Gemini dá ~4 caracteres/token)
+CARACTERES_POR_TOKEN = 3.5
+
+# Início de uma cláusula: "CLÁUSULA 5ª", "Art. 3º", "§ 2º", "12.1 Do Pagamento"...
+_INICIO_CLAUSULA = re.compile(
+    r"^[ \t]*(?:CL[ÁA]USULA\b|Cl[áa]usula\b|ART(?:IGO)?\b\.?|Art(?:igo)?\b\.?|§|"
+    r"PAR[ÁA]GRAFO\b|Par[áa]grafo\b|\d{1,3}(?:\.\d{1,3})*[.)º°]?[ \t]+[A-ZÁÉÍÓÚÂÊÔÃÕÇ])",
+    re.MULTILINE,
+)
+
+
+def estimar_tokens(texto):
+    """Número aproximado de tokens de um texto, sem chamar a API."""
+    return math.ceil(len(texto or "") / CARACTERES_POR_TOKEN)
+
+
+def dividir_em_clausulas(texto):
+    """Divide o texto nos inícios de cláusula reconhecidos. O texto antes da primeira fica como preâmbulo."""
+    inicios = [m.start() for m in _INICIO_CLAUSULA.finditer(texto)]
+    if not inicios or inicios[0] != 0:
+        inicios.insert(0, 0)
+    inicios.append(len(texto))
+    return [texto[a:b] for a, b in zip(inicios, inicios[1:]) if texto[a:b].strip()]
+
+
+def _partir_bloco(bloco, max_tokens):
+    """Parte um bloco maior do que o orçamento por parágrafos e, em último caso, por caracteres."""
+    max_caracteres = max(1, int(max_tokens * CARACTERES_POR_TOKEN))
+    partes, atual = [], ""
+    for paragrafo in re.split(r"(?<=\n)", bloco):
+        while len(paragrafo) > max_caracteres:
+            if atual:
+                partes.append(atual)
+                atual = ""
+            partes.append(paragrafo[:max_caracteres])
+            paragrafo = paragrafo[max_caracteres:]
+        if atual and len(atual) + len(paragrafo) > max_caracteres:
+            partes.append(atual)
+            atual = ""
+        atual += paragrafo
+    if atual:
+        partes.append(atual)
+    return partes
+
+
+def agrupar_em_secoes(blocos, max_tokens):
+    """Junta blocos consecutivos em secções de até 'max_tokens', sem partir blocos que caibam."""
+    secoes, atual, tokens_atual = [], [], 0
+    for bloco in blocos:
+        for parte in (_partir_bloco(bloco, max_tokens) if estimar_tokens(bloco) > max_tokens else [bloco]):
+            tokens = estimar_tokens(parte)
+            if atual and tokens_atual + tokens > max_tokens:
+                secoes.append("".join(atual))
+                atual, tokens_atual = [], 0
+            atual.append(parte)
+            tokens_atual += tokens
+    if atual:
+        secoes.append("".join(atual))
+    return secoes
+
+
+def dividir_em_secoes(texto, max_tokens=CONTEXTO_TOKENS_SECAO):
+    """Secções do contrato com até 'max_tokens', cortadas nos limites das cláusulas."""
+    return agrupar_em_secoes(dividir_em_clausulas(texto), max_tokens)
+
+
+def chamar_llm(llm, prompt, variaveis, etapa, relatorio, secao=None, cache=None):
+    """
+    Chama o LLM através do cache de respostas (com retentativas em erros transitórios)
+    e acrescenta ao relatório os tokens e a latência. Usa o 'usage_metadata' da
+    resposta quando existe; respostas do cache ficam marcadas com 'cache'.
+    """
+    inicio = time.perf_counter()
+    conteudo, uso, do_cache = invocar_com_cache(llm, prompt, variaveis, cache=cache)
+    duracao = time.perf_counter() - inicio
+    relatorio.append({
+        "etapa": etapa,
+        "secao": secao,
+        "modelo": getattr(llm, 'model', type(llm).__name__),
+        "tokens_entrada": uso.get("input_tokens", estimar_tokens(prompt.format(**variaveis))),
+        "tokens_saida": uso.get("output_tokens", estimar_tokens(conteudo)),
+        "tokens_estimados": not uso,
+        "cache": do_cache,
+        "segundos": round(duracao, 3),
+    })
+    return conteudo
+
+
+def _mapear(llm, prompt, secoes, variaveis, etapa, relatorio, max_concorrencia, cache):
+    """Chama o prompt de map sobre cada secção em paralelo. Devolve as notas pela ordem das secções."""
+    registos = [[] for _ in secoes]
+
+    def _tarefa(i):
+        dados = dict(variaveis, texto_secao=secoes[i], numero_secao=i + 1, total_secoes=len(secoes))
+        return chamar_llm(llm, prompt, dados, etapa, registos[i], secao=i + 1, cache=cache)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concorrencia, len(secoes)))) as executor:
+        notas = list(executor.map(_tarefa, range(len(secoes))))
+    for registo in registos:
+        relatorio.extend(registo)
+    return notas
+
+
+def _juntar_notas(notas):
+    return "\n\n".join(f"[Secção {i}]\n{nota.strip()}" for i, nota in enumerate(notas, start=1))
+
+
+def executar_com_orcamento(texto, prompt_unico, prompt_map, prompt_reduce, llm, llm_map=None, variaveis=None,
+                           max_tokens=CONTEXTO_MAX_TOKENS, tokens_secao=CONTEXTO_TOKENS_SECAO,
+                           max_concorrencia=MAPREDUCE_MAX_CONCORRENCIA, cache=None):
+    """
+    Executa uma análise sobre 'texto' dentro do orçamento de contexto.
+
+    'prompt_unico' recebe o contrato inteiro em {texto_contrato}; 'prompt_map' recebe
+    uma secção em {texto_secao} (com {numero_secao} e {total_secoes}); 'prompt_reduce'
+    recebe as notas das secções em {notas_secoes} e deve pedir o mesmo formato final
+    que 'prompt_unico'. 'llm_map' permite usar um modelo mais rápido nas secções.
+    'cache' substitui o cache de respostas do processo (ver llm_cache).
+    Devolve (resultado, relatorio).
+    """
+    variaveis = variaveis or {}
+    llm_map = llm_map or llm
+    relatorio = []
+
+    tokens_prompt = estimar_tokens(prompt_unico.format(texto_contrato="", **variaveis))
+    if tokens_prompt + estimar_tokens(texto) <= max_tokens:
+        return chamar_llm(llm, prompt_unico, dict(variaveis, texto_contrato=texto), "unica", relatorio, cache=cache), relatorio
+
+    tokens_secao = min(tokens_secao, max_tokens - estimar_tokens(prompt_map.format(
+        texto_secao="", numero_secao=0, total_secoes=0, **variaveis)))
+    notas = _mapear(llm_map, prompt_map, dividir_em_secoes(texto, tokens_secao), variaveis, "map", relatorio, max_concorrencia, cache)
+
+    # Se as notas ainda não cabem na chamada final, são condensadas por grupos
+    tokens_reduce = estimar_tokens(prompt_reduce.format(notas_secoes="", **variaveis))
+    nivel = 1
+    while tokens_reduce + estimar_tokens(_juntar_notas(notas)) > max_tokens and len(notas) > 1:
+        grupos = agrupar_em_secoes([nota + "\n\n" for nota in notas], tokens_secao)
+        if len(grupos) >= len(notas):
+            break
+        nivel += 1
+        notas = _mapear(llm_map, prompt_map, grupos, variaveis, f"map-{nivel}", relatorio, max_concorrencia, cache)
+
+    resultado = chamar_llm(llm, prompt_reduce, dict(variaveis, notas_secoes=_juntar_notas(notas)), "reduce", relatorio, cache=cache)
+    return resultado, relatorio
+
+
+def resumo_do_relatorio(relatorio):
+    """Totais de um relatório: chamadas, tokens e soma das latências."""
+    return {
+        "chamadas": len(relatorio),
+        "tokens_entrada": sum(r["tokens_entrada"] for r in relatorio),
+        "tokens_saida": sum(r.get("tokens_saida", 0) for r in relatorio),
+        "segundos_somados": round(sum(r["segundos"] for r in relatorio), 3),
+    }
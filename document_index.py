@@ -0,0 +1,221 @@
+# document_index.py
+"""
+Este módulo mantém, para cada coleção, um índice fonte → fragmentos ordenados
+e o texto original de cada página. Assim o texto completo de um ficheiro é
+obtido sem varrer o docstore inteiro e sem repetir o 'chunk_overlap'.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+NOME_FICHEIRO_INDICE = "indice_documentos.json"
+
+
+class IndiceDocumentos:
+    """Índice por ficheiro de origem dos fragmentos e das páginas de uma coleção."""
+
+    def __init__(self, fragmentos_por_fonte=None, paginas_por_fonte=None):
+        # fonte -> lista ordenada de ids do docstore
+        self.fragmentos_por_fonte = fragmentos_por_fonte or {}
+        # fonte -> lista ordenada de [numero_pagina, texto_original]
+        self.paginas_por_fonte = paginas_por_fonte or {}
+
+    @classmethod
+    def construir(cls, paginas, fragmentos, ids):
+        """
+        Constrói o índice a partir das páginas extraídas (Documents com 'source' e 'page')
+        e dos fragmentos já divididos, com os respetivos ids no docstore.
+        """
+        indice = cls()
+        for pagina in paginas:
+            fonte = pagina.metadata.get('source')
+            indice.paginas_por_fonte.setdefault(fonte, []).append(
+                [pagina.metadata.get('page', 0), pagina.page_content]
+            )
+        for fonte, lista in indice.paginas_por_fonte.items():
+            lista.sort(key=lambda item: item[0])
+        indice.adicionar_fragmentos(fragmentos, ids)
+        return indice
+
+    @classmethod
+    def a_partir_do_docstore(cls, vector_store):
+        """
+        Reconstrói o índice numa única passagem pelo docstore, para coleções
+        guardadas antes de o índice existir. Não há texto de página nestes casos.
+        """
+        por_fonte = {}
+        for doc_id, doc in vector_store.docstore._dict.items():
+            por_fonte.setdefault(doc.metadata.get('source'), []).append((doc_id, doc))
+        indice = cls()
+        for fonte, itens in por_fonte.items():
+            itens.sort(key=lambda item: (item[1].metadata.get('page', 0), item[1].metadata.get('start_index', 0)))
+            indice.fragmentos_por_fonte[fonte] = [doc_id for doc_id, _ in itens]
+        return indice
+
+    def adicionar_fragmentos(self, fragmentos, ids):
+        """Acrescenta fragmentos (na ordem em que foram gerados) ao índice."""
+        for fragmento, doc_id in zip(fragmentos, ids):
+            self.fragmentos_por_fonte.setdefault(fragmento.metadata.get('source'), []).append(doc_id)
+
+    def fundir(self, outro):
+        """Acrescenta as fontes de outro índice (ex.: documentos adicionados a uma coleção)."""
+        for fonte, ids in outro.fragmentos_por_fonte.items():
+            self.fragmentos_por_fonte.setdefault(fonte, []).extend(ids)
+        for fonte, paginas in outro.paginas_por_fonte.items():
+            self.paginas_por_fonte[fonte] = paginas
+
+    def remover_fonte(self, nome_arquivo):
+        """Retira uma fonte do índice e devolve os ids dos fragmentos que lhe pertenciam."""
+        self.paginas_por_fonte.pop(nome_arquivo, None)
+        return self.fragmentos_por_fonte.pop(nome_arquivo, [])
+
+    def __copy__(self):
+        return IndiceDocumentos({fonte: list(ids) for fonte, ids in self.fragmentos_por_fonte.items()},
+                                dict(self.paginas_por_fonte))
+
+    def fontes(self):
+        return list(self.fragmentos_por_fonte.keys())
+
+    def ids_da_fonte(self, nome_arquivo):
+        return self.fragmentos_por_fonte.get(nome_arquivo, [])
+
+    def texto_completo(self, nome_arquivo, docstore=None):
+        """
+        Devolve o texto completo de um ficheiro. Usa o texto original das páginas quando
+        existe; caso contrário junta os fragmentos do docstore removendo a sobreposição.
+        """
+        paginas = self.paginas_por_fonte.get(nome_arquivo)
+        if paginas:
+            return "\n".join(texto for _, texto in paginas)
+        if docstore is None:
+            return ""
+        docs = [docstore.search(doc_id) for doc_id in self.ids_da_fonte(nome_arquivo)]
+        return _juntar_fragmentos([doc for doc in docs if hasattr(doc, 'page_content')])
+
+    def para_dict(self):
+        return {
+            "fragmentos_por_fonte": self.fragmentos_por_fonte,
+            "paginas_por_fonte": self.paginas_por_fonte,
+        }
+
+    @classmethod
+    def de_dict(cls, dados):
+        return cls(dados.get("fragmentos_por_fonte"), dados.get("paginas_por_fonte"))
+
+    def guardar(self, pasta):
+        caminho = Path(pasta) / NOME_FICHEIRO_INDICE
+        caminho.write_text(json.dumps(self.para_dict(), ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def carregar(cls, pasta):
+        """Lê o índice guardado numa pasta. Devolve None se a coleção não o tiver."""
+        caminho = Path(pasta) / NOME_FICHEIRO_INDICE
+        if not caminho.exists():
+            return None
+        return cls.de_dict(json.loads(caminho.read_text(encoding="utf-8")))
+
+
+def _juntar_fragmentos(docs):
+    """
+    Junta fragmentos ordenados. Quando têm 'start_index', os caracteres repetidos
+    pelo 'chunk_overlap' dentro da mesma página são descartados.
+    """
+    partes = []
+    pagina_anterior, fim_anterior = None, None
+    for doc in docs:
+        pagina = doc.metadata.get('page', 0)
+        inicio = doc.metadata.get('start_index')
+        texto = doc.page_content
+        if pagina == pagina_anterior and inicio is not None and fim_anterior is not None:
+            if inicio < fim_anterior:
+                texto = texto[fim_anterior - inicio:]
+            partes[-1] += texto if inicio <= fim_anterior else "\n" + texto
+        else:
+            partes.append(texto)
+        pagina_anterior = pagina
+        fim_anterior = inicio + len(doc.page_content) if inicio is not None else None
+    return "\n".join(partes)
+
+
+def anexar_indice(vector_store, indice):
+    """Associa o índice ao vector store para que viaje com ele pela sessão."""
+    vector_store.indice_documentos = indice
+    return vector_store
+
+
+def obter_indice(vector_store):
+    """
+    Devolve o índice associado ao vector store. Se não existir (coleções antigas),
+    constrói-o uma única vez a partir do docstore e deixa-o associado.
+    """
+    indice = getattr(vector_store, 'indice_documentos', None)
+    if indice is None:
+        indice = IndiceDocumentos.a_partir_do_docstore(vector_store)
+        anexar_indice(vector_store, indice)
+    return indice
+
+
+def retirar_fonte_dos_documentos(docstore, ids, nome_arquivo):
+    """
+    Retira 'nome_arquivo' das referências ('fontes') dos fragmentos dados. Um fragmento
+    deduplicado pode pertencer a vários ficheiros: só os que ficam sem nenhuma referência
+    são devolvidos (para apagar do índice); os outros passam a apontar para a primeira
+    referência que resta. Fragmentos sem 'fontes' pertencem apenas ao seu ficheiro.
+    """
+    sem_fontes = []
+    for doc_id in dict.fromkeys(ids):
+        doc = docstore.search(doc_id)
+        fontes = [ref for ref in getattr(doc, 'metadata', {}).get('fontes') or [] if ref.get('source') != nome_arquivo]
+        if not fontes:
+            sem_fontes.append(doc_id)
+            continue
+        # O Document pode estar partilhado com outra cópia do vector store: é substituído, não alterado
+        doc = doc.model_copy(update={'metadata': {**doc.metadata, 'fontes': fontes, **fontes[0]}})
+        if isinstance(getattr(docstore, '_dict', None), dict):
+            docstore._dict[doc_id] = doc
+        else:
+            docstore.add({doc_id: doc})
+    return sem_fontes
+
+
+def remover_fonte_da_colecao(vector_store, nome_arquivo):
+    """Retira um ficheiro do índice da coleção e devolve os ids a apagar do vector store."""
+    ids = obter_indice(vector_store).remover_fonte(nome_arquivo)
+    return retirar_fonte_dos_documentos(vector_store.docstore, ids, nome_arquivo)
+
+
+def texto_completo_do_ficheiro(vector_store, nome_arquivo):
+    """Texto completo de um ficheiro da coleção, sem texto duplicado pela sobreposição."""
+    return obter_indice(vector_store).texto_completo(nome_arquivo, vector_store.docstore)
+
+
+def definir_impressao_base(vector_store, *partes):
+    """
+    Identifica o conteúdo de origem da coleção (ex.: blob e geração no Storage, ou os
+    hashes dos PDFs enviados). Coleções com a mesma origem partilham caches entre processos.
+    """
+    vector_store.impressao_base = hashlib.sha256(
+        json.dumps(partes, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    vector_store.versao_conteudo = 0
+    return vector_store
+
+
+def registar_alteracao(vector_store):
+    """Marca que a coleção foi alterada nesta sessão (documentos adicionados ou removidos)."""
+    vector_store.versao_conteudo = getattr(vector_store, 'versao_conteudo', 0) + 1
+
+
+def impressao_colecao(vector_store):
+    """
+    Impressão digital do conteúdo atual da coleção: muda quando a origem muda, quando
+    há alterações registadas e quando mudam o número de vetores ou as fontes.
+    Numa pesquisa federada, combina as impressões das coleções que a compõem.
+    """
+    membros = getattr(vector_store, 'colecoes', None)
+    if membros is not None:
+        partes = sorted([nome, impressao_colecao(vs)] for nome, vs in membros.items())
+        return hashlib.sha256(json.dumps(partes).encode("utf-8")).hexdigest()
+    base = getattr(vector_store, 'impressao_base', None) or f"sessao-{id(vector_store)}"
+    partes = [base, getattr(vector_store, 'versao_conteudo', 0), vector_store.index.ntotal,
+              sorted(str(f) for f in obter_indice(vector_store).fontes())]
+    return hashlib.sha256(json.dumps(partes).encode("utf-8")).hexdigest()
@@ -0,0 +1,96 @@
+# embeddings_cache.py
+"""
+Camada de embeddings com cache persistente por (modelo, hash do texto),
+deduplicação dos textos de cada chamada e envio em lotes concorrentes.
+"""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from cache_store import CacheSQLite
+from concurrency_utils import com_retentativas
+from config import CACHE_DIR, EMBEDDINGS_CACHE_MAX_BYTES, EMBEDDINGS_MAX_CONCORRENCIA, EMBEDDINGS_TAMANHO_LOTE
+from telemetry import contar_cache, em_contexto, etapa
+
+_cache_embeddings = None
+_cache_embeddings_lock = threading.Lock()
+
+
+def obter_cache_embeddings():
+    """Instância única por processo do armazenamento de vetores."""
+    global _cache_embeddings
+    with _cache_embeddings_lock:
+        if _cache_embeddings is None:
+            _cache_embeddings = CacheSQLite(Path(CACHE_DIR) / "embeddings.sqlite", EMBEDDINGS_CACHE_MAX_BYTES)
+        return _cache_embeddings
+
+
+class EmbeddingsEmCache(Embeddings):
+    """
+    Envolve um modelo de embeddings (ex.: GoogleGenerativeAIEmbeddings).
+    Os textos repetidos numa chamada são enviados uma só vez, os já conhecidos
+    vêm do cache e os restantes seguem em lotes de 'tamanho_lote' enviados em paralelo.
+    """
+
+    def __init__(self, base, cache=None, tamanho_lote=EMBEDDINGS_TAMANHO_LOTE, max_concorrencia=EMBEDDINGS_MAX_CONCORRENCIA):
+        self.base = base
+        self.model = getattr(base, 'model', type(base).__name__)
+        self.cache = cache if cache is not None else obter_cache_embeddings()
+        self.tamanho_lote = tamanho_lote
+        self.max_concorrencia = max_concorrencia
+        self.textos_pedidos = 0
+        self.textos_enviados = 0
+
+    def _chave(self, texto, tipo):
+        # Documentos e perguntas usam 'task_type' diferentes na API, logo vetores diferentes
+        digest = hashlib.sha256(texto.encode('utf-8')).hexdigest()
+        return f"{self.model}:{tipo}:{digest}"
+
+    def embed_documents(self, texts):
+        unicos = list(dict.fromkeys(texts))
+        chaves = {texto: self._chave(texto, "doc") for texto in unicos}
+        encontrados = self.cache.obter_varios(list(chaves.values()))
+        vetores = {texto: np.frombuffer(encontrados[chave], dtype=np.float32).tolist()
+                   for texto, chave in chaves.items() if chave in encontrados}
+
+        em_falta = [texto for texto in unicos if texto not in vetores]
+        self.textos_pedidos += len(texts)
+        self.textos_enviados += len(em_falta)
+        contar_cache("embeddings", True, len(vetores))
+        contar_cache("embeddings", False, len(em_falta))
+        if em_falta:
+            lotes = [em_falta[i:i + self.tamanho_lote] for i in range(0, len(em_falta), self.tamanho_lote)]
+            with etapa("embeddings_api", modelo=self.model, textos=len(em_falta), lotes=len(lotes)), \
+                    ThreadPoolExecutor(max_workers=max(1, min(self.max_concorrencia, len(lotes)))) as executor:
+                embeber = em_contexto(lambda lote: com_retentativas(self.base.embed_documents, lote, operacao="embeddings"))
+                resultados = list(executor.map(embeber, lotes))
+            novos = {}
+            for lote, vetores_lote in zip(lotes, resultados):
+                for texto, vetor in zip(lote, vetores_lote):
+                    vetores[texto] = list(vetor)
+                    novos[chaves[texto]] = np.asarray(vetor, dtype=np.float32).tobytes()
+            self.cache.guardar_varios(novos)
+
+        return [vetores[texto] for texto in texts]
+
+    def embed_query(self, text):
+        chave = self._chave(text, "query")
+        valor = self.cache.obter(chave)
+        contar_cache("embeddings", valor is not None)
+        if valor is not None:
+            return np.frombuffer(valor, dtype=np.float32).tolist()
+        with etapa("embeddings_api", modelo=self.model, textos=1):
+            vetor = com_retentativas(self.base.embed_query, text, operacao="embeddings")
+        self.cache.guardar(chave, np.asarray(vetor, dtype=np.float32).tobytes())
+        return list(vetor)
+
+    def estatisticas(self):
+        return {
+            "textos_pedidos": self.textos_pedidos,
+            "textos_enviados": self.textos_enviados,
+            **self.cache.estatisticas(),
+        }
@@ -0,0 +1,487 @@
+# fakes.py
+"""
+Substitutos locais e determinísticos dos serviços externos (Gemini, etc.),
+para medir e exercitar a aplicação sem chamadas de rede.
+"""
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from google.cloud.firestore_v1 import transforms
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+class ErroLimiteFalso(Exception):
+    """Imita o erro 429 (quota esgotada) devolvido pela API da Google."""
+    code = 429
+
+
+class FakeVisionModel:
+    """
+    Modelo de visão falso com a mesma interface 'invoke' do ChatGoogleGenerativeAI.
+    Devolve um texto fixo por chamada após 'latencia' segundos e pode falhar
+    com 429 nas primeiras 'falhas_429' chamadas.
+    """
+
+    def __init__(self, latencia=0.0, texto="Texto extraído pela visão falsa.", falhas_429=0):
+        self.latencia = latencia
+        self.texto = texto
+        self.falhas_429 = falhas_429
+        self.chamadas = 0
+        self.concorrencia_maxima = 0
+        self._em_curso = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, mensagens, **kwargs):
+        with self._lock:
+            self.chamadas += 1
+            numero = self.chamadas
+            self._em_curso += 1
+            self.concorrencia_maxima = max(self.concorrencia_maxima, self._em_curso)
+        try:
+            if self.latencia:
+                time.sleep(self.latencia)
+            if numero <= self.falhas_429:
+                raise ErroLimiteFalso("429 Resource exhausted (falso)")
+            return AIMessage(content=f"{self.texto} [chamada {numero}]")
+        finally:
+            with self._lock:
+                self._em_curso -= 1
+
+
+class FakeBlob:
+    """Blob em memória com a parte da interface do google.cloud.storage.Blob usada pela aplicação."""
+
+    def __init__(self, bucket, nome):
+        self.bucket = bucket
+        self.name = nome
+
+    @property
+    def generation(self):
+        return self.bucket.geracoes.get(self.name)
+
+    @property
+    def etag(self):
+        geracao = self.generation
+        return f"etag-{geracao}" if geracao is not None else None
+
+    def upload_from_string(self, dados, content_type=None):
+        if isinstance(dados, str):
+            dados = dados.encode("utf-8")
+        self.bucket._escrever(self.name, bytes(dados))
+
+    def upload_from_filename(self, caminho, content_type=None):
+        with open(caminho, "rb") as f:
+            self.bucket._escrever(self.name, f.read())
+
+    def download_as_bytes(self):
+        return self.bucket._ler(self.name)
+
+    def download_to_filename(self, caminho):
+        with open(caminho, "wb") as f:
+            f.write(self.bucket._ler(self.name))
+
+    def delete(self):
+        with self.bucket._lock:
+            del self.bucket.dados[self.name]
+
+
+class FakeBucket:
+    """
+    Bucket do Cloud Storage em memória. 'latencia' é somada a cada pedido
+    (envio ou download) para simular a ida e volta pela rede.
+    """
+
+    name = "bucket-falso"
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.dados = {}
+        self.geracoes = {}
+        self.envios = 0
+        self.downloads = 0
+        self.bytes_enviados = 0
+        self.bytes_descarregados = 0
+        self._lock = threading.Lock()
+
+    def _escrever(self, nome, dados):
+        if self.latencia:
+            time.sleep(self.latencia)
+        with self._lock:
+            self.dados[nome] = dados
+            self.geracoes[nome] = self.geracoes.get(nome, 0) + 1
+            self.envios += 1
+            self.bytes_enviados += len(dados)
+
+    def _ler(self, nome):
+        if self.latencia:
+            time.sleep(self.latencia)
+        with self._lock:
+            dados = self.dados[nome]
+            self.downloads += 1
+            self.bytes_descarregados += len(dados)
+            return dados
+
+    def blob(self, nome):
+        return FakeBlob(self, nome)
+
+    def get_blob(self, nome):
+        return FakeBlob(self, nome) if nome in self.dados else None
+
+    def list_blobs(self, prefix=""):
+        with self._lock:
+            nomes = sorted(n for n in self.dados if n.startswith(prefix))
+        return [FakeBlob(self, n) for n in nomes]
+
+
+class FakeLLM:
+    """
+    LLM de texto falso com a interface 'invoke' do ChatGoogleGenerativeAI.
+    A latência cresce com o tamanho do prompt ('latencia_base' mais
+    'latencia_por_mil_tokens' por cada mil tokens estimados) e a resposta traz
+    'usage_metadata', como as respostas reais. 'latencia_por_palavra' simula a
+    geração: 'invoke' espera pela resposta inteira, 'stream' entrega cada palavra
+    assim que é gerada.
+    """
+
+    def __init__(self, latencia_base=0.0, latencia_por_mil_tokens=0.0, resposta="Resposta do LLM falso.",
+                 model="fake-llm", latencia_por_palavra=0.0):
+        self.latencia_base = latencia_base
+        self.latencia_por_mil_tokens = latencia_por_mil_tokens
+        self.latencia_por_palavra = latencia_por_palavra
+        self.resposta = resposta
+        self.model = model
+        self.chamadas = 0
+        self.prompts = []
+        self.concorrencia_maxima = 0
+        self._em_curso = 0
+        self._lock = threading.Lock()
+
+    def _gerar(self, entrada):
+        """Espera o tempo de processamento do prompt e devolve (conteudo, usage_metadata)."""
+        from context_budget import estimar_tokens
+
+        texto = entrada if isinstance(entrada, str) else str(entrada)
+        tokens_entrada = estimar_tokens(texto)
+        with self._lock:
+            self.chamadas += 1
+            numero = self.chamadas
+            self.prompts.append(texto)
+        espera = self.latencia_base + self.latencia_por_mil_tokens * tokens_entrada / 1000
+        if espera:
+            time.sleep(espera)
+        conteudo = self.resposta(texto) if callable(self.resposta) else f"{self.resposta} [chamada {numero}]"
+        tokens_saida = estimar_tokens(conteudo)
+        return conteudo, {
+            "input_tokens": tokens_entrada, "output_tokens": tokens_saida,
+            "total_tokens": tokens_entrada + tokens_saida,
+        }
+
+    def _entrar(self):
+        with self._lock:
+            self._em_curso += 1
+            self.concorrencia_maxima = max(self.concorrencia_maxima, self._em_curso)
+
+    def _sair(self):
+        with self._lock:
+            self._em_curso -= 1
+
+    def invoke(self, entrada, **kwargs):
+        self._entrar()
+        try:
+            conteudo, uso = self._gerar(entrada)
+            if self.latencia_por_palavra:
+                time.sleep(self.latencia_por_palavra * len(conteudo.split()))
+            return AIMessage(content=conteudo, usage_metadata=uso)
+        finally:
+            self._sair()
+
+    def stream(self, entrada, **kwargs):
+        """Como 'invoke', mas entrega a resposta palavra a palavra (AIMessageChunk)."""
+        self._entrar()
+        try:
+            conteudo, _ = self._gerar(entrada)
+            for palavra in re.findall(r"\S+\s*", conteudo):
+                if self.latencia_por_palavra:
+                    time.sleep(self.latencia_por_palavra)
+                yield AIMessageChunk(content=palavra)
+        finally:
+            self._sair()
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Embeddings falsos mas com alguma semântica: cada palavra é dispersa por
+    hashing num vetor de 'dimensao' posições, pelo que textos com palavras em
+    comum têm semelhança de cosseno elevada. Deterministas entre processos.
+    """
+
+    def __init__(self, dimensao=256, latencia=0.0, model="fake-embeddings"):
+        self.dimensao = dimensao
+        self.latencia = latencia
+        self.model = model
+        self.textos_embebidos = 0
+
+    def _vetor(self, texto):
+        vetor = np.zeros(self.dimensao, dtype=np.float32)
+        for palavra in re.findall(r"\w{3,}", texto.lower()):
+            digest = hashlib.md5(palavra.encode("utf-8")).digest()
+            vetor[int.from_bytes(digest[:4], "little") % self.dimensao] += 1.0
+        norma = np.linalg.norm(vetor)
+        return (vetor / norma if norma else vetor).tolist()
+
+    def embed_documents(self, texts):
+        if self.latencia:
+            time.sleep(self.latencia)
+        self.textos_embebidos += len(texts)
+        return [self._vetor(texto) for texto in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+_RE_ARQUIVO = re.compile(r"[\"']([^\"'\n]+\.pdf)[\"']", re.IGNORECASE)
+_RE_VALOR = re.compile(r"R\$ ?([\d.]+,\d{2})")
+_RE_TAXA_ANO = re.compile(r"(\d+,\d+)% ao ano")
+_RE_PRAZO = re.compile(r"(\d+) meses")
+_RE_DATA = re.compile(r"(\d{2})/(\d{2})/(\d{4})")
+_PALAVRAS_RESPOSTA = ("o", "contrato", "prevê", "juros", "sobre", "saldo", "devedor", "com", "multa", "por",
+                      "rescisão", "e", "prazo", "de", "pagamento", "em", "parcelas", "mensais")
+
+
+def _numero_br(texto):
+    return float(texto.replace(".", "").replace(",", "."))
+
+
+class RespostasContrato:
+    """
+    Respostas plausíveis do LLM falso para os prompts da aplicação, escolhidas pelo
+    conteúdo do prompt: JSON válido para a extração do Dashboard (InfoContrato) e dos
+    Prazos (ListaDeEventos), com os valores que aparecem no texto do contrato, e texto
+    com 'palavras_resposta' palavras para o resto (resumo, riscos, conformidade,
+    anomalias, notas de secção). Usar como 'resposta' do FakeLLM.
+    """
+
+    def __init__(self, palavras_resposta=120):
+        self.palavras_resposta = palavras_resposta
+
+    def __call__(self, prompt):
+        arquivo = _RE_ARQUIVO.search(prompt)
+        arquivo = arquivo.group(1) if arquivo else "desconhecido.pdf"
+        if "descricao_evento" in prompt:
+            eventos = [{"descricao_evento": f"Vencimento de obrigação ({d}/{m}/{a})", "data_evento_str": f"{a}-{m}-{d}",
+                        "trecho_relevante": f"{d}/{m}/{a}"} for d, m, a in _RE_DATA.findall(prompt)]
+            return json.dumps({"eventos": eventos, "arquivo_fonte": arquivo}, ensure_ascii=False)
+        if "nome_banco_emissor" in prompt:
+            valor, taxa, prazo = _RE_VALOR.search(prompt), _RE_TAXA_ANO.search(prompt), _RE_PRAZO.search(prompt)
+            return json.dumps({
+                "arquivo_fonte": arquivo,
+                "nome_banco_emissor": next((b for b in re.findall(r"(?:Banco|Caixa) [\w ]+? S\.A\.", prompt)), "Não encontrado"),
+                "valor_principal_numerico": _numero_br(valor.group(1)) if valor else None,
+                "prazo_total_meses": int(prazo.group(1)) if prazo else None,
+                "taxa_juros_anual_numerica": _numero_br(taxa.group(1)) if taxa else None,
+                "possui_clausula_rescisao_multa": "Sim" if "multa" in prompt.lower() else "Não claro",
+            }, ensure_ascii=False)
+        return " ".join(_PALAVRAS_RESPOSTA[i % len(_PALAVRAS_RESPOSTA)] for i in range(self.palavras_resposta))
+
+
+class FabricaModelosFalsos:
+    """
+    Substitui a classe ChatGoogleGenerativeAI (mesma assinatura do construtor): cada
+    instância criada é um FakeLLM (ou um FakeVisionModel, se 'visao') com as latências
+    dadas. Guarda as instâncias para somar chamadas e tokens no fim.
+    """
+
+    def __init__(self, latencia_base=0.0, latencia_por_mil_tokens=0.0, resposta=None, visao=False,
+                 texto_visao="Texto extraído pela visão falsa."):
+        self.latencia_base = latencia_base
+        self.latencia_por_mil_tokens = latencia_por_mil_tokens
+        self.resposta = resposta if resposta is not None else RespostasContrato()
+        self.visao = visao
+        self.texto_visao = texto_visao
+        self.instancias = []
+        self._lock = threading.Lock()
+
+    def __call__(self, model=None, temperature=None, **kwargs):
+        if self.visao:
+            modelo = FakeVisionModel(self.latencia_base, texto=self.texto_visao)
+        else:
+            modelo = FakeLLM(self.latencia_base, self.latencia_por_mil_tokens, resposta=self.resposta, model=model)
+            modelo.temperature = temperature
+        with self._lock:
+            self.instancias.append(modelo)
+        return modelo
+
+    @property
+    def chamadas(self):
+        with self._lock:
+            return sum(modelo.chamadas for modelo in self.instancias)
+
+
+def _resolver_valor(atual, valor):
+    """Aplica a 'atual' um valor escrito no Firestore, incluindo as transformações (Increment, ArrayUnion, ...)."""
+    if valor is transforms.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(valor, transforms.Increment):
+        return (atual or 0) + valor.value
+    if isinstance(valor, transforms.ArrayUnion):
+        lista = list(atual or [])
+        return lista + [v for v in valor.values if v not in lista]
+    if isinstance(valor, transforms.ArrayRemove):
+        return [v for v in atual or [] if v not in valor.values]
+    if isinstance(valor, dict):
+        return {k: _resolver_valor(None, v) for k, v in valor.items()}
+    return copy.deepcopy(valor)
+
+
+class FakeDocumentSnapshot:
+    """Leitura de um documento (DocumentSnapshot do Firestore)."""
+
+    def __init__(self, referencia, dados):
+        self.reference = referencia
+        self.id = referencia.id
+        self.exists = dados is not None
+        self._dados = dados
+
+    def to_dict(self):
+        return copy.deepcopy(self._dados) if self.exists else None
+
+    def get(self, campo):
+        valor = self._dados
+        for parte in campo.split("."):
+            valor = valor[parte]
+        return copy.deepcopy(valor)
+
+
+class FakeDocumentReference:
+    def __init__(self, db, caminho):
+        self._db = db
+        self.caminho = caminho
+        self.id = caminho[-1]
+
+    def collection(self, nome):
+        return FakeCollectionReference(self._db, self.caminho + (nome,))
+
+    def get(self):
+        with self._db._lock:
+            self._db._contar_pedido(1)
+            dados = copy.deepcopy(self._db.documentos.get(self.caminho))
+        return FakeDocumentSnapshot(self, dados)
+
+    def set(self, dados):
+        with self._db._lock:
+            self._db.escritas += 1
+            self._db.documentos[self.caminho] = {k: _resolver_valor(None, v) for k, v in dados.items()
+                                                 if v is not transforms.DELETE_FIELD}
+
+    def update(self, campos):
+        """Como no Firestore: falha se o documento não existir; aceita caminhos com pontos ('a.b')."""
+        with self._db._lock:
+            if self.caminho not in self._db.documentos:
+                raise KeyError(f"Documento inexistente: {'/'.join(self.caminho)}")
+            self._db.escritas += 1
+            documento = self._db.documentos[self.caminho]
+            for campo, valor in campos.items():
+                *pais, ultimo = campo.split(".")
+                alvo = documento
+                for parte in pais:
+                    alvo = alvo.setdefault(parte, {})
+                if valor is transforms.DELETE_FIELD:
+                    alvo.pop(ultimo, None)
+                else:
+                    alvo[ultimo] = _resolver_valor(alvo.get(ultimo), valor)
+
+    def delete(self):
+        with self._db._lock:
+            self._db.escritas += 1
+            self._db.documentos.pop(self.caminho, None)
+
+
+class FakeQuery:
+    """Consulta sobre uma coleção: select, order_by, limit e start_after, como no cliente do Firestore."""
+
+    def __init__(self, db, caminho, campos=None, ordem=None, limite=None, depois_de=None):
+        self._db = db
+        self.caminho = caminho
+        self._campos = campos
+        self._ordem = ordem
+        self._limite = limite
+        self._depois_de = depois_de
+
+    def _copiar(self, **alteracoes):
+        atuais = {"campos": self._campos, "ordem": self._ordem, "limite": self._limite, "depois_de": self._depois_de}
+        return FakeQuery(self._db, self.caminho, **{**atuais, **alteracoes})
+
+    def select(self, campos):
+        return self._copiar(campos=list(campos))
+
+    def order_by(self, campo, direction="ASCENDING"):
+        return self._copiar(ordem=(campo, direction))
+
+    def limit(self, n):
+        return self._copiar(limite=n)
+
+    def start_after(self, snapshot):
+        return self._copiar(depois_de=snapshot)
+
+    def _chave(self, doc_id, dados):
+        campo, _ = self._ordem or ("__name__", "ASCENDING")
+        return (doc_id,) if campo == "__name__" else (dados[campo], doc_id)
+
+    def stream(self):
+        campo, direcao = self._ordem or ("__name__", "ASCENDING")
+        with self._db._lock:
+            itens = [(caminho[-1], dados) for caminho, dados in self._db.documentos.items()
+                     if caminho[:-1] == self.caminho and (campo == "__name__" or campo in dados)]
+            descendente = direcao == "DESCENDING"
+            itens.sort(key=lambda item: self._chave(*item), reverse=descendente)
+            if self._depois_de is not None:
+                inicio = self._chave(self._depois_de.id, self._depois_de._dados)
+                itens = [item for item in itens if (self._chave(*item) < inicio if descendente else self._chave(*item) > inicio)]
+            if self._limite is not None:
+                itens = itens[:self._limite]
+            self._db._contar_pedido(len(itens))
+            resultado = []
+            for doc_id, dados in itens:
+                dados = copy.deepcopy(dados)
+                if self._campos is not None:
+                    dados = {k: v for k, v in dados.items() if k in self._campos}
+                resultado.append(FakeDocumentSnapshot(FakeDocumentReference(self._db, self.caminho + (doc_id,)), dados))
+        return iter(resultado)
+
+
+class FakeCollectionReference(FakeQuery):
+    def document(self, nome):
+        return FakeDocumentReference(self._db, self.caminho + (nome,))
+
+
+class FakeFirestore:
+    """
+    Firestore em memória com a parte da interface do cliente usada pela aplicação.
+    Conta os pedidos, os documentos lidos (como na faturação do Firestore) e as escritas;
+    'latencia' é somada a cada pedido de leitura.
+    """
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.documentos = {}  # caminho (coleção, doc, coleção, doc, ...) -> dados
+        self.pedidos = 0
+        self.leituras = 0
+        self.escritas = 0
+        self._lock = threading.Lock()
+
+    def _contar_pedido(self, documentos_lidos):
+        """Chamar com o lock."""
+        if self.latencia:
+            time.sleep(self.latencia)
+        self.pedidos += 1
+        self.leituras += max(1, documentos_lidos)
+
+    def collection(self, nome):
+        return FakeCollectionReference(self, (nome,))
@@ -0,0 +1,67 @@
+# federated_search.py
+"""
+Pesquisa federada sobre várias coleções guardadas.
+
+Cada coleção mantém o seu próprio índice (e o seu lugar no cache de coleções):
+a pergunta é embebida uma vez, pesquisada em paralelo em cada índice e os
+melhores resultados de todas são juntos pela pontuação. Nada é reembebido nem
+fundido num índice novo. Os documentos devolvidos levam em 'colecao' o nome
+da coleção de onde vieram.
+
+ColecoesFederadas tem a parte da interface de um vector store usada pelo chat
+(embeddings e similarity_search*), pelo que o MotorChat e o cache do chat a
+tratam como uma coleção.
+"""
+import heapq
+
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+from concurrency_utils import mapear_concorrente
+from config import FEDERADA_MAX_CONCORRENCIA, INDICE_HNSW_EF_PESQUISA, INDICE_IVF_NPROBE
+from vector_index import pesquisar_com_pontuacao
+
+
+class ColecoesFederadas:
+    """Várias coleções pesquisadas como uma só, cada uma com o seu índice."""
+
+    def __init__(self, colecoes, max_concorrencia=FEDERADA_MAX_CONCORRENCIA):
+        if not colecoes:
+            raise ValueError("A pesquisa federada precisa de pelo menos uma coleção.")
+        self.colecoes = dict(colecoes)
+        self.max_concorrencia = max_concorrencia
+        estrategias = {vs.distance_strategy for vs in self.colecoes.values()}
+        if len(estrategias) > 1:
+            raise ValueError("As coleções usam medidas de distância diferentes e as pontuações não são comparáveis.")
+        self.distance_strategy = estrategias.pop()
+        self.embeddings = next(iter(self.colecoes.values())).embeddings
+        self.erros = {}  # coleção -> erro da última pesquisa
+
+    def _pesquisar_colecao(self, item, vetor, k, ef_search, nprobe):
+        nome, vector_store = item
+        # Os índices são partilhados com outras sessões: a largura da pesquisa vai na consulta
+        pares = pesquisar_com_pontuacao(vector_store, vetor, k, ef_search, nprobe)
+        # Cópias: o metadata dos documentos do docstore não deve ser alterado
+        return [(Document(page_content=doc.page_content, metadata={**doc.metadata, "colecao": nome}), pontuacao)
+                for doc, pontuacao in pares]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, ef_search=INDICE_HNSW_EF_PESQUISA,
+                                               nprobe=INDICE_IVF_NPROBE, **kwargs):
+        """Os 'k' melhores (documento, pontuação) entre todas as coleções."""
+        itens = list(self.colecoes.items())
+        saidas = mapear_concorrente(lambda item: self._pesquisar_colecao(item, embedding, k, ef_search, nprobe),
+                                    itens, self.max_concorrencia)
+        self.erros = {nome: erro for (nome, _), (_, erro) in zip(itens, saidas) if erro is not None}
+        if len(self.erros) == len(itens):
+            raise next(iter(self.erros.values()))
+        candidatos = [par for resultado, erro in saidas if erro is None for par in resultado]
+        if self.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            return heapq.nlargest(k, candidatos, key=lambda par: par[1])
+        # Distância euclidiana: menor é melhor
+        return heapq.nsmallest(k, candidatos, key=lambda par: par[1])
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k, **kwargs)
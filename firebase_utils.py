@@ -4,70 +4,104 @@ Este módulo centraliza todas as interações com o Google Firebase.
 Versão modificada para funcionar no Google Cloud Run com o Secret Manager.
 """
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
+from firebase_admin import firestore
+import copy
 import json
-import os
 from pathlib import Path
 from langchain_community.vectorstores import FAISS
 import tempfile
+import threading
+import uuid
 import zipfile  # <-- CORREÇÃO: Módulo importado
 
-# Importar o cliente do Secret Manager
-from google.cloud import secretmanager
+from collection_cache import obter_cache_colecoes
+from collection_catalog import estatisticas_colecao, obter_catalogo_colecoes
+from collection_format import FAISSPreguicoso, abrir_colecao, e_formato_colecao, guardar_colecao
+from concurrency_utils import mapear_concorrente
+from config import COLECOES_PREAQUECER, FEDERADA_MAX_CONCORRENCIA, PERMITIR_PICKLE_LEGADO
+from document_index import (IndiceDocumentos, anexar_indice, definir_impressao_base, obter_indice,
+                            registar_alteracao, remover_fonte_da_colecao)
+from federated_search import ColecoesFederadas
+from services import obter_bucket
+from storage_transfer import apagar_prefixo, descarregar_pasta_em_shards, enviar_pasta_em_shards, prefixo_do_manifest
+from telemetry import contar, contar_cache, em_contexto, etapa, etapa_atual
+from vector_store_registry import tamanho_estimado_vector_store
+from vector_index import apagar_vetores, converter_indice, copiar_vector_store, descrever_indice, fundir_vector_stores
 
-@st.cache_resource(show_spinner="A ligar aos serviços...")
-def initialize_services():
-    """
-    Inicializa o Firebase Admin SDK. Outras bibliotecas da Google (como a LangChain)
-    usarão as credenciais do ambiente fornecidas automaticamente pelo Cloud Run.
-    """
+def catalogo_colecoes(db_client, user_id):
+    """Coleções do utilizador com as suas estatísticas ({nome: EntradaCatalogo}), pelo catálogo em cache."""
+    if not db_client or not user_id: return {}
     try:
-        # Só executa a configuração uma vez
-        if not firebase_admin._apps:
-            project_id = "contratiapy"
-            
-            try:
-                # Obter credenciais do Secret Manager (para produção no Cloud Run)
-                secret_id = "firebase-credentials"
-                client = secretmanager.SecretManagerServiceClient()
-                name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-                response = client.access_secret_version(name=name)
-                creds_json_str = response.payload.data.decode('UTF-8')
-                creds_dict = json.loads(creds_json_str)
-                
-                cred = credentials.Certificate(creds_dict)
-                app_options = {'storageBucket': f"{project_id}.appspot.com"}
-                firebase_admin.initialize_app(cred, app_options)
-
-            except Exception as e_secret:
-                # Se o Secret Manager falhar (por exemplo, ao correr localmente)
-                st.warning(f"Não foi possível carregar as credenciais do Secret Manager ({e_secret}). A tentar usar as credenciais padrão do ambiente (ADC).")
-                try:
-                    cred = credentials.ApplicationDefault()
-                    app_options = {'storageBucket': f"{project_id}.appspot.com", 'projectId': project_id}
-                    firebase_admin.initialize_app(cred, app_options)
-                except Exception as e_default:
-                     st.error(f"Falha na inicialização padrão do Firebase. Certifique-se de que está autenticado se estiver a correr localmente. Erro: {e_default}")
-                     return None, None
-
-        db_client = firestore.client()
-        bucket_name = storage.bucket().name
-        
-        return db_client, bucket_name
+        return {entrada.nome: entrada for entrada in obter_catalogo_colecoes().listar(db_client, user_id)}
     except Exception as e:
-        st.error(f"ERRO: Falha crítica ao inicializar os serviços. Detalhes: {e}")
-        return None, None
+        st.error(f"Erro ao listar coleções do Firebase: {e}")
+        return {}
 
 def listar_colecoes_salvas(db_client, user_id):
-    if not db_client or not user_id: return []
+    return list(catalogo_colecoes(db_client, user_id))
+
+def _ref_colecao(db_client, user_id, nome_colecao):
+    return db_client.collection('users').document(user_id).collection('ia_collections').document(nome_colecao)
+
+def _gravar_vector_store(vector_store, pasta):
+    """Grava o vector store numa pasta local, no formato de coleção sem pickle."""
+    guardar_colecao(vector_store, pasta)
+
+def _ler_vector_store(pasta, embeddings_obj):
+    """
+    Lê uma pasta descarregada do Storage. O formato atual é aberto com mmap;
+    coleções antigas (save_local do LangChain) exigem pickle e podem ser recusadas.
+    """
+    if e_formato_colecao(pasta):
+        return abrir_colecao(pasta, embeddings_obj)
+    if not PERMITIR_PICKLE_LEGADO:
+        raise ValueError("Coleção no formato antigo (pickle), desativado por CONTRATIA_PERMITIR_PICKLE_LEGADO=0.")
+    faiss_index_path = Path(pasta) / "faiss_index"
+    if not faiss_index_path.exists():
+        # Tolerante a zips com uma pasta intermédia
+        faiss_index_path = next(Path(pasta).rglob("index.faiss")).parent
+    vector_store = FAISS.load_local(
+        str(faiss_index_path), 
+        embeddings=embeddings_obj, 
+        allow_dangerous_deserialization=True
+    )
+    indice = IndiceDocumentos.carregar(faiss_index_path)
+    if indice is not None:
+        anexar_indice(vector_store, indice)
+    return vector_store
+
+def _enviar_pasta(pasta, prefixo):
+    """Envia uma pasta em shards paralelos para '{prefixo}/' e devolve o caminho do manifest e os bytes enviados."""
+    return enviar_pasta_em_shards(obter_bucket(), pasta, prefixo)
+
+def _descarregar_pasta(caminho, destino):
+    """
+    Reconstrói em 'destino' a pasta guardada em 'caminho'. Coleções antigas
+    foram enviadas como um único zip; as atuais como shards com manifest.
+    """
+    if not caminho.endswith(".zip"):
+        descarregar_pasta_em_shards(obter_bucket(), caminho, destino)
+        return
+    zip_path_temp = Path(destino) / "colecao.zip"
+    with etapa("storage_download", ficheiros=1) as atual:
+        obter_bucket().blob(caminho).download_to_filename(str(zip_path_temp))
+        atual.definir(bytes=zip_path_temp.stat().st_size)
+    contar("bytes_transferidos_total", zip_path_temp.stat().st_size, direcao="download")
+    with zipfile.ZipFile(zip_path_temp, 'r') as zip_ref:
+        zip_ref.extractall(destino)
+    zip_path_temp.unlink()
+
+def _apagar_pasta_enviada(caminho):
+    """Apaga do Storage uma pasta enviada (zip antigo ou shards). Falhas são ignoradas."""
     try:
-        colecoes_ref = db_client.collection('users').document(user_id).collection('ia_collections').stream()
-        return [doc.id for doc in colecoes_ref]
-    except Exception as e:
-        st.error(f"Erro ao listar coleções do Firebase: {e}")
-        return []
+        if caminho.endswith(".zip"):
+            obter_bucket().blob(caminho).delete()
+        else:
+            apagar_prefixo(obter_bucket(), prefixo_do_manifest(caminho))
+    except Exception:
+        pass
 
+@etapa("salvar_colecao")
 def salvar_colecao_atual(db_client, user_id, nome_colecao, vector_store_atual, nomes_arquivos_atuais):
     if not user_id:
         st.error("Utilizador não identificado. Não é possível salvar a coleção.")
@@ -75,69 +109,285 @@ def salvar_colecao_atual(db_client, user_id, nome_colecao, vector_store_atual, n
     with st.spinner(f"Salvando coleção '{nome_colecao}'..."):
         with tempfile.TemporaryDirectory() as temp_dir:
             try:
-                faiss_path = Path(temp_dir) / "faiss_index"
-                vector_store_atual.save_local(str(faiss_path))
-                zip_path_temp = Path(tempfile.gettempdir()) / f"{nome_colecao}.zip"
-                with zipfile.ZipFile(zip_path_temp, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for root, _, files in os.walk(faiss_path):
-                        for file in files:
-                            full_path = Path(root) / file
-                            relative_path = full_path.relative_to(Path(temp_dir))
-                            zipf.write(full_path, arcname=relative_path)
-                bucket = storage.bucket()
-                blob_path = f"user_collections/{user_id}/{nome_colecao}.zip"
-                blob = bucket.blob(blob_path)
-                blob.upload_from_filename(str(zip_path_temp))
-                doc_ref = db_client.collection('users').document(user_id).collection('ia_collections').document(nome_colecao)
-                doc_ref.set({
+                ref = _ref_colecao(db_client, user_id, nome_colecao)
+                anterior = ref.get()
+                dados_anteriores = anterior.to_dict() if anterior.exists else {}
+                caminho_anterior = dados_anteriores.get('storage_path')
+                # Os blobs dos deltas deixam de ser referidos quando a coleção é regravada
+                deltas_anteriores = [d['storage_path'] for d in dados_anteriores.get('deltas') or [] if d.get('storage_path')]
+                with etapa("gravar_indice_local", fragmentos=vector_store_atual.index.ntotal):
+                    # Uma coleção que cresceu com deltas pode passar aqui a um índice aproximado. A conversão
+                    # é feita numa cópia rasa: o vector store da sessão pode estar partilhado com outras
+                    vector_store_atual = copy.copy(vector_store_atual)
+                    converter_indice(vector_store_atual)
+                    _gravar_vector_store(vector_store_atual, temp_dir)
+                # Cada gravação vai para um prefixo novo: quem está a ler a versão anterior não é afetado
+                prefixo = f"user_collections/{user_id}/{nome_colecao}/base-{uuid.uuid4().hex}"
+                storage_path, bytes_enviados = _enviar_pasta(temp_dir, prefixo)
+                ref.set({
                     'nomes_arquivos': nomes_arquivos_atuais,
-                    'storage_path': blob_path,
+                    'storage_path': storage_path,
+                    'deltas': [],
+                    'indice': descrever_indice(vector_store_atual.index),
+                    # Desnormalizadas para o catálogo, que não lê as listas acima
+                    'estatisticas': estatisticas_colecao(len(nomes_arquivos_atuais), vector_store_atual.index.ntotal,
+                                                         bytes_enviados),
                     'created_at': firestore.SERVER_TIMESTAMP
                 })
-                os.remove(zip_path_temp)
+                obter_catalogo_colecoes().invalidar(user_id)
+                if caminho_anterior and caminho_anterior != storage_path:
+                    _apagar_pasta_enviada(caminho_anterior)
+                for caminho in deltas_anteriores:
+                    _apagar_pasta_enviada(caminho)
                 st.success(f"Coleção '{nome_colecao}' salva com sucesso!")
                 return True
             except Exception as e:
                 st.error(f"Erro ao salvar coleção no Firebase: {e}")
                 return False
 
+def _aplicar_deltas(vector_store, deltas, embeddings_obj, cache):
+    """
+    Aplica, por ordem, as alterações guardadas depois do índice base:
+    'adicao' funde um índice FAISS pequeno; 'remocao' apaga os vetores de uma fonte.
+    """
+    indice = obter_indice(vector_store)
+    for delta in deltas:
+        if delta.get('tipo') == 'adicao':
+            # Os blobs de delta nunca são reescritos: o caminho identifica o conteúdo
+            caminho = delta['storage_path']
+            pasta_delta = cache.pasta_para(caminho, "imutavel", lambda destino: _descarregar_pasta(caminho, destino))
+            vs_delta = _ler_vector_store(pasta_delta, embeddings_obj)
+            fundir_vector_stores(vector_store, vs_delta)
+            indice.fundir(obter_indice(vs_delta))
+        elif delta.get('tipo') == 'remocao':
+            ids = remover_fonte_da_colecao(vector_store, delta['fonte'])
+            if ids:
+                apagar_vetores(vector_store, ids)
+    return vector_store
+
+@etapa("abrir_colecao")
+def _abrir_colecao(db_client, embeddings_obj, user_id, nome_colecao):
+    """
+    Abre uma coleção através do cache local. Se o blob base (pela sua geração) e a
+    lista de deltas não mudaram, devolve o vector store já aberto; senão reutiliza
+    as pastas em disco e só descarrega o que falta. Não usa o Streamlit.
+    Devolve (vector_store, nomes_arquivos, origem), ou None se a coleção não existir.
+    """
+    doc = _ref_colecao(db_client, user_id, nome_colecao).get()
+    if not doc.exists:
+        return None
+    metadata = doc.to_dict()
+    storage_path = metadata.get('storage_path')
+    nomes_arquivos = metadata.get('nomes_arquivos')
+    deltas = metadata.get('deltas') or []
+
+    cache = obter_cache_colecoes()
+    blob = obter_bucket().get_blob(storage_path)
+    if blob is None:
+        raise FileNotFoundError(f"Blob '{storage_path}' não encontrado no Storage.")
+    geracao = blob.generation or blob.etag
+    chave = (storage_path, geracao, json.dumps(deltas, sort_keys=True, default=str))
+
+    em_memoria = cache.obter_em_memoria(chave)
+    contar_cache("colecoes_memoria", em_memoria is not None)
+    if em_memoria is not None:
+        etapa_atual().definir(colecao=nome_colecao, origem="memoria")
+        return em_memoria[0], nomes_arquivos, "memoria"
+
+    hits_disco = cache.metricas["hits_disco"]
+    pasta = cache.pasta_para(storage_path, geracao, lambda destino: _descarregar_pasta(storage_path, destino))
+    origem = "disco" if cache.metricas["hits_disco"] > hits_disco else "storage"
+    contar_cache("colecoes_disco", origem == "disco")
+    etapa_atual().definir(colecao=nome_colecao, origem=origem, deltas=len(deltas))
+    with etapa("ler_indice"):
+        vector_store = _ler_vector_store(pasta, embeddings_obj)
+    if deltas:
+        with etapa("aplicar_deltas", deltas=len(deltas)):
+            _aplicar_deltas(vector_store, deltas, embeddings_obj, cache)
+    definir_impressao_base(vector_store, *chave)
+    pasta_mapeada = pasta if isinstance(vector_store, FAISSPreguicoso) and not deltas else None
+    cache.guardar_em_memoria(chave, vector_store, nomes_arquivos, tamanho_estimado_vector_store(vector_store, pasta_mapeada))
+    return vector_store, nomes_arquivos, origem
+
 def carregar_colecao(_db_client, _embeddings_obj, user_id, nome_colecao):
     if not user_id:
         st.error("Utilizador não identificado. Não é possível carregar a coleção.")
         return None, None
     try:
-        doc_ref = _db_client.collection('users').document(user_id).collection('ia_collections').document(nome_colecao)
-        doc = doc_ref.get()
-        if not doc.exists:
+        with st.spinner(f"A abrir a coleção '{nome_colecao}'..."):
+            resultado = _abrir_colecao(_db_client, _embeddings_obj, user_id, nome_colecao)
+        if resultado is None:
             st.error(f"Coleção '{nome_colecao}' não encontrada.")
             return None, None
+        vector_store, nomes_arquivos, origem = resultado
+        if origem == "storage":
+            st.info(f"Índice de '{nome_colecao}' descarregado do Storage.")
         
-        metadata = doc.to_dict()
-        storage_path = metadata.get('storage_path')
-        nomes_arquivos = metadata.get('nomes_arquivos')
+        st.success(f"Coleção '{nome_colecao}' carregada com sucesso!")
+        return vector_store, nomes_arquivos
+    except Exception as e:
+        st.error(f"Erro ao carregar coleção '{nome_colecao}': {e}")
+        return None, None
 
-        bucket = storage.bucket()
-        blob = bucket.blob(storage_path)
+def carregar_colecoes_federadas(db_client, embeddings_obj, user_id, nomes_colecoes):
+    """
+    Abre várias coleções em paralelo (cada uma pelo cache local) para uma pesquisa
+    federada. Coleções que falhem são assinaladas e deixadas de fora.
+    Devolve (ColecoesFederadas, nomes dos ficheiros como 'coleção / ficheiro') ou (None, None).
+    """
+    if not user_id:
+        st.error("Utilizador não identificado. Não é possível carregar as coleções.")
+        return None, None
+    with st.spinner(f"A abrir {len(nomes_colecoes)} coleção(ões)..."):
+        saidas = mapear_concorrente(lambda nome: _abrir_colecao(db_client, embeddings_obj, user_id, nome),
+                                    nomes_colecoes, FEDERADA_MAX_CONCORRENCIA)
+    colecoes, nomes_arquivos = {}, []
+    for nome, (resultado, erro) in zip(nomes_colecoes, saidas):
+        if erro is not None or resultado is None:
+            st.warning(f"Coleção '{nome}' ignorada: {erro or 'não encontrada'}.")
+            continue
+        vector_store, nomes, _ = resultado
+        colecoes[nome] = vector_store
+        nomes_arquivos.extend(f"{nome} / {arquivo}" for arquivo in nomes or [])
+    if not colecoes:
+        st.error("Nenhuma das coleções escolhidas pôde ser carregada.")
+        return None, None
+    try:
+        federadas = ColecoesFederadas(colecoes)
+    except ValueError as e:
+        st.error(str(e))
+        return None, None
+    st.success(f"{len(colecoes)} coleção(ões) prontas para pesquisa conjunta.")
+    return federadas, nomes_arquivos
+
+def preaquecer_colecoes(db_client, embeddings_obj, user_id, limite=COLECOES_PREAQUECER):
+    """
+    Abre em segundo plano as 'limite' coleções mais recentes do utilizador, para que
+    o primeiro carregamento já as encontre no cache local. Devolve a thread iniciada.
+    """
+    if not db_client or not user_id or limite <= 0:
+        return None
+
+    def _preaquecer():
+        try:
+            # O catálogo já é lido para a barra lateral: escolher as recentes não custa outra consulta
+            entradas = [e for e in obter_catalogo_colecoes().listar(db_client, user_id) if e.created_at is not None]
+            recentes = sorted(entradas, key=lambda e: e.created_at, reverse=True)[:limite]
+            for entrada in recentes:
+                try:
+                    _abrir_colecao(db_client, embeddings_obj, user_id, entrada.nome)
+                except Exception:
+                    continue
+        except Exception:
+            pass
 
+    thread = threading.Thread(target=em_contexto(_preaquecer), daemon=True, name=f"preaquecer-{user_id}")
+    thread.start()
+    return thread
+
+def _copia_para_alterar(vector_store):
+    """
+    Cópia privada do vector store carregado, sobre a qual se faz a alteração. O original
+    pode estar a ser pesquisado por outras sessões (vem do cache em memória) e não muda;
+    a cópia ganha uma impressão digital própria. Quem a recebe publica-a com
+    RegistoVectorStores.substituir.
+    """
+    copia = copiar_vector_store(vector_store)
+    registar_alteracao(copia)
+    return copia
+
+@etapa("adicionar_documentos")
+def adicionar_documentos_a_colecao(db_client, embeddings_obj, user_id, nome_colecao, vector_store, nomes_arquivos, novos_arquivos_pdf):
+    """
+    Acrescenta PDFs a uma coleção já carregada. Só os fragmentos novos são embebidos;
+    o índice FAISS desses fragmentos é guardado como um delta, sem reenviar a coleção.
+    Devolve (vector store alterado, lista de ficheiros atualizada), ou None em caso de erro;
+    o vector store recebido não é alterado.
+    """
+    from pdf_processing import obter_vector_store_de_uploads
+
+    if not user_id:
+        st.error("Utilizador não identificado. Não é possível atualizar a coleção.")
+        return None
+    novos = [a for a in novos_arquivos_pdf if a.name not in nomes_arquivos]
+    for arquivo in novos_arquivos_pdf:
+        if arquivo.name in nomes_arquivos:
+            st.warning(f"'{arquivo.name}' já faz parte da coleção e foi ignorado. Remova-o primeiro para o substituir.")
+    if not novos:
+        return vector_store, nomes_arquivos
+
+    vs_delta, nomes_novos = obter_vector_store_de_uploads(novos, embeddings_obj)
+    if not vs_delta or not nomes_novos:
+        return None
+    with st.spinner(f"A atualizar a coleção '{nome_colecao}'..."):
         with tempfile.TemporaryDirectory() as temp_dir:
-            zip_path_temp = Path(temp_dir) / "colecao.zip"
-            st.info(f"Baixando índice de '{nome_colecao}'...")
-            blob.download_to_filename(str(zip_path_temp))
-
-            unzip_path = Path(temp_dir) / "unzipped"
-            unzip_path.mkdir()
-            with zipfile.ZipFile(zip_path_temp, 'r') as zip_ref:
-                zip_ref.extractall(unzip_path)
-            
-            faiss_index_path = unzip_path / "unzipped" / "faiss_index" # Path fix
-            vector_store = FAISS.load_local(
-                str(faiss_index_path), 
-                embeddings=_embeddings_obj, 
-                allow_dangerous_deserialization=True
-            )
-            
-            st.success(f"Coleção '{nome_colecao}' carregada com sucesso!")
-            return vector_store, nomes_arquivos
+            try:
+                # Gravado antes da fusão: o merge_from do FAISS esvazia o índice do delta
+                _gravar_vector_store(vs_delta, temp_dir)
+                # Um delta que não se funda localmente também falharia em cada _aplicar_deltas:
+                # só chega ao Firestore depois de fundido aqui
+                vector_store = _copia_para_alterar(vector_store)
+                fundir_vector_stores(vector_store, vs_delta)
+                obter_indice(vector_store).fundir(obter_indice(vs_delta))
+            except Exception as e:
+                st.error(f"Erro ao juntar os novos documentos à coleção '{nome_colecao}': {e}")
+                return None
+            try:
+                prefixo = f"user_collections/{user_id}/{nome_colecao}/deltas/{uuid.uuid4().hex}"
+                blob_path, bytes_enviados = _enviar_pasta(temp_dir, prefixo)
+                _ref_colecao(db_client, user_id, nome_colecao).update({
+                    'deltas': firestore.ArrayUnion([{'tipo': 'adicao', 'storage_path': blob_path, 'fontes': nomes_novos}]),
+                    'nomes_arquivos': firestore.ArrayUnion(nomes_novos),
+                    'estatisticas.num_documentos': len(nomes_arquivos) + len(nomes_novos),
+                    'estatisticas.num_fragmentos': vector_store.index.ntotal,
+                    'estatisticas.bytes': firestore.Increment(bytes_enviados),
+                    'updated_at': firestore.SERVER_TIMESTAMP
+                })
+            except Exception as e:
+                st.error(f"Erro ao atualizar a coleção '{nome_colecao}': {e}")
+                return None
+            finally:
+                obter_catalogo_colecoes().invalidar(user_id)
+    st.success(f"{len(nomes_novos)} documento(s) adicionado(s) à coleção '{nome_colecao}'.")
+    return vector_store, nomes_arquivos + nomes_novos
+
+@etapa("remover_documento")
+def remover_documento_da_colecao(db_client, user_id, nome_colecao, vector_store, nomes_arquivos, nome_arquivo):
+    """
+    Remove um ficheiro de uma coleção carregada: apaga os seus vetores pelo id
+    e regista a remoção como um delta no Firestore, sem reenviar o índice.
+    Devolve (vector store alterado, lista de ficheiros atualizada), ou None em caso de erro;
+    o vector store recebido não é alterado.
+    """
+    if not user_id:
+        st.error("Utilizador não identificado. Não é possível atualizar a coleção.")
+        return None
+    vector_store = _copia_para_alterar(vector_store)
+    ids = remover_fonte_da_colecao(vector_store, nome_arquivo)
+    if ids:
+        apagar_vetores(vector_store, ids)
+    nomes_restantes = [n for n in nomes_arquivos if n != nome_arquivo]
+    try:
+        _ref_colecao(db_client, user_id, nome_colecao).update({
+            'deltas': firestore.ArrayUnion([{'tipo': 'remocao', 'fonte': nome_arquivo, 'id': uuid.uuid4().hex}]),
+            'nomes_arquivos': firestore.ArrayRemove([nome_arquivo]),
+            # Os fragmentos deduplicados partilhados com outros ficheiros ficam na coleção
+            'estatisticas.num_documentos': len(nomes_restantes),
+            'estatisticas.num_fragmentos': vector_store.index.ntotal,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
     except Exception as e:
-        st.error(f"Erro ao carregar coleção '{nome_colecao}': {e}")
-        return None, None
+        st.error(f"Erro ao remover '{nome_arquivo}' da coleção '{nome_colecao}': {e}")
+        return None
+    finally:
+        obter_catalogo_colecoes().invalidar(user_id)
+    st.success(f"'{nome_arquivo}' removido da coleção '{nome_colecao}'.")
+    return vector_store, nomes_restantes
+
+def compactar_colecao(db_client, user_id, nome_colecao, vector_store, nomes_arquivos):
+    """
+    Regrava a coleção inteira como um novo índice base e descarta os deltas
+    (salvar_colecao_atual apaga os blobs dos deltas e o índice base anterior).
+    Útil quando a lista de deltas cresce e o carregamento fica mais lento.
+    """
+    return salvar_colecao_atual(db_client, user_id, nome_colecao, vector_store, nomes_arquivos)
@@ -0,0 +1,94 @@
+# ingest_cache.py
+"""
+Cache de ingestão endereçado pelo conteúdo: para cada PDF (SHA-256 dos bytes)
+e configuração de extração, guarda o texto das páginas, os fragmentos e os
+respetivos embeddings, para que documentos já conhecidos não voltem a passar
+por extração, OCR e embedding.
+"""
+import base64
+import hashlib
+import json
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from cache_store import CacheSQLite
+from config import CACHE_DIR, INGESTAO_CACHE_MAX_BYTES
+
+# Incrementar quando o formato das entradas ou a lógica de extração mudar
+VERSAO_CACHE_INGESTAO = 1
+
+
+def hash_pdf(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def chave_ingestao(pdf_bytes, configuracao):
+    """Chave da entrada: hash do PDF + hash das definições de extração/divisão/embedding."""
+    definicoes = json.dumps({"versao": VERSAO_CACHE_INGESTAO, **configuracao}, sort_keys=True)
+    return f"{hash_pdf(pdf_bytes)}:{hashlib.sha256(definicoes.encode('utf-8')).hexdigest()[:16]}"
+
+
+class EntradaIngestao:
+    """Resultado da ingestão de um PDF: páginas, fragmentos e embeddings dos fragmentos."""
+
+    def __init__(self, paginas, fragmentos, vetores):
+        self.paginas = paginas          # lista de (page_content, metadata)
+        self.fragmentos = fragmentos    # lista de (page_content, metadata)
+        self.vetores = vetores          # np.ndarray float32 (n_fragmentos, dim)
+
+    def para_bytes(self):
+        vetores = np.asarray(self.vetores, dtype=np.float32)
+        dados = {
+            "paginas": self.paginas,
+            "fragmentos": self.fragmentos,
+            "dim": int(vetores.shape[1]) if vetores.size else 0,
+            "vetores": base64.b64encode(vetores.tobytes()).decode("ascii"),
+        }
+        return zlib.compress(json.dumps(dados, ensure_ascii=False).encode("utf-8"))
+
+    @classmethod
+    def de_bytes(cls, valor):
+        dados = json.loads(zlib.decompress(valor).decode("utf-8"))
+        vetores = np.frombuffer(base64.b64decode(dados["vetores"]), dtype=np.float32)
+        if dados["dim"]:
+            vetores = vetores.reshape(-1, dados["dim"])
+        return cls([tuple(p) for p in dados["paginas"]], [tuple(f) for f in dados["fragmentos"]], vetores)
+
+
+class CacheIngestao:
+    """Cache persistente de ingestões, com contadores de hits/misses e remoção LRU por tamanho."""
+
+    def __init__(self, caminho=None, max_bytes=INGESTAO_CACHE_MAX_BYTES):
+        self._cache = CacheSQLite(caminho or Path(CACHE_DIR) / "ingestao.sqlite", max_bytes)
+
+    def obter(self, pdf_bytes, configuracao):
+        valor = self._cache.obter(chave_ingestao(pdf_bytes, configuracao))
+        if valor is None:
+            return None
+        try:
+            return EntradaIngestao.de_bytes(valor)
+        except Exception:
+            # Entrada corrompida: trata como miss
+            return None
+
+    def guardar(self, pdf_bytes, configuracao, entrada):
+        self._cache.guardar(chave_ingestao(pdf_bytes, configuracao), entrada.para_bytes())
+
+    def estatisticas(self):
+        return self._cache.estatisticas()
+
+
+_cache_ingestao = None
+_cache_ingestao_lock = threading.Lock()
+
+
+def obter_cache_ingestao():
+    """Instância única por processo do cache de ingestão."""
+    global _cache_ingestao
+    with _cache_ingestao_lock:
+        if _cache_ingestao is None:
+            _cache_ingestao = CacheIngestao()
+        return _cache_ingestao
@@ -0,0 +1,201 @@
+# job_queue.py
+"""
+Trabalhos longos (Dashboard, Prazos, Riscos) executados fora da thread do script
+do Streamlit.
+
+Um rerun, uma mudança de aba ou a perda do websocket já não interrompem nem
+deitam fora uma análise: o botão submete o trabalho a um pool de workers do
+processo e a página limita-se a consultar o progresso. O estado, o progresso,
+os resultados parciais e o resultado final ficam numa tabela SQLite, pelo que
+o resultado pode ser lido mais tarde, noutra sessão.
+
+Cada trabalho tem uma chave (tipo, impressão da coleção e parâmetros): submeter
+de novo a mesma chave devolve o trabalho que já está em fila, em curso ou
+concluído, em vez de o repetir. O caminho ":memory:" dá uma fila local sem
+ficheiro, útil em testes.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from config import CACHE_DIR, TRABALHOS_NUM_WORKERS, TRABALHOS_RETENCAO_SEGUNDOS
+from telemetry import em_contexto
+
+ESTADOS_ATIVOS = ("pendente", "em_curso")
+ESTADOS_FINAIS = ("concluido", "falhou", "interrompido")
+
+_COLUNAS = ("id", "tipo", "chave", "descricao", "estado", "progresso", "mensagem", "parciais", "avisos",
+            "resultado", "erro", "pid", "criado_em", "iniciado_em", "terminado_em")
+_COLUNAS_JSON = ("parciais", "avisos", "resultado")
+
+
+def chave_trabalho(tipo, impressao, **parametros):
+    """Chave de deduplicação: o mesmo tipo de trabalho sobre o mesmo conteúdo e parâmetros."""
+    return hashlib.sha256(json.dumps([tipo, impressao, parametros], sort_keys=True, default=str)
+                          .encode("utf-8")).hexdigest()
+
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ContextoTrabalho:
+    """Passado à função do trabalho para publicar o progresso, resultados parciais e avisos."""
+
+    def __init__(self, fila, id_trabalho):
+        self._fila = fila
+        self.id = id_trabalho
+        self._parciais = []
+        self._avisos = []
+
+    def progresso(self, fracao, mensagem=None):
+        self._fila._atualizar(self.id, progresso=min(1.0, max(0.0, float(fracao))), mensagem=mensagem)
+
+    def parcial(self, itens):
+        """Acrescenta itens aos resultados parciais (ex.: linhas do Dashboard já extraídas)."""
+        self._parciais.extend(itens)
+        self._fila._atualizar(self.id, parciais=json.dumps(self._parciais, default=str))
+
+    def aviso(self, mensagem):
+        """Problema que não faz falhar o trabalho (ex.: um ficheiro que não foi processado)."""
+        self._avisos.append(mensagem)
+        self._fila._atualizar(self.id, avisos=json.dumps(self._avisos, default=str))
+
+
+class FilaTrabalhos:
+    """
+    Fila de trabalhos com um pool de 'num_workers' threads e estado em SQLite.
+    A função de cada trabalho recebe um ContextoTrabalho e devolve um resultado
+    serializável em JSON. Não usa o Streamlit.
+    """
+
+    def __init__(self, caminho, num_workers=TRABALHOS_NUM_WORKERS, retencao_segundos=TRABALHOS_RETENCAO_SEGUNDOS):
+        if str(caminho) != ":memory:":
+            Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        self.retencao_segundos = retencao_segundos
+        self._executor = ThreadPoolExecutor(max_workers=max(1, num_workers), thread_name_prefix="trabalho")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(caminho), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trabalhos ("
+            " id TEXT PRIMARY KEY, tipo TEXT NOT NULL, chave TEXT NOT NULL, descricao TEXT,"
+            " estado TEXT NOT NULL, progresso REAL NOT NULL DEFAULT 0, mensagem TEXT,"
+            " parciais TEXT, avisos TEXT, resultado TEXT, erro TEXT, pid INTEGER,"
+            " criado_em REAL NOT NULL, iniciado_em REAL, terminado_em REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trabalhos_chave ON trabalhos (chave, criado_em)")
+        self._conn.commit()
+
+    def _atualizar(self, id_trabalho, **campos):
+        campos = {k: v for k, v in campos.items() if v is not None}
+        if not campos:
+            return
+        with self._lock:
+            self._conn.execute(f"UPDATE trabalhos SET {', '.join(f'{k} = ?' for k in campos)} WHERE id = ?",
+                               (*campos.values(), id_trabalho))
+            self._conn.commit()
+
+    def _linha_para_dict(self, linha):
+        trabalho = dict(zip(_COLUNAS, linha))
+        for coluna in _COLUNAS_JSON:
+            trabalho[coluna] = json.loads(trabalho[coluna]) if trabalho[coluna] else None
+        trabalho["parciais"] = trabalho["parciais"] or []
+        trabalho["avisos"] = trabalho["avisos"] or []
+        return trabalho
+
+    def _verificar_orfao(self, trabalho):
+        """Um trabalho ativo cujo processo já terminou (reinício do servidor) nunca vai acabar."""
+        if trabalho["estado"] in ESTADOS_ATIVOS and trabalho["pid"] != os.getpid() and not _processo_vivo(trabalho["pid"]):
+            self._atualizar(trabalho["id"], estado="interrompido", terminado_em=time.time(),
+                            erro="O processo que executava o trabalho terminou.")
+            trabalho.update(estado="interrompido", erro="O processo que executava o trabalho terminou.")
+        return trabalho
+
+    def obter(self, id_trabalho):
+        """Estado, progresso e resultado de um trabalho (dicionário), ou None."""
+        with self._lock:
+            linha = self._conn.execute(f"SELECT {', '.join(_COLUNAS)} FROM trabalhos WHERE id = ?",
+                                       (id_trabalho,)).fetchone()
+        return self._verificar_orfao(self._linha_para_dict(linha)) if linha else None
+
+    def ultimo_da_chave(self, chave):
+        """O trabalho mais recente com esta chave (em qualquer estado), ou None."""
+        with self._lock:
+            linha = self._conn.execute(
+                f"SELECT {', '.join(_COLUNAS)} FROM trabalhos WHERE chave = ? ORDER BY criado_em DESC LIMIT 1",
+                (chave,)).fetchone()
+        return self._verificar_orfao(self._linha_para_dict(linha)) if linha else None
+
+    def submeter(self, tipo, chave, funcao, *args, descricao="", refazer=False, **kwargs):
+        """
+        Põe 'funcao(contexto, *args, **kwargs)' na fila e devolve o id do trabalho.
+        Se já houver um trabalho com a mesma chave em fila ou em curso, devolve esse;
+        um concluído também é devolvido, a menos que 'refazer' seja pedido.
+        """
+        self._limpar_antigos()
+        existente = self.ultimo_da_chave(chave)
+        if existente is not None and (existente["estado"] in ESTADOS_ATIVOS
+                                      or (existente["estado"] == "concluido" and not refazer)):
+            return existente["id"]
+        id_trabalho = uuid.uuid4().hex
+        with self._lock:
+            # Verificação e inserção sob o mesmo lock: dois cliques seguidos não criam dois trabalhos
+            ativo = self._conn.execute(
+                f"SELECT id FROM trabalhos WHERE chave = ? AND estado IN ({', '.join('?' * len(ESTADOS_ATIVOS))})"
+                " AND pid = ? LIMIT 1", (chave, *ESTADOS_ATIVOS, os.getpid())).fetchone()
+            if ativo is not None:
+                return ativo[0]
+            self._conn.execute(
+                "INSERT INTO trabalhos (id, tipo, chave, descricao, estado, progresso, pid, criado_em)"
+                " VALUES (?, ?, ?, ?, 'pendente', 0, ?, ?)",
+                (id_trabalho, tipo, chave, descricao, os.getpid(), time.time()))
+            self._conn.commit()
+        # O trabalho fica no traço da sessão que o submeteu
+        self._executor.submit(em_contexto(self._executar), id_trabalho, funcao, args, kwargs)
+        return id_trabalho
+
+    def _executar(self, id_trabalho, funcao, args, kwargs):
+        self._atualizar(id_trabalho, estado="em_curso", iniciado_em=time.time())
+        try:
+            resultado = funcao(ContextoTrabalho(self, id_trabalho), *args, **kwargs)
+            # Dentro do try: um resultado que não se serializa (ex.: referência circular) deixaria
+            # o trabalho 'em_curso' para sempre, com o pid vivo e o botão desativado
+            resultado = json.dumps(resultado, default=str)
+        except Exception as e:
+            self._atualizar(id_trabalho, estado="falhou", erro=f"{type(e).__name__}: {e}", terminado_em=time.time())
+            return
+        self._atualizar(id_trabalho, estado="concluido", progresso=1.0, terminado_em=time.time(), resultado=resultado)
+
+    def _limpar_antigos(self):
+        limite = time.time() - self.retencao_segundos
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM trabalhos WHERE estado IN ({', '.join('?' * len(ESTADOS_FINAIS))}) AND terminado_em < ?",
+                (*ESTADOS_FINAIS, limite))
+            self._conn.commit()
+
+
+_fila_trabalhos = None
+_fila_trabalhos_lock = threading.Lock()
+
+
+def obter_fila_trabalhos():
+    """Instância única por processo da fila de trabalhos."""
+    global _fila_trabalhos
+    with _fila_trabalhos_lock:
+        if _fila_trabalhos is None:
+            _fila_trabalhos = FilaTrabalhos(os.path.join(CACHE_DIR, "trabalhos.sqlite3"))
+        return _fila_trabalhos
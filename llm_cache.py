@@ -0,0 +1,175 @@
+# llm_cache.py
+"""
+Cache persistente das respostas do LLM, partilhado entre sessões, processos e,
+com um armazenamento partilhado, entre instâncias do Cloud Run.
+
+A chave de cada resposta combina o modelo, a temperatura, o hash do template do
+prompt e o hash das variáveis com que foi formatado. Voltar a pedir o resumo, a
+análise de riscos ou a conformidade de um contrato que não mudou não chama o LLM.
+
+O armazenamento é qualquer objeto com 'obter(chave)' e 'guardar(chave, valor)'
+(bytes): por omissão um CacheSQLite local, com TTL e remoção LRU por tamanho,
+opcionalmente seguido de uma coleção do Firestore partilhada.
+"""
+import hashlib
+import json
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from cache_store import CacheSQLite
+from concurrency_utils import com_retentativas, erro_transitorio
+from config import CACHE_DIR, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL_SEGUNDOS
+from telemetry import contar, contar_cache, etapa
+
+# Incrementar quando o formato das entradas mudar
+VERSAO_CACHE_LLM = 1
+
+
+def _hash(texto):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def descrever_llm(llm):
+    """Modelo e temperatura de um cliente LLM (ChatGoogleGenerativeAI ou falso)."""
+    return getattr(llm, 'model', type(llm).__name__), getattr(llm, 'temperature', None)
+
+
+def chave_resposta(modelo, temperatura, template, variaveis):
+    """Chave (modelo, temperatura, hash do template, hash das variáveis) de uma resposta."""
+    entradas = json.dumps(variaveis, sort_keys=True, ensure_ascii=False, default=str)
+    return f"v{VERSAO_CACHE_LLM}:{modelo}:{temperatura}:{_hash(template)[:16]}:{_hash(entradas)}"
+
+
+def _template_de(prompt):
+    """Texto do template, incluindo as variáveis parciais (ex.: instruções de formato do parser)."""
+    partes = [prompt.template]
+    for nome, valor in sorted(getattr(prompt, 'partial_variables', {}).items()):
+        partes.append(f"{nome}={valor}")
+    return "\n".join(partes)
+
+
+class ArmazenamentoFirestore:
+    """
+    Armazenamento partilhado numa coleção do Firestore. Cada documento guarda o valor
+    e 'expira_em'; uma política de TTL do Firestore sobre esse campo remove os antigos.
+    """
+
+    def __init__(self, db_client, colecao="llm_cache", ttl_segundos=LLM_CACHE_TTL_SEGUNDOS):
+        self._colecao = db_client.collection(colecao)
+        self.ttl_segundos = ttl_segundos
+
+    def obter(self, chave):
+        doc = self._colecao.document(_hash(chave)).get()
+        if not doc.exists:
+            return None
+        dados = doc.to_dict()
+        if dados.get('expira_em') is not None and dados['expira_em'] < time.time():
+            return None
+        return bytes(dados['valor'])
+
+    def guardar(self, chave, valor):
+        dados = {'valor': valor, 'criado_em': time.time()}
+        if self.ttl_segundos is not None:
+            dados['expira_em'] = time.time() + self.ttl_segundos
+        self._colecao.document(_hash(chave)).set(dados)
+
+
+class CacheRespostasLLM:
+    """
+    Cache de respostas do LLM sobre uma lista de armazenamentos, do mais rápido para o
+    mais lento. Uma resposta encontrada num nível é copiada para os níveis anteriores.
+    """
+
+    def __init__(self, armazenamentos):
+        self.armazenamentos = list(armazenamentos)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        for nivel, armazenamento in enumerate(self.armazenamentos):
+            try:
+                valor = armazenamento.obter(chave)
+            except Exception:
+                # Um armazenamento remoto indisponível não impede a chamada ao LLM
+                continue
+            if valor is None:
+                continue
+            try:
+                resposta = json.loads(zlib.decompress(valor).decode("utf-8"))
+            except Exception:
+                continue
+            for anterior in self.armazenamentos[:nivel]:
+                anterior.guardar(chave, valor)
+            with self._lock:
+                self.hits += 1
+            return resposta
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def guardar(self, chave, resposta):
+        valor = zlib.compress(json.dumps(resposta, ensure_ascii=False).encode("utf-8"))
+        for armazenamento in self.armazenamentos:
+            try:
+                armazenamento.guardar(chave, valor)
+            except Exception:
+                continue
+
+    def adicionar_armazenamento(self, armazenamento):
+        """Acrescenta um nível mais lento (ex.: o Firestore, depois de inicializado)."""
+        if not any(type(a) is type(armazenamento) for a in self.armazenamentos):
+            self.armazenamentos.append(armazenamento)
+
+    def estatisticas(self):
+        estatisticas = {"hits": self.hits, "misses": self.misses}
+        local = self.armazenamentos[0] if self.armazenamentos else None
+        if hasattr(local, 'estatisticas'):
+            estatisticas["local"] = local.estatisticas()
+        return estatisticas
+
+
+def invocar_com_cache(llm, prompt, variaveis, cache=None):
+    """
+    Formata 'prompt' com 'variaveis' e chama o LLM, a menos que a resposta já esteja
+    em cache. Devolve (conteudo, usage_metadata ou {}, veio_do_cache).
+    """
+    cache = cache if cache is not None else obter_cache_llm()
+    modelo, temperatura = descrever_llm(llm)
+    chave = chave_resposta(modelo, temperatura, _template_de(prompt), variaveis)
+    with etapa("llm", modelo=modelo) as atual:
+        em_cache = cache.obter(chave)
+        contar_cache("llm", em_cache is not None)
+        if em_cache is not None:
+            atual.definir(cache=True)
+            return em_cache["conteudo"], em_cache.get("uso") or {}, True
+
+        resposta = com_retentativas(llm.invoke, prompt.format(**variaveis), e_retentavel=erro_transitorio, operacao="llm")
+        conteudo = resposta.content if hasattr(resposta, 'content') else str(resposta)
+        uso = dict(getattr(resposta, 'usage_metadata', None) or {})
+        registar_tokens(modelo, uso)
+        atual.definir(cache=False, tokens_entrada=uso.get("input_tokens", 0), tokens_saida=uso.get("output_tokens", 0))
+        cache.guardar(chave, {"conteudo": conteudo, "uso": uso})
+        return conteudo, uso, False
+
+
+def registar_tokens(modelo, uso):
+    """Soma o usage_metadata de uma resposta às métricas de tokens do modelo."""
+    contar("llm_tokens_total", uso.get("input_tokens", 0), modelo=modelo, tipo="entrada")
+    contar("llm_tokens_total", uso.get("output_tokens", 0), modelo=modelo, tipo="saida")
+
+
+_cache_llm = None
+_cache_llm_lock = threading.Lock()
+
+
+def obter_cache_llm():
+    """Instância única por processo do cache de respostas (SQLite local)."""
+    global _cache_llm
+    with _cache_llm_lock:
+        if _cache_llm is None:
+            local = CacheSQLite(Path(CACHE_DIR) / "llm.sqlite", LLM_CACHE_MAX_BYTES, ttl_segundos=LLM_CACHE_TTL_SEGUNDOS)
+            _cache_llm = CacheRespostasLLM([local])
+        return _cache_llm
@@ -5,22 +5,24 @@ import re
 import time
 from typing import List, Dict
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 from langchain_community.vectorstores import FAISS
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
 from data_models import InfoContrato, ListaDeEventos
+from concurrency_utils import mapear_concorrente
+from config import EXTRACAO_LLM_MAX_CONCORRENCIA, EXTRACAO_MODO
+from context_budget import estimar_tokens, executar_com_orcamento
+from document_index import obter_indice, texto_completo_do_ficheiro
+from llm_cache import invocar_com_cache
+from telemetry import etapa, etapa_atual
+from targeted_extraction import ExtratorDirigido
 
 # --- AS ASSINATURAS DAS FUNÇÕES FORAM SIMPLIFICADAS ---
 # Já não precisam de receber 'api_key' como parâmetro.
 
-@st.cache_data(show_spinner="Extraindo dados detalhados dos contratos...")
-def extrair_dados_dos_contratos(_vector_store, _nomes_arquivos) -> list:
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0)
-    parser = PydanticOutputParser(pydantic_object=InfoContrato)
-
-    prompt = PromptTemplate(
+def _prompt_info_contrato(parser):
+    return PromptTemplate(
         template="""
         Analise o seguinte texto de contrato e extraia as informações solicitadas.
         Se uma informação não for encontrada, use o valor padrão definido no schema.
@@ -31,29 +33,90 @@ def extrair_dados_dos_contratos(_vector_store, _nomes_arquivos) -> list:
         input_variables=["texto_documento", "nome_arquivo"],
         partial_variables={"format_instructions": parser.get_format_instructions()}
     )
-    chain = LLMChain(llm=llm, prompt=prompt)
-    
-    resultados = []
-    for nome in _nomes_arquivos:
-        texto_completo = "\n".join([doc.page_content for doc_id, doc in _vector_store.docstore._dict.items() if doc.metadata.get('source') == nome])
-        if texto_completo:
-            with st.spinner(f"Analisando detalhes de {nome}..."):
-                try:
-                    output = chain.run(texto_documento=texto_completo, nome_arquivo=nome)
-                    parsed_output = parser.parse(output)
-                    # Força o nome do arquivo, pois o LLM pode errar
-                    parsed_output.arquivo_fonte = nome 
-                    resultados.append(parsed_output.dict())
-                except Exception as e:
-                    st.error(f"Erro ao processar o arquivo {nome}: {e}")
-    return resultados
-
-
-@st.cache_data(show_spinner="Gerando resumo executivo...")
-def gerar_resumo_executivo(texto_completo, nome_arquivo) -> str:
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0.3)
-    prompt = PromptTemplate.from_template(
-        """
+
+
+def _progresso_trabalho(contexto, total, rotulo):
+    """Callback ao_concluir de 'mapear_concorrente' que publica o progresso de um trabalho (job_queue)."""
+    contexto.progresso(0.0, f"{rotulo} (0/{total})")
+    concluidos = [0]
+
+    def ao_concluir(nome, erro):
+        concluidos[0] += 1
+        contexto.progresso(concluidos[0] / total, f"{rotulo} ({concluidos[0]}/{total}): {nome}")
+        if erro is not None:
+            contexto.aviso(f"Não foi possível processar '{nome}': {erro}")
+
+    return ao_concluir
+
+
+def extrair_dados_em_paralelo(vector_store, nomes_arquivos, llm, modo=EXTRACAO_MODO,
+                              max_concorrencia=EXTRACAO_LLM_MAX_CONCORRENCIA, ao_concluir=None):
+    """
+    Extrai o InfoContrato de cada ficheiro da coleção com até 'max_concorrencia' pedidos em
+    simultâneo e retentativas por ficheiro. Com modo="dirigido" só os trechos relevantes de
+    cada grupo de campos vão ao modelo (ver targeted_extraction); com "completo", o texto
+    inteiro. 'ao_concluir(nome, dados, erro)' é chamado à medida que cada ficheiro termina.
+    Devolve (lista de dicionários pela ordem dos ficheiros, relatório por ficheiro).
+    Não usa o Streamlit.
+    """
+    parser = PydanticOutputParser(pydantic_object=InfoContrato)
+    prompt = _prompt_info_contrato(parser)
+    obter_indice(vector_store)  # construído aqui, antes de as threads o usarem
+    extrator = ExtratorDirigido(vector_store, llm) if modo == "dirigido" else None
+
+    @etapa("extracao_campos")
+    def _extrair(nome):
+        etapa_atual().definir(ficheiro=nome, modo=modo)
+        if extrator is not None:
+            return extrator.extrair(nome, prompt)
+        inicio = time.perf_counter()
+        texto_completo = texto_completo_do_ficheiro(vector_store, nome)
+        variaveis = {"texto_documento": texto_completo, "nome_arquivo": nome}
+        output, uso, do_cache = invocar_com_cache(llm, prompt, variaveis)
+        parsed_output = parser.parse(output)
+        # Força o nome do arquivo, pois o LLM pode errar
+        parsed_output.arquivo_fonte = nome
+        return parsed_output.dict(), {
+            "arquivo": nome, "modo": "completo", "motivo_texto_completo": None, "semelhanca_minima": None,
+            "tokens_entrada": uso.get("input_tokens", estimar_tokens(prompt.format(**variaveis))),
+            "cache": do_cache, "segundos": round(time.perf_counter() - inicio, 3),
+        }
+
+    def _ao_concluir(i, resultado, erro):
+        if ao_concluir is not None:
+            ao_concluir(nomes_arquivos[i], resultado[0] if resultado else None, erro)
+
+    saidas = mapear_concorrente(_extrair, nomes_arquivos, max_concorrencia, _ao_concluir)
+    resultados = [resultado[0] for resultado, erro in saidas if erro is None]
+    relatorio = [resultado[1] for resultado, erro in saidas if erro is None]
+    return resultados, relatorio
+
+
+@etapa("trabalho_dashboard")
+def trabalho_dashboard(contexto, vector_store, nomes_arquivos):
+    """
+    Trabalho em segundo plano (job_queue) do Dashboard: extrai os dados de todos os ficheiros
+    da coleção em paralelo, publicando cada linha como resultado parcial.
+    Devolve {'dados', 'relatorio'} (tokens e latência de cada ficheiro).
+    """
+    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0)
+    indice = obter_indice(vector_store)
+    nomes = [nome for nome in nomes_arquivos if indice.ids_da_fonte(nome) or indice.paginas_por_fonte.get(nome)]
+    if not nomes:
+        return {"dados": [], "relatorio": []}
+
+    progresso = _progresso_trabalho(contexto, len(nomes), "Extraindo dados detalhados dos contratos")
+
+    def ao_concluir(nome, dados, erro):
+        progresso(nome, erro)
+        if dados is not None:
+            contexto.parcial([dados])
+
+    dados, relatorio = extrair_dados_em_paralelo(vector_store, nomes, llm, ao_concluir=ao_concluir)
+    return {"dados": dados, "relatorio": relatorio}
+
+
+INSTRUCOES_RESUMO = """
         Você é um assistente jurídico especializado em simplificar documentos complexos.
         Crie um resumo executivo claro e conciso (máximo de 5 parágrafos) do seguinte contrato.
         O resumo deve destacar:
@@ -63,30 +126,64 @@ def gerar_resumo_executivo(texto_completo, nome_arquivo) -> str:
         4. O prazo de vigência e condições de rescisão.
         5. Quaisquer obrigações ou responsabilidades críticas para o contratante.
         Responda em português do Brasil.
+"""
 
+PROMPT_RESUMO = PromptTemplate.from_template(
+    INSTRUCOES_RESUMO + """
         Contrato (originado do arquivo {nome_arquivo}):
         ---
         {texto_contrato}
         ---
         Resumo Executivo:
         """
-    )
-    chain = LLMChain(llm=llm, prompt=prompt)
-    resumo = chain.run({"texto_contrato": texto_completo, "nome_arquivo": nome_arquivo})
-    return resumo
+)
 
-# <<< INÍCIO DA CORREÇÃO >>>
-# A função abaixo estava faltando e foi adicionada.
-@st.cache_data(show_spinner="Analisando cláusulas de risco...")
-def analisar_documento_para_riscos(texto_completo: str, nome_arquivo: str) -> str:
-    """
-    Analisa um documento para identificar cláusulas de risco.
+PROMPT_RESUMO_SECAO = PromptTemplate.from_template(
     """
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest", temperature=0.4)
-    prompt = PromptTemplate.from_template(
+        Você é um assistente jurídico. Abaixo está a secção {numero_secao} de {total_secoes} de um contrato
+        (arquivo {nome_arquivo}). Extraia, em tópicos curtos e fiéis ao texto, apenas o que esta secção diz sobre:
+        partes envolvidas, objeto, valores e condições de pagamento, vigência e rescisão,
+        e obrigações ou responsabilidades críticas para o contratante.
+        Mantenha números, datas e nomes exatamente como aparecem. Se a secção não tratar de nenhum destes pontos,
+        responda apenas "Sem informação relevante.".
+
+        Secção do contrato:
+        ---
+        {texto_secao}
+        ---
+        Notas da secção:
         """
-        Você é um advogado especialista em análise de risco contratual.
-        Sua tarefa é ler o contrato abaixo, originado do arquivo '{nome_arquivo}', e identificar potenciais riscos, ambiguidades e cláusulas desfavoráveis para a parte contratante.
+)
+
+PROMPT_RESUMO_FINAL = PromptTemplate.from_template(
+    INSTRUCOES_RESUMO + """
+        O contrato (originado do arquivo {nome_arquivo}) é longo e foi lido por secções.
+        Use as notas de cada secção abaixo, que em conjunto cobrem o contrato inteiro.
+        ---
+        {notas_secoes}
+        ---
+        Resumo Executivo:
+        """
+)
+
+
+def resumo_executivo_com_orcamento(texto_completo, nome_arquivo, llm, llm_map=None):
+    """Resumo executivo dentro do orçamento de contexto. Devolve (resumo, relatorio_de_chamadas)."""
+    return executar_com_orcamento(
+        texto_completo, PROMPT_RESUMO, PROMPT_RESUMO_SECAO, PROMPT_RESUMO_FINAL,
+        llm, llm_map=llm_map, variaveis={"nome_arquivo": nome_arquivo},
+    )
+
+
+@etapa("resumo")
+def gerar_resumo_executivo(texto_completo, nome_arquivo):
+    """Devolve (resumo, relatorio_de_chamadas). As respostas ficam no cache persistente (llm_cache)."""
+    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0.3)
+    with st.spinner("Gerando resumo executivo..."):
+        return resumo_executivo_com_orcamento(texto_completo, nome_arquivo, llm)
+
+
+INSTRUCOES_RISCOS = """
         Organize sua análise nos seguintes tópicos em formato Markdown:
         
         - **🚩 Riscos Financeiros:** (Ex: multas, juros altos, taxas escondidas, ausência de limites de responsabilidade)
@@ -96,27 +193,86 @@ def analisar_documento_para_riscos(texto_completo: str, nome_arquivo: str) -> st
 
         Se não encontrar riscos em uma categoria, indique "Nenhum risco aparente encontrado.".
         Seja objetivo e cite trechos do contrato quando relevante.
+"""
 
+PROMPT_RISCOS = PromptTemplate.from_template(
+    """
+        Você é um advogado especialista em análise de risco contratual.
+        Sua tarefa é ler o contrato abaixo, originado do arquivo '{nome_arquivo}', e identificar potenciais riscos, ambiguidades e cláusulas desfavoráveis para a parte contratante.
+""" + INSTRUCOES_RISCOS + """
         Contrato para Análise:
         ---
         {texto_contrato}
         ---
         Relatório de Análise de Riscos:
         """
+)
+
+PROMPT_RISCOS_SECAO = PromptTemplate.from_template(
+    """
+        Você é um advogado especialista em análise de risco contratual.
+        Abaixo está a secção {numero_secao} de {total_secoes} do contrato do arquivo '{nome_arquivo}'.
+        Liste os riscos financeiros, operacionais e de conformidade, ambiguidades e omissões desfavoráveis
+        para a parte contratante que aparecem NESTA secção, cada um com a categoria e o trecho citado literalmente.
+        Se a secção não tiver riscos, responda apenas "Sem riscos nesta secção.".
+
+        Secção do contrato:
+        ---
+        {texto_secao}
+        ---
+        Riscos da secção:
+        """
+)
+
+PROMPT_RISCOS_FINAL = PromptTemplate.from_template(
+    """
+        Você é um advogado especialista em análise de risco contratual.
+        O contrato do arquivo '{nome_arquivo}' é longo e foi analisado por secções. Abaixo estão os riscos
+        identificados em cada secção, com os trechos citados. Consolide-os num único relatório, eliminando
+        repetições e avaliando também omissões do contrato como um todo.
+""" + INSTRUCOES_RISCOS + """
+        Riscos identificados por secção:
+        ---
+        {notas_secoes}
+        ---
+        Relatório de Análise de Riscos:
+        """
+)
+
+
+def analise_de_riscos_com_orcamento(texto_completo, nome_arquivo, llm, llm_map=None):
+    """Análise de riscos dentro do orçamento de contexto. Devolve (analise, relatorio_de_chamadas)."""
+    return executar_com_orcamento(
+        texto_completo, PROMPT_RISCOS, PROMPT_RISCOS_SECAO, PROMPT_RISCOS_FINAL,
+        llm, llm_map=llm_map, variaveis={"nome_arquivo": nome_arquivo},
     )
-    chain = LLMChain(llm=llm, prompt=prompt)
-    analise = chain.run({"texto_contrato": texto_completo, "nome_arquivo": nome_arquivo})
-    return analise
-# <<< FIM DA CORREÇÃO >>>
 
-@st.cache_data(show_spinner="Extraindo prazos e eventos dos contratos...")
-def extrair_eventos_dos_contratos(documentos: List[Dict[str, str]]) -> list:
+
+@etapa("trabalho_riscos")
+def trabalho_riscos(contexto, vector_store, nome_arquivo):
     """
-    Extrai eventos e datas de uma lista de documentos de texto.
+    Trabalho em segundo plano (job_queue) da análise de cláusulas de risco de um ficheiro.
+    Contratos longos são lidos por secções com o modelo Flash e consolidados com o Pro.
+    Devolve {'nome_arquivo', 'analise', 'relatorio'}. As respostas ficam no cache persistente (llm_cache).
     """
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0)
-    parser = PydanticOutputParser(pydantic_object=ListaDeEventos)
+    contexto.progresso(0.0, f"A preparar o texto de '{nome_arquivo}'")
+    texto_completo = texto_completo_do_ficheiro(vector_store, nome_arquivo)
+    if not texto_completo:
+        raise ValueError(f"Não foi possível reconstruir o texto para análise de riscos do contrato '{nome_arquivo}'.")
+    llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest", temperature=0.4)
+    llm_secoes = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0.2)
+    contexto.progresso(0.1, "Analisando cláusulas de risco")
+    analise, relatorio = analise_de_riscos_com_orcamento(texto_completo, nome_arquivo, llm, llm_map=llm_secoes)
+    return {"nome_arquivo": nome_arquivo, "analise": analise, "relatorio": relatorio}
 
+def extrair_eventos_em_paralelo(documentos, llm, max_concorrencia=EXTRACAO_LLM_MAX_CONCORRENCIA, ao_concluir=None):
+    """
+    Extrai os eventos e prazos de cada documento ({'nome', 'texto'}) em paralelo, com
+    retentativas por ficheiro. 'ao_concluir(nome, eventos, erro)' é chamado à medida que
+    cada ficheiro termina. Devolve a lista plana de eventos, pela ordem dos documentos.
+    Não usa o Streamlit.
+    """
+    parser = PydanticOutputParser(pydantic_object=ListaDeEventos)
     prompt = PromptTemplate(
         template="""
         Analise o texto do contrato abaixo, originado do arquivo '{nome_arquivo}'.
@@ -132,30 +288,54 @@ def extrair_eventos_dos_contratos(documentos: List[Dict[str, str]]) -> list:
         input_variables=["texto_contrato", "nome_arquivo"],
         partial_variables={"format_instructions": parser.get_format_instructions()}
     )
-    chain = LLMChain(llm=llm, prompt=prompt)
-    
-    todos_os_eventos = []
-    for doc in documentos:
-        nome_arquivo = doc['nome']
-        texto = doc['texto']
-        with st.spinner(f"Extraindo eventos de {nome_arquivo}..."):
-            try:
-                output = chain.run(texto_contrato=texto, nome_arquivo=nome_arquivo)
-                parsed_output = parser.parse(output)
-                for evento in parsed_output.eventos:
-                    todos_os_eventos.append({
-                        "arquivo_fonte": parsed_output.arquivo_fonte,
-                        "descricao_evento": evento.descricao_evento,
-                        "data_evento": evento.data_evento_str,
-                        "trecho_relevante": evento.trecho_relevante
-                    })
-            except Exception as e:
-                st.warning(f"Não foi possível extrair eventos de '{nome_arquivo}': {e}")
-                
-    return todos_os_eventos
-
-
-@st.cache_data(show_spinner="Verificando conformidade entre documentos...")
+
+    @etapa("extracao_eventos")
+    def _extrair(doc):
+        etapa_atual().definir(ficheiro=doc['nome'])
+        output, _, _ = invocar_com_cache(llm, prompt, {"texto_contrato": doc['texto'], "nome_arquivo": doc['nome']})
+        parsed_output = parser.parse(output)
+        return [{
+            "arquivo_fonte": parsed_output.arquivo_fonte,
+            "descricao_evento": evento.descricao_evento,
+            "data_evento": evento.data_evento_str,
+            "trecho_relevante": evento.trecho_relevante
+        } for evento in parsed_output.eventos]
+
+    def _ao_concluir(i, eventos, erro):
+        if ao_concluir is not None:
+            ao_concluir(documentos[i]['nome'], eventos, erro)
+
+    saidas = mapear_concorrente(_extrair, documentos, max_concorrencia, _ao_concluir)
+    return [evento for eventos, erro in saidas if erro is None for evento in eventos]
+
+
+@etapa("trabalho_prazos")
+def trabalho_prazos(contexto, vector_store, nomes_arquivos):
+    """
+    Trabalho em segundo plano (job_queue) dos Prazos: reconstrói o texto de cada ficheiro e
+    extrai os eventos e datas em paralelo, publicando os de cada ficheiro como resultado parcial.
+    Devolve a lista de eventos.
+    """
+    documentos = []
+    for i, nome_arquivo in enumerate(nomes_arquivos):
+        contexto.progresso(0.0, f"A reconstruir o texto de '{nome_arquivo}' ({i + 1}/{len(nomes_arquivos)})")
+        texto = texto_completo_do_ficheiro(vector_store, nome_arquivo)
+        if texto:
+            documentos.append({"nome": nome_arquivo, "texto": texto})
+    if not documentos:
+        raise ValueError("Falha ao reconstruir os textos dos documentos da coleção.")
+    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0)
+    progresso = _progresso_trabalho(contexto, len(documentos), "Extraindo prazos e eventos dos contratos")
+
+    def ao_concluir(nome, eventos, erro):
+        progresso(nome, erro)
+        if eventos:
+            contexto.parcial(eventos)
+
+    return extrair_eventos_em_paralelo(documentos, llm, ao_concluir=ao_concluir)
+
+
+@etapa("conformidade")
 def verificar_conformidade_documento(texto_referencia, nome_referencia, texto_analisado, nome_analisado) -> str:
     llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest", temperature=0.2)
     prompt = PromptTemplate.from_template(
@@ -186,16 +366,16 @@ def verificar_conformidade_documento(texto_referencia, nome_referencia, texto_an
         Elabore o Relatório de Conformidade em formato Markdown:
         """
     )
-    chain = LLMChain(llm=llm, prompt=prompt)
-    resultado = chain.run({
-        "nome_referencia": nome_referencia,
-        "nome_analisado": nome_analisado,
-        "texto_referencia": texto_referencia,
-        "texto_analisado": texto_analisado
-    })
+    with st.spinner("Verificando conformidade entre documentos..."):
+        resultado, _, _ = invocar_com_cache(llm, prompt, {
+            "nome_referencia": nome_referencia,
+            "nome_analisado": nome_analisado,
+            "texto_referencia": texto_referencia,
+            "texto_analisado": texto_analisado
+        })
     return resultado
     
-@st.cache_data(show_spinner="Buscando anomalias nos dados...")
+@etapa("anomalias")
 def detectar_anomalias_no_dataframe(df: pd.DataFrame) -> List[str]:
     """
     Analisa um DataFrame de dados de contratos para detectar anomalias usando um LLM.
@@ -226,8 +406,8 @@ def detectar_anomalias_no_dataframe(df: pd.DataFrame) -> List[str]:
         Análise de Anomalias (formato de lista):
         """
     )
-    chain = LLMChain(llm=llm, prompt=prompt)
-    resultado_str = chain.run({"dados_contratos": dados_str})
+    with st.spinner("Buscando anomalias nos dados..."):
+        resultado_str, _, _ = invocar_com_cache(llm, prompt, {"dados_contratos": dados_str})
     
     # Processa o resultado para garantir que é uma lista de strings
     anomalias = [item.strip() for item in resultado_str.split('\n') if item.strip() and item.strip().startswith('-')]
@@ -0,0 +1,25 @@
+# pdf_extraction_worker.py
+"""
+Funções executadas nos processos de trabalho da extração de texto.
+Este módulo importa apenas o PyMuPDF, para que cada processo arranque depressa.
+"""
+import fitz  # PyMuPDF
+
+
+def contar_paginas(pdf_bytes):
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return len(doc)
+
+
+def extrair_paginas(pdf_bytes, inicio, fim):
+    """
+    Extrai o texto das páginas [inicio, fim) de um PDF com get_text("text").
+    Devolve uma lista de (numero_pagina, texto) apenas para páginas com texto.
+    """
+    paginas = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for num_pagina in range(inicio, min(fim, len(doc))):
+            texto = doc.load_page(num_pagina).get_text("text")
+            if texto.strip():
+                paginas.append((num_pagina, texto))
+    return paginas
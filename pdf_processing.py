@@ -5,123 +5,577 @@ import tempfile
 from pathlib import Path
 import fitz  # PyMuPDF
 import base64
+import math
+import multiprocessing
+import queue
+import threading
 import time
+import uuid
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.documents import Document
 
-def _extrair_texto_com_gemini(pdf_bytes, nome_arquivo, llm_vision):
-    """Função auxiliar para extrair texto de um PDF usando Gemini Vision."""
-    documentos_gemini = []
-    texto_extraido = False
+import pdf_extraction_worker
+from concurrency_utils import TokenBucket, com_retentativas
+from chunk_dedup import DeduplicadorFragmentos, referencia
+from config import (
+    DEDUP_ATIVO, DEDUP_BANDAS, DEDUP_LIMIAR_JACCARD, DEDUP_PERMUTACOES,
+    EXTRACAO_NUM_WORKERS, OCR_MAX_CONCORRENCIA, OCR_PEDIDOS_POR_MINUTO,
+    PIPELINE_FRAGMENTOS_POR_LOTE, PIPELINE_TAMANHO_FILA,
+)
+from document_index import IndiceDocumentos, anexar_indice, definir_impressao_base, retirar_fonte_dos_documentos
+from ingest_cache import EntradaIngestao, chave_ingestao, obter_cache_ingestao
+from llm_cache import descrever_llm, registar_tokens
+from telemetry import contar_cache, em_contexto, etapa, etapa_atual
+from vector_index import converter_indice
+
+# Número mínimo de páginas enviadas a cada tarefa do pool de extração
+PAGINAS_MINIMAS_POR_LOTE = 8
+
+_pool_extracao = None
+_pool_extracao_workers = 0
+_pool_extracao_lock = threading.Lock()
+
+def _obter_pool_extracao(num_workers):
+    """Reutiliza o mesmo pool de processos entre execuções do script do Streamlit."""
+    global _pool_extracao, _pool_extracao_workers
+    with _pool_extracao_lock:
+        if _pool_extracao is None or _pool_extracao_workers != num_workers:
+            if _pool_extracao is not None:
+                _pool_extracao.shutdown(wait=False)
+            # 'spawn' evita fazer fork do servidor do Streamlit, que tem várias threads ativas
+            _pool_extracao = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_extracao_workers = num_workers
+        return _pool_extracao
+
+def extrair_textos_pymupdf(arquivos, num_workers=None):
+    """
+    Extrai o texto de vários PDFs com PyMuPDF, dividindo as páginas em lotes
+    distribuídos por um pool de processos.
+
+    'arquivos' é uma lista de (nome_arquivo, pdf_bytes). Devolve um dicionário
+    nome_arquivo -> lista de Documents por ordem de página, igual ao da extração em série.
+    """
+    num_workers = num_workers or EXTRACAO_NUM_WORKERS
+    paginas_por_arquivo = {nome: [] for nome, _ in arquivos}
+
+    if num_workers <= 1:
+        for nome, pdf_bytes in arquivos:
+            paginas_por_arquivo[nome] = pdf_extraction_worker.extrair_paginas(pdf_bytes, 0, pdf_extraction_worker.contar_paginas(pdf_bytes))
+    else:
+        totais = [pdf_extraction_worker.contar_paginas(pdf_bytes) for _, pdf_bytes in arquivos]
+        # Lotes pequenos o suficiente para equilibrar a carga (~4 por worker), sem multiplicar as cópias dos bytes
+        tamanho_lote = max(PAGINAS_MINIMAS_POR_LOTE, math.ceil(sum(totais) / (num_workers * 4)))
+        pool = _obter_pool_extracao(num_workers)
+        tarefas = []
+        for (nome, pdf_bytes), total in zip(arquivos, totais):
+            for inicio in range(0, total, tamanho_lote):
+                tarefas.append((nome, pool.submit(pdf_extraction_worker.extrair_paginas, pdf_bytes, inicio, inicio + tamanho_lote)))
+        # Os resultados são recolhidos pela ordem de submissão, o que mantém a ordem das páginas
+        for nome, futuro in tarefas:
+            paginas_por_arquivo[nome].extend(futuro.result())
+
+    return {
+        nome: [Document(page_content=texto, metadata={"source": nome, "page": num_pagina, "method": "pymupdf"}) for num_pagina, texto in paginas]
+        for nome, paginas in paginas_por_arquivo.items()
+    }
+
+PROMPT_OCR = "Você é um especialista em OCR. Extraia todo o texto visível desta página de documento de forma precisa, mantendo a estrutura original."
+
+# Limitador partilhado por todas as sessões do processo, porque a quota é da chave de API
+_limitador_ocr = TokenBucket(OCR_PEDIDOS_POR_MINUTO)
+
+def _ocr_pagina(doc_fitz_vision, lock_render, page_num, llm_vision, limitador):
+    """Renderiza uma página e envia-a ao modelo de visão, respeitando o limitador."""
+    # O documento do PyMuPDF não é thread-safe: só a renderização é serializada
+    with etapa("ocr_renderizacao", pagina=page_num), lock_render:
+        pix = doc_fitz_vision.load_page(page_num).get_pixmap(dpi=300)
+        img_bytes = pix.tobytes("png")
+    base64_image = base64.b64encode(img_bytes).decode('UTF-8')
+
+    human_message = HumanMessage(
+        content=[
+            {"type": "text", "text": PROMPT_OCR},
+            {"type": "image_url", "image_url": f"data:image/png;base64,{base64_image}"}
+        ]
+    )
+
+    def _invocar():
+        # A espera pelo limitador fica separada do tempo de resposta do modelo
+        with etapa("ocr_limitador", pagina=page_num):
+            limitador.adquirir()
+        with etapa("ocr_pagina", pagina=page_num, bytes_imagem=len(img_bytes)):
+            resposta = llm_vision.invoke([human_message])
+        registar_tokens(descrever_llm(llm_vision)[0], dict(getattr(resposta, 'usage_metadata', None) or {}))
+        return resposta
+
+    return com_retentativas(_invocar, operacao="ocr")
+
+def _ocr_paginas(pdf_bytes, nome_arquivo, llm_vision, max_concorrencia=None, limitador=None, ao_concluir_pagina=None):
+    """
+    Extrai o texto de todas as páginas de um PDF com Gemini Vision, em paralelo
+    (até 'max_concorrencia'), com o débito controlado por um token bucket e
+    repetição com recuo em erros 429. Não usa o Streamlit, pelo que pode correr
+    fora da thread do script; 'ao_concluir_pagina(concluidas, total, page_num, erro)'
+    é chamado na thread que invocou a função.
+    Devolve a lista de Documents por ordem de página.
+    """
+    max_concorrencia = max_concorrencia or OCR_MAX_CONCORRENCIA
+    limitador = limitador or _limitador_ocr
+    doc_fitz_vision = fitz.open(stream=pdf_bytes, filetype="pdf")
+    total_paginas = len(doc_fitz_vision)
+    lock_render = threading.Lock()
+    respostas = {}
+
+    with ThreadPoolExecutor(max_workers=max_concorrencia) as executor:
+        ocr_pagina = em_contexto(_ocr_pagina)
+        futuros = {
+            executor.submit(ocr_pagina, doc_fitz_vision, lock_render, page_num, llm_vision, limitador): page_num
+            for page_num in range(total_paginas)
+        }
+        for concluidas, futuro in enumerate(as_completed(futuros), start=1):
+            page_num = futuros[futuro]
+            erro = None
+            try:
+                respostas[page_num] = futuro.result()
+            except Exception as e_pagina:
+                erro = e_pagina
+            if ao_concluir_pagina:
+                ao_concluir_pagina(concluidas, total_paginas, page_num, erro)
+
+    # Reconstrói o documento pela ordem das páginas, independentemente da ordem de conclusão
+    documentos = []
+    for page_num in sorted(respostas):
+        ai_msg = respostas[page_num]
+        if isinstance(ai_msg, AIMessage) and isinstance(ai_msg.content, str) and ai_msg.content.strip():
+            documentos.append(Document(page_content=ai_msg.content, metadata={"source": nome_arquivo, "page": page_num, "method": "gemini_vision"}))
+    return documentos
+
+# Definições de divisão em fragmentos; fazem parte da chave do cache de ingestão
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 200
+MODELO_VISAO = "gemini-1.5-flash-latest"
+
+def _configuracao_ingestao(embeddings_obj):
+    """Definições que alteram o resultado da ingestão e, por isso, entram na chave do cache."""
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "modelo_visao": MODELO_VISAO,
+        "embeddings": getattr(embeddings_obj, 'model', type(embeddings_obj).__name__),
+        # As quase-cópias ficam guardadas com o vetor do fragmento que repetem
+        "dedup": [DEDUP_LIMIAR_JACCARD, DEDUP_PERMUTACOES, DEDUP_BANDAS] if DEDUP_ATIVO else None,
+    }
+
+# --- Pipeline de ingestão em etapas sobrepostas ---
+# extração -> (fila) -> divisão + embedding -> (fila) -> indexação incremental.
+# As etapas de extração e embedding correm em threads próprias e não usam o
+# Streamlit: comunicam com a thread do script através de uma fila de eventos.
+
+_FIM = object()
+
+class PipelineInterrompido(Exception):
+    pass
+
+class ProgressoIngestao:
+    """Contadores por etapa, atualizados pela thread do script a partir dos eventos."""
+
+    def __init__(self, total_arquivos):
+        self.total_arquivos = total_arquivos
+        self.extraidos = 0
+        self.embebidos = 0
+        self.indexados = 0
+        self.fragmentos_embebidos = 0
+        self.fragmentos_indexados = 0
+        self.do_cache = 0
+
+def _colocar(fila, item, parar):
+    """put() numa fila limitada que desiste se o pipeline for interrompido."""
+    while True:
+        if parar.is_set():
+            raise PipelineInterrompido()
+        try:
+            fila.put(item, timeout=0.2)
+            return
+        except queue.Full:
+            continue
+
+def _retirar(fila, parar):
+    while True:
+        if parar.is_set():
+            raise PipelineInterrompido()
+        try:
+            return fila.get(timeout=0.2)
+        except queue.Empty:
+            continue
+
+def _etapa_extracao(arquivos, cache, configuracao, num_workers, saida, eventos, parar):
+    """Etapa 1: para cada ficheiro, lê o cache ou extrai as páginas (PyMuPDF, depois Gemini Vision)."""
+    llm_vision = None
+    try:
+        for nome_arquivo, pdf_bytes in arquivos:
+            entrada = cache.obter(pdf_bytes, configuracao) if cache else None
+            if cache:
+                contar_cache("ingestao", entrada is not None)
+            if entrada is not None:
+                eventos.put(("cache", nome_arquivo))
+                _colocar(saida, ("cache", nome_arquivo, entrada), parar)
+                continue
+            try:
+                # Tentativa 1: PyMuPDF (fitz) - as páginas do ficheiro são repartidas pelo pool de processos
+                with etapa("extracao_pymupdf", ficheiro=nome_arquivo, bytes=len(pdf_bytes)) as atual:
+                    paginas = extrair_textos_pymupdf([(nome_arquivo, pdf_bytes)], num_workers)[nome_arquivo]
+                    atual.definir(paginas=len(paginas))
+                metodo = "PyMuPDF"
+                # Tentativa 2: Gemini Vision como fallback
+                if not paginas:
+                    eventos.put(("info", f"PyMuPDF não extraiu texto. A tentar Gemini Vision para {nome_arquivo}..."))
+                    if llm_vision is None:
+                        # CORREÇÃO: Removido 'google_api_key'. A biblioteca usará a 
+                        # variável de ambiente "GOOGLE_API_KEY" que foi definida no app.py.
+                        llm_vision = ChatGoogleGenerativeAI(model=MODELO_VISAO, temperature=0.1)
+                    with etapa("ocr", ficheiro=nome_arquivo) as atual:
+                        paginas = _ocr_paginas(
+                            pdf_bytes, nome_arquivo, llm_vision,
+                            ao_concluir_pagina=lambda c, t, p, e, n=nome_arquivo: eventos.put(("ocr", n, c, t, p, e)),
+                        )
+                        atual.definir(paginas=len(paginas))
+                    metodo = "Gemini Vision"
+            except PipelineInterrompido:
+                raise
+            except Exception as e:
+                eventos.put(("erro", f"Erro geral ao processar o ficheiro {nome_arquivo}: {e}"))
+                continue
+            if paginas:
+                eventos.put(("extraido", nome_arquivo, metodo))
+                _colocar(saida, ("paginas", nome_arquivo, pdf_bytes, paginas), parar)
+            else:
+                eventos.put(("erro", f"Falha ao extrair texto de {nome_arquivo} com todos os métodos disponíveis."))
+    except PipelineInterrompido:
+        return
+    except Exception as e:
+        eventos.put(("erro", f"Erro na extração de texto: {e}"))
+    finally:
+        try:
+            _colocar(saida, _FIM, parar)
+        except PipelineInterrompido:
+            pass
+
+def _classificar(deduplicador, textos):
+    """(grupo, novo) de cada fragmento; sem deduplicação todos são novos e sem grupo."""
+    if deduplicador is None:
+        return [(None, True)] * len(textos)
+    return [deduplicador.classificar(texto) for texto in textos]
+
+def _embeber_lote(lote, grupos, embeddings_obj, deduplicador):
+    """
+    Embebe só os fragmentos novos do lote. Devolve os vetores alinhados com o lote
+    (as repetições recebem o vetor do fragmento que repetem) e quantos foram embebidos.
+    """
+    novos = [f.page_content for f, (_, novo) in zip(lote, grupos) if novo]
+    vetores_novos = iter(np.asarray(embeddings_obj.embed_documents(novos), dtype=np.float32) if novos else [])
+    vetores = []
+    for grupo, novo in grupos:
+        vetor = next(vetores_novos) if novo else deduplicador.vetores[grupo]
+        if novo and deduplicador is not None:
+            deduplicador.vetores[grupo] = vetor
+        vetores.append(vetor)
+    return np.vstack(vetores), len(novos)
+
+def _etapa_embedding(entrada, saida, text_splitter, embeddings_obj, cache, configuracao, eventos, parar, deduplicador=None):
+    """
+    Etapa 2: divide as páginas em fragmentos e calcula os embeddings em lotes,
+    enviando cada lote para a indexação assim que fica pronto. Com um 'deduplicador',
+    os fragmentos que repetem outros (deste ou de outro ficheiro) não são embebidos.
+    """
     try:
-        doc_fitz_vision = fitz.open(stream=pdf_bytes, filetype="pdf")
-        prompt_ocr = "Você é um especialista em OCR. Extraia todo o texto visível desta página de documento de forma precisa, mantendo a estrutura original."
-        
-        for page_num in range(len(doc_fitz_vision)):
-            page_obj = doc_fitz_vision.load_page(page_num)
-            pix = page_obj.get_pixmap(dpi=300) 
-            img_bytes = pix.tobytes("png")
-            base64_image = base64.b64encode(img_bytes).decode('UTF-8')
-
-            human_message = HumanMessage(
-                content=[
-                    {"type": "text", "text": prompt_ocr},
-                    {"type": "image_url", "image_url": f"data:image/png;base64,{base64_image}"}
-                ]
-            )
-            
-            with st.spinner(f"Gemini processando pág. {page_num + 1}/{len(doc_fitz_vision)} de {nome_arquivo}..."):
-                ai_msg = llm_vision.invoke([human_message])
-            
-            if isinstance(ai_msg, AIMessage) and isinstance(ai_msg.content, str) and ai_msg.content.strip():
-                doc = Document(page_content=ai_msg.content, metadata={"source": nome_arquivo, "page": page_num, "method": "gemini_vision"})
-                documentos_gemini.append(doc)
-                texto_extraido = True
-            time.sleep(2) # To respect API rate limits
-        
-        if texto_extraido:
-            st.success(f"Texto extraído com Gemini Vision para {nome_arquivo}.")
-        else:
-            st.warning(f"Gemini Vision não retornou texto substancial para {nome_arquivo}.")
-
-    except Exception as e_gemini:
-        st.error(f"Erro ao usar Gemini Vision em {nome_arquivo}: {e_gemini}")
-    
-    return documentos_gemini, texto_extraido
-
-@st.cache_resource
+        while (item := _retirar(entrada, parar)) is not _FIM:
+            if item[0] == "cache":
+                _, nome_arquivo, entrada_cache = item
+                grupos = _classificar(deduplicador, [t for t, _ in entrada_cache.fragmentos])
+                if deduplicador is not None:
+                    for (grupo, novo), vetor in zip(grupos, entrada_cache.vetores):
+                        if novo:
+                            deduplicador.vetores[grupo] = vetor
+                _colocar(saida, ("cache", nome_arquivo, entrada_cache, grupos), parar)
+                continue
+            _, nome_arquivo, pdf_bytes, paginas = item
+            try:
+                with etapa("divisao", ficheiro=nome_arquivo, paginas=len(paginas)) as atual:
+                    fragmentos = text_splitter.split_documents(paginas)
+                    atual.definir(fragmentos=len(fragmentos))
+                vetores = []
+                _colocar(saida, ("paginas", nome_arquivo, paginas), parar)
+                for inicio in range(0, len(fragmentos), PIPELINE_FRAGMENTOS_POR_LOTE):
+                    lote = fragmentos[inicio:inicio + PIPELINE_FRAGMENTOS_POR_LOTE]
+                    with etapa("embedding_lote", ficheiro=nome_arquivo, fragmentos=len(lote)) as atual:
+                        grupos = _classificar(deduplicador, [f.page_content for f in lote])
+                        vetores_lote, embebidos = _embeber_lote(lote, grupos, embeddings_obj, deduplicador)
+                        atual.definir(embebidos=embebidos)
+                    vetores.append(vetores_lote)
+                    eventos.put(("embebidos", embebidos))
+                    _colocar(saida, ("fragmentos", nome_arquivo, lote, vetores_lote, grupos), parar)
+            except PipelineInterrompido:
+                raise
+            except Exception as e:
+                eventos.put(("erro", f"Erro ao calcular os embeddings de {nome_arquivo}: {e}"))
+                _colocar(saida, ("falhou", nome_arquivo), parar)
+                continue
+            _colocar(saida, ("concluido", nome_arquivo), parar)
+            eventos.put(("embebido", nome_arquivo))
+            if cache:
+                cache.guardar(pdf_bytes, configuracao, EntradaIngestao(
+                    [(p.page_content, p.metadata) for p in paginas],
+                    [(f.page_content, f.metadata) for f in fragmentos],
+                    np.concatenate(vetores) if vetores else np.zeros((0, 0), dtype=np.float32),
+                ))
+        if deduplicador is not None:
+            eventos.put(("dedup", deduplicador.estatisticas()))
+    except PipelineInterrompido:
+        return
+    except Exception as e:
+        eventos.put(("erro", f"Erro na etapa de embeddings: {e}"))
+    finally:
+        try:
+            _colocar(saida, _FIM, parar)
+        except PipelineInterrompido:
+            pass
+
+class _IndexadorIncremental:
+    """Etapa 3 (thread do script): acrescenta cada lote de fragmentos ao FAISS à medida que chega."""
+
+    def __init__(self, embeddings_obj):
+        self.embeddings_obj = embeddings_obj
+        self.vector_store = None
+        self.indice = IndiceDocumentos()
+        self._pendentes = {}  # nome -> (paginas, [(fragmentos, ids)]) até o ficheiro estar completo
+        self._ids_grupo = {}  # grupo da deduplicação -> id do fragmento indexado
+
+    def adicionar_paginas(self, nome_arquivo, paginas):
+        self._pendentes[nome_arquivo] = ([[p.metadata.get('page', 0), p.page_content] for p in paginas], [])
+
+    def adicionar_fragmentos(self, nome_arquivo, fragmentos, vetores, grupos=None):
+        """
+        Indexa os fragmentos novos. Um fragmento cujo grupo já está no índice não cria
+        vetor: a sua referência é acrescentada ao metadata 'fontes' do fragmento indexado.
+        """
+        if not len(fragmentos):
+            return
+        grupos = grupos or [(None, True)] * len(fragmentos)
+        ids, novos, repeticoes = [], [], []
+        for fragmento, vetor, (grupo, _) in zip(fragmentos, vetores, grupos):
+            doc_id = self._ids_grupo.get(grupo) if grupo is not None else None
+            if doc_id is None:
+                doc_id = str(uuid.uuid4())
+                novos.append((fragmento, vetor, doc_id))
+                if grupo is not None:
+                    self._ids_grupo[grupo] = doc_id
+            else:
+                repeticoes.append((doc_id, referencia(fragmento)))
+            ids.append(doc_id)
+        if novos:
+            textos = [f.page_content for f, _, _ in novos]
+            vetores_novos = [v for _, v, _ in novos]
+            metadados = [{**f.metadata, 'fontes': [referencia(f)]} for f, _, _ in novos]
+            ids_novos = [doc_id for _, _, doc_id in novos]
+            with etapa("indexacao_faiss", ficheiro=nome_arquivo, fragmentos=len(novos)):
+                if self.vector_store is None:
+                    self.vector_store = FAISS.from_embeddings(list(zip(textos, vetores_novos)), self.embeddings_obj, metadatas=metadados, ids=ids_novos)
+                else:
+                    self.vector_store.add_embeddings(list(zip(textos, vetores_novos)), metadatas=metadados, ids=ids_novos)
+        for doc_id, ref in repeticoes:
+            self.vector_store.docstore.search(doc_id).metadata['fontes'].append(ref)
+        self._pendentes[nome_arquivo][1].append((fragmentos, ids))
+
+    def concluir(self, nome_arquivo):
+        paginas, lotes = self._pendentes.pop(nome_arquivo)
+        self.indice.paginas_por_fonte[nome_arquivo] = paginas
+        for fragmentos, ids in lotes:
+            self.indice.adicionar_fragmentos(fragmentos, ids)
+
+    def descartar(self, nome_arquivo):
+        """Remove os fragmentos já indexados de um ficheiro cuja ingestão falhou a meio."""
+        _, lotes = self._pendentes.pop(nome_arquivo, (None, []))
+        ids = [doc_id for _, ids_lote in lotes for doc_id in ids_lote]
+        if not ids or self.vector_store is None:
+            return
+        # Fragmentos partilhados com outros ficheiros ficam; só perdem a referência a este
+        sem_fontes = retirar_fonte_dos_documentos(self.vector_store.docstore, ids, nome_arquivo)
+        if sem_fontes:
+            self.vector_store.delete(sem_fontes)
+            apagados = set(sem_fontes)
+            self._ids_grupo = {grupo: doc_id for grupo, doc_id in self._ids_grupo.items() if doc_id not in apagados}
+
+    def adicionar_entrada(self, nome_arquivo, entrada, grupos=None):
+        """Ficheiro vindo do cache de ingestão: páginas, fragmentos e vetores já prontos."""
+        self._pendentes[nome_arquivo] = ([[m.get('page', 0), t] for t, m in entrada.paginas], [])
+        self.adicionar_fragmentos(
+            nome_arquivo,
+            [Document(page_content=t, metadata=m) for t, m in entrada.fragmentos],
+            entrada.vetores,
+            grupos,
+        )
+        self.concluir(nome_arquivo)
+
 # CORREÇÃO: Removido o parâmetro 'api_key' da assinatura da função.
-def obter_vector_store_de_uploads(_lista_arquivos_pdf_upload, _embeddings_obj):
+# Sem st.cache_resource: os argumentos com '_' não entravam na chave, pelo que qualquer
+# upload devolvia o resultado do primeiro. O cache de ingestão por hash do PDF substitui-o.
+@etapa("ingestao")
+def obter_vector_store_de_uploads(_lista_arquivos_pdf_upload, _embeddings_obj, num_workers=None, usar_cache=True,
+                                  ambito=None):
     """
     Processa uma lista de arquivos PDF, extrai texto e cria um Vector Store FAISS.
-    Usa PyMuPDF como método principal e Gemini Vision como fallback.
+    Usa PyMuPDF como método principal (em paralelo, com 'num_workers' processos)
+    e Gemini Vision como fallback. Ficheiros já ingeridos com as mesmas definições
+    são lidos do cache de ingestão (páginas, fragmentos e embeddings).
+
+    As etapas extração, embedding e indexação correm sobrepostas e ligadas por filas
+    limitadas: os fragmentos de um ficheiro são embebidos e indexados enquanto o
+    seguinte ainda está a ser extraído.
+
+    'ambito' (ex.: o id do utilizador) entra na impressão digital do vector store: os
+    caches de respostas e de trabalhos indexados por ela não são partilhados com quem
+    enviar os mesmos PDFs noutro âmbito.
     """
     if not _lista_arquivos_pdf_upload:
         return None, None
 
-    documentos_totais = []
-    nomes_arquivos_processados = []
-    
-    # CORREÇÃO: Removido 'google_api_key'. A biblioteca usará a 
-    # variável de ambiente "GOOGLE_API_KEY" que foi definida no app.py.
-    llm_vision = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash-latest", 
-        temperature=0.1
-    )
-
+    arquivos = []
     for arquivo_pdf in _lista_arquivos_pdf_upload:
-        nome_arquivo = arquivo_pdf.name
-        st.info(f"Processando: {nome_arquivo}...")
-        
-        docs_arquivo_atual = []
-        sucesso = False
-        
-        try:
-            # Tentativa 1: PyMuPDF (fitz) - método principal
-            st.write(f"A extrair texto com PyMuPDF para {nome_arquivo}...")
-            arquivo_pdf.seek(0)
-            doc_fitz = fitz.open(stream=arquivo_pdf.read(), filetype="pdf")
-            for num_pagina, pagina in enumerate(doc_fitz):
-                texto = pagina.get_text("text")
-                if texto.strip():
-                    docs_arquivo_atual.append(Document(page_content=texto, metadata={"source": nome_arquivo, "page": num_pagina, "method": "pymupdf"}))
-            if docs_arquivo_atual:
-                sucesso = True
-                st.success(f"Texto extraído com PyMuPDF para {nome_arquivo}.")
-
-            # Tentativa 2: Gemini Vision como fallback
-            if not sucesso:
-                st.write(f"PyMuPDF não extraiu texto. A tentar Gemini Vision para {nome_arquivo}...")
-                arquivo_pdf.seek(0)
-                pdf_bytes = arquivo_pdf.read()
-                docs_gemini, sucesso_gemini = _extrair_texto_com_gemini(pdf_bytes, nome_arquivo, llm_vision)
-                if sucesso_gemini:
-                    docs_arquivo_atual = docs_gemini
-                    sucesso = True
-
-            if sucesso:
-                documentos_totais.extend(docs_arquivo_atual)
-                nomes_arquivos_processados.append(nome_arquivo)
-            else:
-                st.error(f"Falha ao extrair texto de {nome_arquivo} com todos os métodos disponíveis.")
+        arquivo_pdf.seek(0)
+        arquivos.append((arquivo_pdf.name, arquivo_pdf.read()))
 
-        except Exception as e:
-            st.error(f"Erro geral ao processar o ficheiro {nome_arquivo}: {e}")
+    etapa_atual().definir(ficheiros=len(arquivos), bytes=sum(len(pdf_bytes) for _, pdf_bytes in arquivos))
+    cache = obter_cache_ingestao() if usar_cache else None
+    configuracao = _configuracao_ingestao(_embeddings_obj)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+    # Uma deduplicação por ingestão: fragmentos repetidos entre os ficheiros deste upload
+    deduplicador = DeduplicadorFragmentos() if DEDUP_ATIVO else None
+    estatisticas_dedup = {}
 
-    if not documentos_totais:
-        return None, []
+    fila_paginas = queue.Queue(maxsize=PIPELINE_TAMANHO_FILA)
+    fila_fragmentos = queue.Queue(maxsize=PIPELINE_TAMANHO_FILA)
+    eventos = queue.Queue()
+    parar = threading.Event()
+    threads = [
+        threading.Thread(target=em_contexto(_etapa_extracao), args=(arquivos, cache, configuracao, num_workers, fila_paginas, eventos, parar), daemon=True),
+        threading.Thread(target=em_contexto(_etapa_embedding), args=(fila_paginas, fila_fragmentos, text_splitter, _embeddings_obj, cache, configuracao, eventos, parar, deduplicador), daemon=True),
+    ]
+
+    progresso = ProgressoIngestao(len(arquivos))
+    indexador = _IndexadorIncremental(_embeddings_obj)
+    nomes_indexados = set()
+    nomes_falhados = set()
+    st.info(f"A processar {len(arquivos)} ficheiro(s)...")
+    barra_extracao = st.progress(0.0, text="Extração")
+    barra_embedding = st.progress(0.0, text="Embeddings")
+    barra_indexacao = st.progress(0.0, text="Indexação")
+
+    def _mostrar_eventos():
+        while True:
+            try:
+                evento = eventos.get_nowait()
+            except queue.Empty:
+                break
+            tipo = evento[0]
+            if tipo == "cache":
+                progresso.extraidos += 1
+                progresso.embebidos += 1
+                progresso.do_cache += 1
+            elif tipo == "extraido":
+                progresso.extraidos += 1
+                st.success(f"Texto extraído com {evento[2]} para {evento[1]}.")
+            elif tipo == "embebidos":
+                progresso.fragmentos_embebidos += evento[1]
+            elif tipo == "embebido":
+                progresso.embebidos += 1
+            elif tipo == "ocr":
+                _, nome_arquivo, concluidas, total, page_num, erro = evento
+                if erro is not None:
+                    st.warning(f"Gemini Vision falhou na pág. {page_num + 1} de {nome_arquivo}: {erro}")
+                barra_extracao.progress(progresso.extraidos / progresso.total_arquivos, text=f"Extração: Gemini processou {concluidas}/{total} pág. de {nome_arquivo}")
+                continue
+            elif tipo == "info":
+                st.write(evento[1])
+            elif tipo == "dedup":
+                estatisticas_dedup.update(evento[1])
+            elif tipo == "erro":
+                st.error(evento[1])
+        total = progresso.total_arquivos
+        barra_extracao.progress(progresso.extraidos / total, text=f"Extração: {progresso.extraidos}/{total} ficheiro(s)")
+        barra_embedding.progress(progresso.embebidos / total, text=f"Embeddings: {progresso.embebidos}/{total} ficheiro(s), {progresso.fragmentos_embebidos} fragmento(s)")
+        barra_indexacao.progress(progresso.indexados / total, text=f"Indexação: {progresso.indexados}/{total} ficheiro(s), {progresso.fragmentos_indexados} fragmento(s)")
 
     try:
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
-        docs_fragmentados = text_splitter.split_documents(documentos_totais)
-        
-        st.info(f"Criando base de vetores com {len(docs_fragmentados)} fragmentos...")
-        vector_store = FAISS.from_documents(docs_fragmentados, _embeddings_obj)
-        st.success("Base de vetores criada com sucesso!")
-        return vector_store, nomes_arquivos_processados
-    except Exception as e:
-        st.error(f"Erro ao criar o Vector Store com FAISS: {e}")
-        return None, nomes_arquivos_processados
+        for thread in threads:
+            thread.start()
+        while True:
+            try:
+                item = fila_fragmentos.get(timeout=0.1)
+            except queue.Empty:
+                _mostrar_eventos()
+                continue
+            if item is _FIM:
+                break
+            tipo, nome_arquivo = item[0], item[1]
+            if nome_arquivo in nomes_falhados:
+                continue
+            try:
+                if tipo == "cache":
+                    indexador.adicionar_entrada(nome_arquivo, item[2], item[3])
+                    progresso.fragmentos_indexados += len(item[2].fragmentos)
+                elif tipo == "paginas":
+                    indexador.adicionar_paginas(nome_arquivo, item[2])
+                elif tipo == "fragmentos":
+                    indexador.adicionar_fragmentos(nome_arquivo, item[2], item[3], item[4])
+                    progresso.fragmentos_indexados += len(item[2])
+                elif tipo == "falhou":
+                    indexador.descartar(nome_arquivo)
+                    nomes_falhados.add(nome_arquivo)
+                    continue
+                if tipo in ("cache", "concluido"):
+                    if tipo == "concluido":
+                        indexador.concluir(nome_arquivo)
+                    nomes_indexados.add(nome_arquivo)
+                    progresso.indexados += 1
+            except Exception as e:
+                st.error(f"Erro ao criar o Vector Store com FAISS: {e}")
+                indexador.descartar(nome_arquivo)
+                nomes_falhados.add(nome_arquivo)
+            _mostrar_eventos()
+    finally:
+        # Se o script for interrompido (rerun do Streamlit), as threads terminam em vez de ficarem bloqueadas
+        parar.set()
+        for thread in threads:
+            thread.join(timeout=1)
+    _mostrar_eventos()
+
+    # Mantém a ordem do upload
+    nomes_arquivos_processados = [nome for nome, _ in arquivos if nome in nomes_indexados]
+    vector_store = indexador.vector_store
+    if not nomes_arquivos_processados or vector_store is None:
+        return None, []
+
+    # Índice fonte -> fragmentos e texto original das páginas, para reconstrução O(1) por ficheiro
+    anexar_indice(vector_store, indexador.indice)
+    # Os mesmos PDFs com as mesmas definições, no mesmo âmbito, dão a mesma impressão (caches
+    # partilhados entre as sessões desse âmbito, mas não com outros utilizadores)
+    definir_impressao_base(vector_store, ambito, [(nome, chave_ingestao(pdf_bytes, configuracao))
+                                                  for nome, pdf_bytes in arquivos if nome in nomes_indexados])
+    # Coleções grandes passam de pesquisa exata para um índice aproximado (HNSW/IVF)
+    with etapa("conversao_indice", fragmentos=vector_store.index.ntotal) as atual:
+        tipo_indice = converter_indice(vector_store)
+        atual.definir(tipo=tipo_indice)
+    st.success(f"Base de vetores criada com sucesso! ({vector_store.index.ntotal} fragmentos, índice {tipo_indice.upper()})")
+    if cache:
+        estatisticas = cache.estatisticas()
+        st.caption(f"Cache de ingestão: {estatisticas['hits']} hits, {estatisticas['misses']} misses, {estatisticas['bytes'] / 1e6:.1f} MB em disco.")
+    if estatisticas_dedup.get("fragmentos"):
+        st.caption(f"Deduplicação: {estatisticas_dedup['fragmentos']} fragmentos, {estatisticas_dedup['exatos']} cópias exatas "
+                   f"e {estatisticas_dedup['quase_iguais']} quase iguais; {estatisticas_dedup['unicos']} vetores no índice "
+                   f"(-{estatisticas_dedup['reducao']:.0%}).")
+    return vector_store, nomes_arquivos_processados
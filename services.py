@@ -0,0 +1,157 @@
+# services.py
+"""
+Arranque dos serviços partilhados por todas as sessões do processo.
+
+A chave de API, o Firebase Admin SDK, o cliente do bucket e os embeddings são
+criados uma única vez por processo (e não em cada rerun do Streamlit). Este
+módulo importa só o necessário para a página de login: o LangChain, o PyMuPDF,
+o FAISS e o pandas ficam para depois do login, e podem ser carregados numa
+thread de fundo enquanto o utilizador preenche o formulário, para que a
+primeira página depois do login não pague o custo dessas importações.
+"""
+import importlib
+import json
+import os
+import threading
+
+import firebase_admin
+import streamlit as st
+from firebase_admin import credentials, firestore
+
+from config import ARRANQUE_MODELO_EMBEDDINGS, ARRANQUE_PREAQUECER_MODULOS
+
+PROJECT_ID = "contratiapy"
+
+# Módulos da aplicação depois do login, pela ordem em que app.py os importa
+MODULOS_APLICACAO = ("firebase_utils", "pdf_processing", "ui_tabs")
+
+
+def _ler_segredo(secret_id):
+    """Valor da versão mais recente de um segredo do Secret Manager."""
+    from google.cloud import secretmanager
+
+    client = secretmanager.SecretManagerServiceClient()
+    name = f"projects/{PROJECT_ID}/secrets/{secret_id}/versions/latest"
+    response = client.access_secret_version(name=name)
+    return response.payload.data.decode("UTF-8")
+
+
+@st.cache_resource
+def setup_api_key():
+    """Obtém a chave de API da Google do Secret Manager e define-a como uma variável de ambiente."""
+    try:
+        api_key = _ler_segredo("google-api-key")
+        # Define a variável de ambiente que todas as bibliotecas irão usar
+        os.environ["GOOGLE_API_KEY"] = api_key
+        return api_key
+    except Exception as e:
+        st.error(f"Não foi possível obter a Chave de API do Secret Manager: {e}")
+        return None
+
+
+@st.cache_resource(show_spinner="A ligar aos serviços...")
+def initialize_services():
+    """
+    Inicializa o Firebase Admin SDK. Outras bibliotecas da Google (como a LangChain)
+    usarão as credenciais do ambiente fornecidas automaticamente pelo Cloud Run.
+    """
+    try:
+        # Só executa a configuração uma vez
+        if not firebase_admin._apps:
+            try:
+                # Obter credenciais do Secret Manager (para produção no Cloud Run)
+                creds_dict = json.loads(_ler_segredo("firebase-credentials"))
+                cred = credentials.Certificate(creds_dict)
+                app_options = {'storageBucket': f"{PROJECT_ID}.appspot.com"}
+                firebase_admin.initialize_app(cred, app_options)
+
+            except Exception as e_secret:
+                # Se o Secret Manager falhar (por exemplo, ao correr localmente)
+                st.warning(f"Não foi possível carregar as credenciais do Secret Manager ({e_secret}). A tentar usar as credenciais padrão do ambiente (ADC).")
+                try:
+                    cred = credentials.ApplicationDefault()
+                    app_options = {'storageBucket': f"{PROJECT_ID}.appspot.com", 'projectId': PROJECT_ID}
+                    firebase_admin.initialize_app(cred, app_options)
+                except Exception as e_default:
+                     st.error(f"Falha na inicialização padrão do Firebase. Certifique-se de que está autenticado se estiver a correr localmente. Erro: {e_default}")
+                     return None, None
+
+        db_client = firestore.client()
+        # O nome vem das opções da app: o cliente do Storage só é criado na primeira transferência
+        bucket_name = firebase_admin.get_app().options.get('storageBucket')
+
+        return db_client, bucket_name
+    except Exception as e:
+        st.error(f"ERRO: Falha crítica ao inicializar os serviços. Detalhes: {e}")
+        return None, None
+
+
+_bucket = None
+_bucket_lock = threading.Lock()
+
+
+def obter_bucket():
+    """Cliente do bucket criado uma vez por processo e partilhado pelas transferências."""
+    global _bucket
+    with _bucket_lock:
+        if _bucket is None:
+            from firebase_admin import storage
+            _bucket = storage.bucket()
+        return _bucket
+
+
+@st.cache_resource
+def obter_embeddings():
+    """Embeddings da Google atrás do cache local (ingestão e perguntas do chat), um por processo."""
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    from embeddings_cache import EmbeddingsEmCache
+    return EmbeddingsEmCache(GoogleGenerativeAIEmbeddings(model=ARRANQUE_MODELO_EMBEDDINGS))
+
+
+@st.cache_resource
+def ligar_cache_llm_partilhado(_db_client):
+    """Acrescenta o Firestore ao cache de respostas do LLM, uma vez por processo."""
+    from llm_cache import ArmazenamentoFirestore, obter_cache_llm
+    obter_cache_llm().adicionar_armazenamento(ArmazenamentoFirestore(_db_client))
+    return True
+
+
+def _importar_modulos(nomes):
+    for nome in nomes:
+        try:
+            importlib.import_module(nome)
+        except Exception:
+            # O erro volta a aparecer, com a mensagem certa, quando a página importar o módulo
+            return
+
+
+_preaquecimento = None
+_preaquecimento_lock = threading.Lock()
+
+
+def preaquecer_modulos(nomes=MODULOS_APLICACAO):
+    """
+    Importa numa thread de fundo os módulos usados depois do login, uma vez por
+    processo. Devolve a thread (None se estiver desativado por configuração).
+    """
+    global _preaquecimento
+    if not ARRANQUE_PREAQUECER_MODULOS:
+        return None
+    with _preaquecimento_lock:
+        if _preaquecimento is None:
+            _preaquecimento = threading.Thread(target=_importar_modulos, args=(tuple(nomes),),
+                                               daemon=True, name="preaquecer-modulos")
+            _preaquecimento.start()
+        return _preaquecimento
+
+
+def aguardar_preaquecimento():
+    """
+    Espera que a importação em fundo termine, se estiver em curso. Chamado antes de a
+    página importar os mesmos módulos: duas threads a importar em simultâneo módulos
+    que dependem uns dos outros podem acabar num erro de bloqueio mútuo do import.
+    """
+    thread = _preaquecimento
+    if thread is not None:
+        thread.join()
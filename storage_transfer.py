@@ -0,0 +1,123 @@
+# storage_transfer.py
+"""
+Transferência de pastas de coleção para o Cloud Storage em shards de tamanho
+fixo, enviados e recebidos em paralelo, cada um com o seu SHA-256.
+
+Cada ficheiro da pasta é lido (ou escrito) diretamente nas posições do shard,
+sem zip nem cópia temporária. Um manifest JSON, enviado por último, lista os
+ficheiros e os shards; o seu caminho é o que fica guardado no Firestore.
+"""
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from concurrency_utils import com_retentativas, erro_transitorio
+from config import TRANSFER_CONCORRENCIA, TRANSFER_TAMANHO_SHARD
+from telemetry import contar, etapa
+
+NOME_MANIFEST_TRANSFERENCIA = "manifest_transferencia.json"
+VERSAO_TRANSFERENCIA = 1
+
+
+class ErroIntegridadeTransferencia(ValueError):
+    """Um shard descarregado não corresponde ao SHA-256 registado no manifest."""
+
+
+def _ler_intervalo(caminho, inicio, tamanho):
+    with open(caminho, "rb") as f:
+        f.seek(inicio)
+        return f.read(tamanho)
+
+
+def enviar_pasta_em_shards(bucket, pasta, prefixo, tamanho_shard=TRANSFER_TAMANHO_SHARD, concorrencia=TRANSFER_CONCORRENCIA):
+    """
+    Envia todos os ficheiros de 'pasta' para '{prefixo}/shards/...' e depois o manifest.
+    Devolve o caminho do manifest no bucket e o total de bytes enviados.
+    """
+    pasta = Path(pasta)
+    ficheiros = sorted(p for p in pasta.rglob("*") if p.is_file())
+    tarefas = []
+    manifest = {"versao": VERSAO_TRANSFERENCIA, "tamanho_shard": tamanho_shard, "ficheiros": []}
+    for caminho in ficheiros:
+        relativo = caminho.relative_to(pasta).as_posix()
+        tamanho = caminho.stat().st_size
+        entrada = {"nome": relativo, "tamanho": tamanho, "shards": []}
+        for numero, inicio in enumerate(range(0, max(tamanho, 1), tamanho_shard)):
+            shard = {"blob": f"{prefixo}/shards/{relativo}.{numero:05d}", "inicio": inicio,
+                     "tamanho": min(tamanho_shard, tamanho - inicio)}
+            entrada["shards"].append(shard)
+            tarefas.append((caminho, shard))
+        manifest["ficheiros"].append(entrada)
+
+    def _enviar(tarefa):
+        caminho, shard = tarefa
+        dados = _ler_intervalo(caminho, shard["inicio"], shard["tamanho"])
+        shard["sha256"] = hashlib.sha256(dados).hexdigest()
+        com_retentativas(bucket.blob(shard["blob"]).upload_from_string, dados,
+                         content_type="application/octet-stream", e_retentavel=erro_transitorio,
+                         operacao="storage_envio")
+        contar("bytes_transferidos_total", len(dados), direcao="envio")
+        return len(dados)
+
+    with etapa("storage_envio", ficheiros=len(ficheiros), shards=len(tarefas)) as atual:
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            total = sum(executor.map(_enviar, tarefas))
+
+        # O manifest vai por último: só passa a existir quando todos os shards estão no bucket
+        caminho_manifest = f"{prefixo}/{NOME_MANIFEST_TRANSFERENCIA}"
+        bucket.blob(caminho_manifest).upload_from_string(json.dumps(manifest), content_type="application/json")
+        atual.definir(bytes=total)
+    return caminho_manifest, total
+
+
+def descarregar_pasta_em_shards(bucket, caminho_manifest, destino, concorrencia=TRANSFER_CONCORRENCIA):
+    """
+    Reconstrói em 'destino' a pasta descrita pelo manifest, escrevendo cada shard
+    na sua posição do ficheiro final depois de verificar o SHA-256.
+    Devolve o total de bytes recebidos.
+    """
+    destino = Path(destino)
+    manifest = json.loads(bucket.blob(caminho_manifest).download_as_bytes())
+    if manifest.get("versao", 0) > VERSAO_TRANSFERENCIA:
+        raise ValueError(f"Versão {manifest.get('versao')} do manifest de transferência não suportada.")
+
+    tarefas = []
+    for entrada in manifest["ficheiros"]:
+        caminho = destino / entrada["nome"]
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        # Reserva o tamanho final para que cada shard possa ser escrito na sua posição
+        with open(caminho, "wb") as f:
+            f.truncate(entrada["tamanho"])
+        tarefas.extend((caminho, shard) for shard in entrada["shards"])
+
+    def _receber(tarefa):
+        caminho, shard = tarefa
+        dados = com_retentativas(bucket.blob(shard["blob"]).download_as_bytes, e_retentavel=erro_transitorio,
+                                 operacao="storage_download")
+        contar("bytes_transferidos_total", len(dados), direcao="download")
+        if hashlib.sha256(dados).hexdigest() != shard["sha256"] or len(dados) != shard["tamanho"]:
+            raise ErroIntegridadeTransferencia(f"Shard '{shard['blob']}' corrompido (SHA-256 ou tamanho incorreto).")
+        with open(caminho, "r+b") as f:
+            f.seek(shard["inicio"])
+            f.write(dados)
+        return len(dados)
+
+    with etapa("storage_download", ficheiros=len(manifest["ficheiros"]), shards=len(tarefas)) as atual, \
+            ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        total = sum(executor.map(_receber, tarefas))
+        atual.definir(bytes=total)
+        return total
+
+
+def apagar_prefixo(bucket, prefixo):
+    """Apaga todos os blobs de uma versão antiga (shards e manifest). Falhas são ignoradas."""
+    for blob in bucket.list_blobs(prefix=f"{prefixo}/"):
+        try:
+            blob.delete()
+        except Exception:
+            pass
+
+
+def prefixo_do_manifest(caminho_manifest):
+    return caminho_manifest.rsplit("/", 1)[0]
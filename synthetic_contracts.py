@@ -0,0 +1,114 @@
+# synthetic_contracts.py
+"""
+Corpus sintético de contratos bancários em português, para os benchmarks.
+
+Cada contrato tem partes, valores, taxas, prazos e datas próprios e cláusulas
+gerais partilhadas (como os contratos reais de um mesmo banco). Os PDFs podem
+ter camada de texto (lidos pelo PyMuPDF) ou ser só imagem, como um documento
+digitalizado (seguem para o OCR). Tudo é determinista a partir da semente.
+"""
+import random
+
+import fitz  # PyMuPDF
+
+BANCOS = ["Banco Alfa S.A.", "Banco Beta S.A.", "Banco Gama Múltiplo S.A.", "Caixa Delta de Crédito S.A."]
+CLIENTES = ["Ana Souza", "Bruno Lima", "Carla Pereira", "Daniel Rocha", "Eduarda Alves", "Fábio Martins",
+            "Gabriela Costa", "Henrique Ribeiro", "Isabela Gomes", "João Carvalho"]
+PRODUTOS = ["empréstimo pessoal", "cartão de crédito", "financiamento de veículo", "crédito consignado"]
+
+CLAUSULAS_GERAIS = [
+    "As partes declaram ter lido e compreendido todas as disposições deste instrumento, que se rege pela "
+    "legislação aplicável e pelas normas do Conselho Monetário Nacional.",
+    "O CLIENTE autoriza o BANCO a consultar e registar as suas informações no Sistema de Informações de "
+    "Crédito do Banco Central, nos termos da regulamentação em vigor.",
+    "Os dados pessoais do CLIENTE serão tratados conforme a Lei Geral de Proteção de Dados, apenas para as "
+    "finalidades deste contrato e pelo prazo exigido por lei.",
+    "A tolerância de qualquer das partes quanto ao incumprimento de obrigações não constitui novação nem "
+    "renúncia aos direitos previstos neste contrato.",
+    "As comunicações entre as partes serão feitas por escrito, para os endereços indicados no preâmbulo, "
+    "ou pelos canais eletrónicos disponibilizados pelo BANCO.",
+    "Fica eleito o foro da comarca do domicílio do CLIENTE para dirimir quaisquer questões oriundas deste "
+    "contrato, com renúncia a qualquer outro, por mais privilegiado que seja.",
+]
+
+_LARGURA, _ALTURA, _MARGEM = 595, 842, 50  # A4 em pontos
+
+
+def _percentagem(valor):
+    return f"{valor:.2f}".replace(".", ",") + "%"
+
+
+def _moeda(valor):
+    return f"R$ {valor:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def paginas_contrato(numero, num_paginas=4, semente=0):
+    """Texto de cada página do contrato 'numero'. As condições variam de contrato para contrato."""
+    rng = random.Random(semente * 100003 + numero)
+    banco, cliente, produto = rng.choice(BANCOS), rng.choice(CLIENTES), rng.choice(PRODUTOS)
+    valor = rng.randrange(5000, 500000, 500)
+    taxa_mensal = rng.randrange(80, 450) / 100
+    prazo = rng.choice([12, 24, 36, 48, 60])
+    ano = rng.randrange(2022, 2026)
+    especificas = [
+        f"CONTRATO N.º {numero:05d} DE {produto.upper()}\nEntre {banco}, doravante BANCO, e {cliente}, "
+        f"doravante CLIENTE, é celebrado o presente contrato de {produto}.",
+        f"CLÁUSULA 1ª - DO VALOR. O BANCO concede ao CLIENTE o valor principal de {_moeda(valor)}, "
+        f"creditado na conta do CLIENTE na data de assinatura.",
+        f"CLÁUSULA 2ª - DOS JUROS. Sobre o saldo devedor incidem juros de {_percentagem(taxa_mensal)} ao mês, "
+        f"equivalentes a {_percentagem(((1 + taxa_mensal / 100) ** 12 - 1) * 100)} ao ano. Os juros do crédito "
+        f"rotativo incidem sobre o saldo não pago da fatura.",
+        f"CLÁUSULA 3ª - DO PRAZO. O contrato vigora por {prazo} meses, de {rng.randrange(1, 28):02d}/"
+        f"{rng.randrange(1, 13):02d}/{ano} até ao pagamento da última de {prazo} parcelas mensais.",
+        f"CLÁUSULA 4ª - DA ANUIDADE. Será cobrada anuidade de {_moeda(rng.randrange(0, 900, 10))}, "
+        f"em 12 parcelas, e o limite de crédito pode ser alterado pelo BANCO mediante aviso prévio.",
+        f"CLÁUSULA 5ª - DA RESCISÃO. Em caso de rescisão ou cancelamento antecipado por iniciativa do "
+        f"CLIENTE incide multa de {rng.randrange(1, 10)}% sobre o saldo devedor, com aviso de 30 dias.",
+    ]
+    clausulas = especificas + [f"CLÁUSULA {6 + i}ª - {texto}" for i, texto in enumerate(CLAUSULAS_GERAIS)]
+    # As cláusulas ficam repartidas pelas páginas; as páginas a mais repetem as disposições gerais
+    paginas = [[] for _ in range(max(1, num_paginas))]
+    for i, clausula in enumerate(clausulas):
+        paginas[i * len(paginas) // len(clausulas)].append(clausula)
+    for i, pagina in enumerate(paginas):
+        if not pagina:
+            pagina.append(CLAUSULAS_GERAIS[i % len(CLAUSULAS_GERAIS)])
+    return [f"Página {i + 1} de {len(paginas)}\n\n" + "\n\n".join(pagina) for i, pagina in enumerate(paginas)]
+
+
+def pdf_com_texto(paginas):
+    """PDF com camada de texto: uma página A4 por texto."""
+    with fitz.open() as doc:
+        for texto in paginas:
+            pagina = doc.new_page(width=_LARGURA, height=_ALTURA)
+            sobra = pagina.insert_textbox(fitz.Rect(_MARGEM, _MARGEM, _LARGURA - _MARGEM, _ALTURA - _MARGEM),
+                                          texto, fontsize=10, fontname="helv")
+            if sobra < 0:
+                raise ValueError("O texto não cabe numa página: use mais páginas por contrato.")
+        return doc.tobytes(deflate=True)
+
+
+def pdf_so_imagem(paginas, dpi=100):
+    """PDF sem camada de texto, como um documento digitalizado: cada página é uma imagem."""
+    with fitz.open(stream=pdf_com_texto(paginas), filetype="pdf") as original, fitz.open() as doc:
+        for pagina in original:
+            imagem = pagina.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            nova = doc.new_page(width=pagina.rect.width, height=pagina.rect.height)
+            nova.insert_image(nova.rect, pixmap=imagem)
+        return doc.tobytes(deflate=True)
+
+
+def gerar_corpus(num_contratos, paginas_por_contrato=4, fracao_imagem=0.0, semente=0):
+    """
+    Devolve [(nome do ficheiro, bytes do PDF)]. Uma fração 'fracao_imagem' dos contratos
+    (os últimos) é gerada só como imagem.
+    """
+    num_imagem = round(num_contratos * fracao_imagem)
+    corpus = []
+    for numero in range(num_contratos):
+        paginas = paginas_contrato(numero, paginas_por_contrato, semente)
+        if numero >= num_contratos - num_imagem:
+            corpus.append((f"contrato_{numero:05d}_digitalizado.pdf", pdf_so_imagem(paginas)))
+        else:
+            corpus.append((f"contrato_{numero:05d}.pdf", pdf_com_texto(paginas)))
+    return corpus
@@ -0,0 +1,161 @@
+# targeted_extraction.py
+"""
+Extração dirigida dos campos do InfoContrato.
+
+Em vez de enviar o contrato inteiro ao modelo, cada grupo de campos (juros,
+prazo, anuidade, rescisão...) tem uma pergunta; os fragmentos do ficheiro mais
+semelhantes a cada pergunta (pesquisa exata entre os vetores desse ficheiro no
+índice FAISS) formam um contexto curto, pela ordem em que aparecem no
+documento. Quando a pesquisa tem baixa semelhança ou o modelo deixa demasiados
+campos por preencher, a extração repete-se com o texto completo.
+"""
+import time
+
+import numpy as np
+from langchain.output_parsers import PydanticOutputParser
+from langchain.prompts import PromptTemplate
+
+from config import EXTRACAO_DIRIGIDA_MAX_CAMPOS_VAZIOS, EXTRACAO_DIRIGIDA_SIMILARIDADE_MIN, EXTRACAO_DIRIGIDA_TOP_K
+from context_budget import estimar_tokens
+from data_models import InfoContrato
+from document_index import obter_indice, texto_completo_do_ficheiro
+from llm_cache import invocar_com_cache
+
+# Grupos de campos do InfoContrato e a pergunta usada para encontrar os trechos de cada um
+GRUPOS_DE_CAMPOS = {
+    "partes": (["nome_banco_emissor"],
+               "Nome do banco, instituição financeira emissora ou credora e identificação das partes do contrato"),
+    "valores": (["valor_principal_numerico"],
+                "Valor principal do contrato, valor do empréstimo, financiamento ou limite em reais (R$)"),
+    "juros": (["taxa_juros_anual_numerica", "condicao_juros_rotativo"],
+              "Taxa de juros ao mês e ao ano, custo efetivo total, encargos e juros do crédito rotativo"),
+    "prazo": (["prazo_total_meses"],
+              "Prazo de vigência do contrato, duração em meses, número de parcelas e data de vencimento"),
+    "limite": (["condicao_limite_credito"],
+               "Definição, alteração e política do limite de crédito"),
+    "anuidade": (["condicao_anuidade"],
+                 "Tarifa de anuidade, cobrança de anuidade e demais tarifas"),
+    "rescisao": (["possui_clausula_rescisao_multa", "condicao_cancelamento"],
+                 "Rescisão, cancelamento do contrato, multa rescisória e penalidades por término antecipado"),
+}
+
+PROMPT_TRECHOS = """
+        Analise os trechos abaixo, retirados do contrato do arquivo "{nome_arquivo}", e extraia as informações solicitadas.
+        Os trechos foram selecionados por serem os mais relevantes para cada campo e estão pela ordem em que aparecem no contrato.
+        Se uma informação não constar dos trechos, use o valor padrão definido no schema.
+        Trechos do Contrato:
+        {trechos}
+        Arquivo de Origem: "{nome_arquivo}"
+        {format_instructions}
+        """
+
+
+def _normalizar(vetores):
+    vetores = np.asarray(vetores, dtype=np.float32)
+    normas = np.linalg.norm(vetores, axis=-1, keepdims=True)
+    return vetores / np.where(normas == 0, 1, normas)
+
+
+def campos_vazios(dados):
+    """Campos do InfoContrato que ficaram com o valor padrão (informação não encontrada)."""
+    return [nome for nome, campo in InfoContrato.model_fields.items()
+            if nome != "arquivo_fonte" and dados.get(nome) == campo.default]
+
+
+class ExtratorDirigido:
+    """
+    Prepara, uma vez por execução, o que a extração dirigida precisa do vector store
+    (posição de cada fragmento no índice e vetores das perguntas) e extrai ficheiros
+    individualmente, de forma segura entre threads.
+    """
+
+    def __init__(self, vector_store, llm, top_k=EXTRACAO_DIRIGIDA_TOP_K,
+                 similaridade_min=EXTRACAO_DIRIGIDA_SIMILARIDADE_MIN,
+                 max_campos_vazios=EXTRACAO_DIRIGIDA_MAX_CAMPOS_VAZIOS, cache=None):
+        self.vector_store = vector_store
+        self.llm = llm
+        self.top_k = top_k
+        self.similaridade_min = similaridade_min
+        self.max_campos_vazios = max_campos_vazios
+        self.cache = cache
+        self.parser = PydanticOutputParser(pydantic_object=InfoContrato)
+        self.prompt = PromptTemplate(
+            template=PROMPT_TRECHOS,
+            input_variables=["trechos", "nome_arquivo"],
+            partial_variables={"format_instructions": self.parser.get_format_instructions()},
+        )
+        self._indice = obter_indice(vector_store)
+        self._posicoes = {doc_id: posicao for posicao, doc_id in vector_store.index_to_docstore_id.items()}
+        perguntas = [pergunta for _, pergunta in GRUPOS_DE_CAMPOS.values()]
+        self._perguntas = _normalizar([vector_store.embeddings.embed_query(p) for p in perguntas])
+
+    def _selecionar_trechos(self, nome_arquivo):
+        """Devolve (ids dos fragmentos escolhidos pela ordem do documento, menor das melhores semelhanças)."""
+        # Um fragmento deduplicado pode repetir-se no mesmo ficheiro
+        ids = [doc_id for doc_id in dict.fromkeys(self._indice.ids_da_fonte(nome_arquivo)) if doc_id in self._posicoes]
+        if not ids:
+            return [], 0.0
+        posicoes = np.array([self._posicoes[doc_id] for doc_id in ids], dtype=np.int64)
+        vetores = _normalizar(self.vector_store.index.reconstruct_batch(posicoes))
+        semelhancas = vetores @ self._perguntas.T  # (fragmentos, grupos)
+        k = min(self.top_k, len(ids))
+        escolhidos = set()
+        for grupo in range(semelhancas.shape[1]):
+            escolhidos.update(np.argsort(-semelhancas[:, grupo])[:k].tolist())
+        return [ids[i] for i in sorted(escolhidos)], float(semelhancas.max(axis=0).min())
+
+    def _extrair_com_prompt(self, prompt, variaveis, nome_arquivo):
+        output, uso, do_cache = invocar_com_cache(self.llm, prompt, variaveis, cache=self.cache)
+        dados = self.parser.parse(output)
+        dados.arquivo_fonte = nome_arquivo
+        tokens = uso.get("input_tokens", estimar_tokens(prompt.format(**variaveis)))
+        return dados.dict(), tokens, do_cache
+
+    def extrair(self, nome_arquivo, prompt_completo):
+        """
+        Extrai os campos de um ficheiro. 'prompt_completo' (com {texto_documento} e {nome_arquivo})
+        é usado na alternativa com o texto inteiro. Devolve (dados, registo da chamada).
+        """
+        inicio = time.perf_counter()
+        ids, confianca = self._selecionar_trechos(nome_arquivo)
+        texto_completo = None
+        modo, motivo = "dirigido", None
+        if len(self._indice.ids_da_fonte(nome_arquivo)) <= self.top_k * len(GRUPOS_DE_CAMPOS):
+            # Documento curto: os trechos escolhidos seriam quase o texto inteiro
+            modo, motivo = "completo", "documento curto"
+        elif confianca < self.similaridade_min:
+            modo, motivo = "completo", "baixa semelhança"
+        else:
+            docs = [self.vector_store.docstore.search(doc_id) for doc_id in ids]
+            trechos = "\n".join(
+                f"[Trecho {i}, página {doc.metadata.get('page', '?')}]\n{doc.page_content}"
+                for i, doc in enumerate(docs, start=1) if hasattr(doc, 'page_content')
+            )
+            texto_completo = texto_completo_do_ficheiro(self.vector_store, nome_arquivo)
+            if len(trechos) >= len(texto_completo):
+                # Os trechos não ficariam mais curtos do que o próprio texto
+                modo, motivo = "completo", "documento curto"
+            else:
+                dados, tokens, do_cache = self._extrair_com_prompt(
+                    self.prompt, {"trechos": trechos, "nome_arquivo": nome_arquivo}, nome_arquivo)
+                if len(campos_vazios(dados)) <= self.max_campos_vazios:
+                    return dados, self._registo(nome_arquivo, modo, None, confianca, tokens, do_cache, inicio)
+                modo, motivo = "completo", "campos em falta"
+        if texto_completo is None:
+            texto_completo = texto_completo_do_ficheiro(self.vector_store, nome_arquivo)
+        dados, tokens_completo, do_cache = self._extrair_com_prompt(
+            prompt_completo, {"texto_documento": texto_completo, "nome_arquivo": nome_arquivo}, nome_arquivo)
+        tokens = tokens_completo + (tokens if motivo == "campos em falta" else 0)
+        return dados, self._registo(nome_arquivo, modo, motivo, confianca, tokens, do_cache, inicio)
+
+    @staticmethod
+    def _registo(nome_arquivo, modo, motivo, confianca, tokens, do_cache, inicio):
+        return {
+            "arquivo": nome_arquivo,
+            "modo": modo,
+            "motivo_texto_completo": motivo,
+            "semelhanca_minima": round(confianca, 3),
+            "tokens_entrada": tokens,
+            "cache": do_cache,
+            "segundos": round(time.perf_counter() - inicio, 3),
+        }
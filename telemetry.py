@@ -0,0 +1,324 @@
+# telemetry.py
+"""
+Instrumentação leve da aplicação: etapas cronometradas, contadores e histogramas,
+sem dependências externas.
+
+Cada etapa terminada entra no histograma 'contratia_etapa_segundos' e fica numa
+linha JSON do traço da sessão ('{CACHE_DIR}/tracos/{sessao}.jsonl'), com o id do
+traço, a etapa-mãe, a duração, os atributos e o erro, se houve. Os contadores
+(tokens do LLM, hits dos caches, bytes transferidos, retentativas), os
+histogramas e os medidores registados pelos módulos (valores instantâneos, como a
+memória dos vector stores) são exportados no formato de texto do Prometheus,
+servido em /metrics se TELEMETRIA_PORTA_METRICAS estiver definida.
+
+A sessão e a etapa em curso seguem em variáveis de contexto. As threads criadas
+pela aplicação correm numa cópia do contexto de quem as criou (ver 'em_contexto'),
+para que o trabalho feito em workers fique no traço da sessão que o pediu.
+"""
+import bisect
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import (
+    CACHE_DIR, TELEMETRIA_ATIVA, TELEMETRIA_PORTA_METRICAS, TELEMETRIA_TRACOS_MAX_BYTES,
+    TELEMETRIA_TRACOS_RETENCAO_SEGUNDOS,
+)
+
+PREFIXO_METRICAS = "contratia_"
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Tipo e descrição das métricas exportadas (nome sem o prefixo)
+METRICAS = {
+    "etapa_segundos": ("histogram", "Duração das etapas instrumentadas, em segundos."),
+    "etapa_erros_total": ("counter", "Etapas terminadas com erro."),
+    "llm_tokens_total": ("counter", "Tokens enviados (entrada) e recebidos (saida) do LLM, por modelo."),
+    "cache_total": ("counter", "Consultas aos caches, por cache e resultado (hit ou miss)."),
+    "bytes_transferidos_total": ("counter", "Bytes enviados e recebidos do Cloud Storage."),
+    "retentativas_total": ("counter", "Pedidos repetidos depois de um erro transitório ou de quota."),
+}
+
+_sessao = contextvars.ContextVar("telemetria_sessao", default=None)
+_etapa_atual = contextvars.ContextVar("telemetria_etapa", default=None)
+
+
+class Etapa:
+    """Uma etapa em curso. Os atributos podem ser acrescentados até ela terminar."""
+
+    def __init__(self, nome, mae=None, atributos=None):
+        self.nome = nome
+        self.id = uuid.uuid4().hex[:16]
+        self.traco = mae.traco if mae is not None else uuid.uuid4().hex
+        self.mae = mae.id if mae is not None else None
+        self.atributos = dict(atributos or {})
+        self.inicio = time.time()
+
+    def definir(self, **atributos):
+        self.atributos.update(atributos)
+
+
+def _rotulos(rotulos):
+    return tuple(sorted((nome, str(valor)) for nome, valor in rotulos.items()))
+
+
+def _escapar(valor):
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_rotulos(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos) + "}"
+
+
+def _nome_ficheiro(sessao):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", sessao or f"processo_{os.getpid()}")
+
+
+class Telemetria:
+    """Contadores, histogramas e traços por sessão de um processo. Seguro entre threads."""
+
+    def __init__(self, pasta_tracos=None, max_bytes_traco=TELEMETRIA_TRACOS_MAX_BYTES,
+                 retencao_segundos=TELEMETRIA_TRACOS_RETENCAO_SEGUNDOS, limites=LIMITES_SEGUNDOS):
+        self.pasta_tracos = Path(pasta_tracos) if pasta_tracos else Path(CACHE_DIR) / "tracos"
+        self.max_bytes_traco = max_bytes_traco
+        self.retencao_segundos = retencao_segundos
+        self.limites = tuple(limites)
+        self._contadores = {}  # (nome, rótulos) -> valor
+        self._histogramas = {}  # (nome, rótulos) -> [contagem por intervalo..., soma, total]
+        self._medidores = {}  # nome -> (descrição, função sem argumentos lida em cada exportação)
+        self._lock = threading.Lock()
+        self._lock_tracos = threading.Lock()
+
+    def contar(self, nome, valor=1, **rotulos):
+        if not valor:
+            return
+        chave = (nome, _rotulos(rotulos))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = [0] * (len(self.limites) + 1) + [0.0, 0]
+            histograma[bisect.bisect_left(self.limites, valor)] += 1
+            histograma[-2] += valor
+            histograma[-1] += 1
+
+    def registar_medidor(self, nome, descricao, funcao):
+        """Valor instantâneo (gauge) lido de 'funcao()' em cada exportação."""
+        with self._lock:
+            self._medidores[nome] = (descricao, funcao)
+
+    def terminar_etapa(self, etapa, segundos, erro=None, sessao=None):
+        self.observar("etapa_segundos", segundos, etapa=etapa.nome)
+        if erro is not None:
+            self.contar("etapa_erros_total", etapa=etapa.nome)
+        self._escrever_traco(sessao, {
+            "sessao": sessao,
+            "traco": etapa.traco,
+            "id": etapa.id,
+            "mae": etapa.mae,
+            "nome": etapa.nome,
+            "inicio": round(etapa.inicio, 3),
+            "segundos": round(segundos, 4),
+            "atributos": etapa.atributos,
+            "erro": erro,
+            "thread": threading.current_thread().name,
+        })
+
+    def caminho_traco(self, sessao):
+        return self.pasta_tracos / f"{_nome_ficheiro(sessao)}.jsonl"
+
+    def _limpar_tracos_antigos(self):
+        limite = time.time() - self.retencao_segundos
+        for caminho in self.pasta_tracos.glob("*.jsonl*"):
+            try:
+                if caminho.stat().st_mtime < limite:
+                    caminho.unlink()
+            except OSError:
+                pass
+
+    def _escrever_traco(self, sessao, registo):
+        caminho = self.caminho_traco(sessao)
+        linha = json.dumps(registo, ensure_ascii=False, default=str) + "\n"
+        with self._lock_tracos:
+            try:
+                if not caminho.exists():
+                    # Um traço novo é uma sessão nova: altura de apagar os das sessões antigas
+                    self.pasta_tracos.mkdir(parents=True, exist_ok=True)
+                    self._limpar_tracos_antigos()
+                elif caminho.stat().st_size + len(linha) > self.max_bytes_traco:
+                    os.replace(caminho, caminho.with_name(caminho.name + ".1"))
+                with open(caminho, "a", encoding="utf-8") as f:
+                    f.write(linha)
+            except OSError:
+                # A telemetria nunca interrompe a aplicação
+                pass
+
+    def exportar_prometheus(self):
+        """Contadores e histogramas no formato de texto do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {chave: list(valores) for chave, valores in self._histogramas.items()}
+            medidores = dict(self._medidores)
+        linhas = []
+        for nome, (descricao, funcao) in sorted(medidores.items()):
+            try:
+                valor = float(funcao())
+            except Exception:
+                continue
+            linhas.append(f"# HELP {PREFIXO_METRICAS}{nome} {descricao}")
+            linhas.append(f"# TYPE {PREFIXO_METRICAS}{nome} gauge")
+            linhas.append(f"{PREFIXO_METRICAS}{nome} {valor:.15g}")
+        for nome in sorted({nome for nome, _ in contadores} | {nome for nome, _ in histogramas}):
+            completo = PREFIXO_METRICAS + nome
+            tipo, descricao = METRICAS.get(nome, ("histogram" if nome.endswith("_segundos") else "counter", nome))
+            linhas.append(f"# HELP {completo} {descricao}")
+            linhas.append(f"# TYPE {completo} {tipo}")
+            for (nome_contador, rotulos), valor in sorted(contadores.items()):
+                if nome_contador == nome:
+                    linhas.append(f"{completo}{_formatar_rotulos(rotulos)} {valor}")
+            for (nome_histograma, rotulos), valores in sorted(histogramas.items()):
+                if nome_histograma != nome:
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(self.limites + ("+Inf",), valores):
+                    acumulado += contagem
+                    linhas.append(f"{completo}_bucket{_formatar_rotulos(rotulos + (('le', str(limite)),))} {acumulado}")
+                linhas.append(f"{completo}_sum{_formatar_rotulos(rotulos)} {valores[-2]:.6f}")
+                linhas.append(f"{completo}_count{_formatar_rotulos(rotulos)} {valores[-1]}")
+        return "\n".join(linhas) + "\n"
+
+
+_telemetria = None
+_telemetria_lock = threading.Lock()
+
+
+def obter_telemetria():
+    """Instância única por processo da telemetria."""
+    global _telemetria
+    with _telemetria_lock:
+        if _telemetria is None:
+            _telemetria = Telemetria()
+        return _telemetria
+
+
+def definir_sessao(id_sessao):
+    """Sessão a que pertencem as etapas seguintes deste contexto (cada rerun do Streamlit começa por aqui)."""
+    _sessao.set(id_sessao)
+
+
+def sessao_atual():
+    return _sessao.get()
+
+
+def etapa_atual():
+    """Etapa em curso neste contexto (None fora de qualquer etapa)."""
+    return _etapa_atual.get()
+
+
+@contextmanager
+def etapa(nome, **atributos):
+    """
+    Cronometra o bloco como uma etapa, filha da etapa em curso (se houver).
+    Também pode ser usada como decorador: @etapa("resumo").
+    """
+    atual = Etapa(nome, _etapa_atual.get(), atributos)
+    token = _etapa_atual.set(atual)
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield atual
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _etapa_atual.reset(token)
+        if TELEMETRIA_ATIVA:
+            obter_telemetria().terminar_etapa(atual, time.perf_counter() - inicio, erro, _sessao.get())
+
+
+def registar_etapa(nome, segundos, **atributos):
+    """Regista uma etapa já medida por quem chama (ex.: uma resposta em streaming)."""
+    if TELEMETRIA_ATIVA:
+        obter_telemetria().terminar_etapa(Etapa(nome, _etapa_atual.get(), atributos), segundos, sessao=_sessao.get())
+
+
+def contar(nome, valor=1, **rotulos):
+    """Soma 'valor' ao contador 'nome' com os rótulos dados."""
+    if TELEMETRIA_ATIVA:
+        obter_telemetria().contar(nome, valor, **rotulos)
+
+
+def contar_cache(cache, hit, quantidade=1):
+    contar("cache_total", quantidade, cache=cache, resultado="hit" if hit else "miss")
+
+
+def em_contexto(funcao):
+    """
+    'funcao' a correr no contexto atual (sessão e etapa-mãe), para entregar a threads
+    e pools. Cada chamada usa a sua cópia, pelo que pode correr em várias threads ao mesmo tempo.
+    """
+    contexto = contextvars.copy_context()
+
+    @functools.wraps(funcao)
+    def _executar(*args, **kwargs):
+        return contexto.copy().run(funcao, *args, **kwargs)
+    return _executar
+
+
+def registar_medidor(nome, descricao, funcao):
+    obter_telemetria().registar_medidor(nome, descricao, funcao)
+
+
+def exportar_prometheus():
+    return obter_telemetria().exportar_prometheus()
+
+
+_servidor = None
+_servidor_lock = threading.Lock()
+
+
+def iniciar_servidor_metricas(porta=TELEMETRIA_PORTA_METRICAS):
+    """
+    Serve /metrics numa thread de fundo, uma vez por processo. Devolve o servidor,
+    ou None se a porta for 0 ou estiver ocupada.
+    """
+    global _servidor
+    if not porta or not TELEMETRIA_ATIVA:
+        return None
+    with _servidor_lock:
+        if _servidor is None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            class _PedidoMetricas(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    corpo = exportar_prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(corpo)))
+                    self.end_headers()
+                    self.wfile.write(corpo)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                _servidor = ThreadingHTTPServer(("0.0.0.0", porta), _PedidoMetricas)
+            except OSError:
+                return None
+            threading.Thread(target=_servidor.serve_forever, daemon=True, name="telemetria-metricas").start()
+        return _servidor
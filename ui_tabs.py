@@ -4,42 +4,79 @@ Este módulo contém funções para renderizar o conteúdo de cada aba
 da interface do utilizador do Streamlit.
 """
 import streamlit as st
-import pandas as pd
-from datetime import datetime
 import time
-import fitz # PyMuPDF
-
-from llm_utils import (
-    extrair_dados_dos_contratos, 
-    gerar_resumo_executivo, 
-    analisar_documento_para_riscos,
-    extrair_eventos_dos_contratos,
-    verificar_conformidade_documento,
-    detectar_anomalias_no_dataframe
-)
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+
+# O pandas e o llm_utils (LangChain, prompts, parsers) são importados dentro das abas
+# que os usam: a pesquisa em várias coleções, por exemplo, só desenha o chat
+from chat_cache import normalizar_pergunta, obter_cache_chat
+from chat_engine import obter_motor_chat
+from config import TRABALHOS_INTERVALO_ATUALIZACAO
+from context_budget import resumo_do_relatorio
+from document_index import impressao_colecao, texto_completo_do_ficheiro
+from job_queue import ESTADOS_ATIVOS, chave_trabalho, obter_fila_trabalhos
+from telemetry import contar_cache, etapa
 
 def _get_full_text_from_vector_store(vector_store, nome_arquivo):
     """
-    Reconstrói o texto completo de um ficheiro a partir dos documentos no vector store.
+    Reconstrói o texto completo de um ficheiro a partir do índice da coleção.
     """
-    if not hasattr(vector_store, 'docstore') or not hasattr(vector_store.docstore, '_dict'):
+    if not hasattr(vector_store, 'docstore'):
         st.error("Vector store com formato incompatível ou vazio para reconstrução de texto.")
         return ""
         
-    docs_arquivo = []
-    for doc_id, doc in vector_store.docstore._dict.items():
-        if doc.metadata.get('source') == nome_arquivo:
-            docs_arquivo.append(doc)
-    
-    if not docs_arquivo:
-        return ""
-        
-    docs_arquivo.sort(key=lambda x: x.metadata.get('page', 0))
-    
-    return "\n".join([doc.page_content for doc in docs_arquivo])
+    return texto_completo_do_ficheiro(vector_store, nome_arquivo)
+
+def _trabalho_da_colecao(tipo, vector_store, **parametros):
+    """Chave e último trabalho deste tipo sobre o conteúdo atual da coleção, de qualquer sessão."""
+    chave = chave_trabalho(tipo, impressao_colecao(vector_store), **parametros)
+    return chave, obter_fila_trabalhos().ultimo_da_chave(chave)
+
+def _iniciar_trabalho(tipo, chave, funcao, *args):
+    """Submete (ou refaz) o trabalho. Se o mesmo já estiver em curso, é esse que é devolvido."""
+    fila = obter_fila_trabalhos()
+    return fila.obter(fila.submeter(tipo, chave, funcao, *args, refazer=True))
+
+@st.fragment(run_every=TRABALHOS_INTERVALO_ATUALIZACAO)
+def _acompanhar_trabalho(id_trabalho, rotulo, mostrar_parciais):
+    """
+    Progresso de um trabalho em curso, atualizado periodicamente só nesta parte da página
+    (o resto continua utilizável). Quando o trabalho termina, a página inteira é atualizada.
+    """
+    trabalho = obter_fila_trabalhos().obter(id_trabalho)
+    if trabalho is None or trabalho['estado'] not in ESTADOS_ATIVOS:
+        st.rerun()
+    texto = trabalho['mensagem'] or ("Na fila..." if trabalho['estado'] == "pendente" else rotulo)
+    st.progress(trabalho['progresso'], text=f"⏳ {texto}")
+    st.caption("A análise continua em segundo plano: pode mudar de aba ou voltar mais tarde.")
+    if mostrar_parciais and trabalho['parciais']:
+        import pandas as pd
+        st.dataframe(pd.DataFrame(trabalho['parciais']), use_container_width=True)
+
+def _mostrar_estado_trabalho(trabalho, rotulo, mostrar_parciais=True):
+    """Mostra o progresso, os avisos ou o erro de um trabalho. Devolve True se estiver concluído."""
+    if trabalho is None:
+        return False
+    if trabalho['estado'] in ESTADOS_ATIVOS:
+        _acompanhar_trabalho(trabalho['id'], rotulo, mostrar_parciais)
+        return False
+    for aviso in trabalho['avisos']:
+        st.warning(aviso)
+    if trabalho['estado'] != "concluido":
+        st.error(f"{rotulo} não terminou: {trabalho['erro']}")
+        return False
+    return True
+
+def _mostrar_fontes(fontes):
+    if fontes:
+        with st.expander("Ver fontes da resposta"):
+            for fonte in fontes:
+                colecao = f"Coleção: {fonte.metadata['colecao']} — " if fonte.metadata.get('colecao') else ""
+                st.info(f"{colecao}Fonte: {fonte.metadata.get('source', 'N/A')} (Página: {fonte.metadata.get('page', 'N/A')})")
+                # Trecho deduplicado: o mesmo texto aparece noutros ficheiros ou páginas
+                outras = (fonte.metadata.get('fontes') or [])[1:]
+                if outras:
+                    st.caption("Também em: " + "; ".join(f"{ref.get('source')} (Página: {ref.get('page')})" for ref in outras))
+                st.text(fonte.page_content[:300] + "...")
 
 def render_chat_tab(vector_store, nomes_arquivos):
     """Renderiza a aba de Chat Interativo."""
@@ -58,69 +95,84 @@ def render_chat_tab(vector_store, nomes_arquivos):
         with st.chat_message("user"):
             st.markdown(user_prompt)
         
-        with st.chat_message("assistant"):
+        with st.chat_message("assistant"), etapa("chat"):
             message_placeholder = st.empty()
-            with st.spinner("A pesquisar e a pensar..."):
-                # A chave de API já foi definida como variável de ambiente no app.py
-                llm_chat = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0.2)
-                
-                prompt_template = """
-                Use os seguintes trechos de contexto para responder à pergunta no final.
-                A sua tarefa é sintetizar a informação e fornecer uma resposta precisa e direta.
-                Se não souber a resposta ou se a informação não estiver no contexto, diga apenas que não encontrou a informação, não tente inventar uma resposta.
-                Responda sempre em português do Brasil.
-
-                Contexto:
-                {context}
-
-                Pergunta:
-                {question}
-
-                Resposta Útil:"""
-                
-                PROMPT = PromptTemplate(
-                    template=prompt_template, input_variables=["context", "question"]
-                )
-                
-                qa_chain = RetrievalQA.from_chain_type(
-                    llm=llm_chat, 
-                    chain_type="stuff", 
-                    retriever=vector_store.as_retriever(search_kwargs={"k": 5}),
-                    chain_type_kwargs={"prompt": PROMPT},
-                    return_source_documents=True
-                )
-                
-                try:
-                    resultado = qa_chain.invoke({"query": user_prompt})
-                    resposta = resultado["result"]
-                    fontes = resultado.get("source_documents")
-                    
-                    message_placeholder.markdown(resposta)
-                    if fontes:
-                        with st.expander("Ver fontes da resposta"):
-                            for fonte in fontes:
-                                st.info(f"Fonte: {fonte.metadata.get('source', 'N/A')} (Página: {fonte.metadata.get('page', 'N/A')})")
-                                st.text(fonte.page_content[:300] + "...")
-                                    
-                    st.session_state.messages.append({"role": "assistant", "content": resposta})
-                except Exception as e:
-                    st.error(f"Erro ao processar a sua pergunta: {e}")
-                    st.session_state.messages.append({"role": "assistant", "content": "Desculpe, ocorreu um erro."})
+            cache_chat = obter_cache_chat()
+            colecao = impressao_colecao(vector_store)
+            vetor_pergunta = None
+            encontrada = cache_chat.procurar_exata(colecao, user_prompt)
+            if encontrada is None and vector_store.embeddings is not None:
+                vetor_pergunta = vector_store.embeddings.embed_query(user_prompt)
+                encontrada = cache_chat.procurar(colecao, vetor_pergunta)
+            contar_cache("chat", encontrada is not None)
+            if encontrada is not None:
+                message_placeholder.markdown(encontrada["resposta"])
+                # A pergunta original só é mostrada se foi feita nesta sessão
+                if any(m["role"] == "user" and normalizar_pergunta(m["content"]) == encontrada["pergunta_original"]
+                       for m in st.session_state.messages[:-1]):
+                    st.caption(f"♻️ Resposta reutilizada da pergunta \"{encontrada['pergunta_original']}\" "
+                               f"(semelhança {encontrada['semelhanca']:.2f}).")
+                else:
+                    st.caption(f"♻️ Resposta reutilizada de uma pergunta semelhante (semelhança {encontrada['semelhanca']:.2f}).")
+                _mostrar_fontes(encontrada["fontes"])
+                st.session_state.messages.append({"role": "assistant", "content": encontrada["resposta"]})
+                return
+
+            metricas = {}
+            inicio = time.perf_counter()
+            try:
+                motor = obter_motor_chat(vector_store)
+                with st.spinner("A pesquisar nos documentos..."):
+                    fontes = motor.recuperar(user_prompt, vetor_pergunta, metricas)
+                _mostrar_fontes(fontes)
+
+                resposta = ""
+                for bocado in motor.transmitir(user_prompt, fontes, metricas):
+                    if not resposta:
+                        metricas["segundos_ate_primeiro_token"] = round(time.perf_counter() - inicio, 2)
+                    resposta += bocado
+                    message_placeholder.markdown(resposta + "▌")
+                message_placeholder.markdown(resposta)
+                if "segundos_ate_primeiro_token" in metricas:
+                    st.caption(f"⏱️ Primeiro texto em {metricas['segundos_ate_primeiro_token']:.2f} s; "
+                               f"resposta completa em {time.perf_counter() - inicio:.2f} s.")
+                if vetor_pergunta is not None and resposta:
+                    cache_chat.guardar(colecao, user_prompt, vetor_pergunta, resposta, fontes)
+
+                st.session_state.messages.append({"role": "assistant", "content": resposta})
+            except Exception as e:
+                st.error(f"Erro ao processar a sua pergunta: {e}")
+                st.session_state.messages.append({"role": "assistant", "content": "Desculpe, ocorreu um erro."})
 
 def render_dashboard_tab(vector_store, nomes_arquivos):
     st.header("📈 Análise Comparativa de Dados Contratuais")
     st.markdown("Clique no botão para extrair e comparar os dados chave dos documentos carregados.")
-    if st.button("🚀 Gerar Dados para o Dashboard", key="btn_dashboard", use_container_width=True):
-        dados_extraidos = extrair_dados_dos_contratos(vector_store, nomes_arquivos)
-        if dados_extraidos:
-            st.session_state.df_dashboard = pd.DataFrame(dados_extraidos)
-            st.success(f"Dados extraídos para {len(st.session_state.df_dashboard)} contratos.")
-        else:
-            st.session_state.df_dashboard = pd.DataFrame()
+    chave, trabalho = _trabalho_da_colecao("dashboard", vector_store, nomes_arquivos=nomes_arquivos)
+    em_curso = trabalho is not None and trabalho['estado'] in ESTADOS_ATIVOS
+    if st.button("🚀 Gerar Dados para o Dashboard", key="btn_dashboard", use_container_width=True, disabled=em_curso):
+        from llm_utils import trabalho_dashboard
+        trabalho = _iniciar_trabalho("dashboard", chave, trabalho_dashboard, vector_store, nomes_arquivos)
+    if _mostrar_estado_trabalho(trabalho, "A extração dos dados do Dashboard"):
+        if st.session_state.get('dashboard_trabalho') != trabalho['id']:
+            # Também usados pela aba de Anomalias
+            import pandas as pd
+            st.session_state.dashboard_trabalho = trabalho['id']
+            st.session_state.df_dashboard = pd.DataFrame(trabalho['resultado']['dados'])
+            st.session_state.dashboard_relatorio = trabalho['resultado']['relatorio']
+        if st.session_state.df_dashboard.empty:
             st.warning("Nenhum dado foi extraído para o dashboard.")
-        st.rerun()
     if 'df_dashboard' in st.session_state and not st.session_state.df_dashboard.empty:
         st.dataframe(st.session_state.df_dashboard, use_container_width=True)
+        _mostrar_relatorio_chamadas(st.session_state.get('dashboard_relatorio'))
+
+def _mostrar_relatorio_chamadas(relatorio):
+    """Tabela com as chamadas ao modelo (etapa, tokens e latência) de uma análise."""
+    if not relatorio:
+        return
+    total = resumo_do_relatorio(relatorio)
+    with st.expander(f"⏱️ {total['chamadas']} chamada(s) ao modelo, {total['tokens_entrada'] + total['tokens_saida']} tokens"):
+        import pandas as pd
+        st.dataframe(pd.DataFrame(relatorio), use_container_width=True)
 
 def render_resumo_tab(vector_store, nomes_arquivos):
     st.header("📜 Resumo Executivo de um Contrato")
@@ -137,8 +189,10 @@ def render_resumo_tab(vector_store, nomes_arquivos):
             texto_completo = _get_full_text_from_vector_store(vector_store, arquivo_selecionado)
         
         if texto_completo:
-            resumo = gerar_resumo_executivo(texto_completo, arquivo_selecionado)
+            from llm_utils import gerar_resumo_executivo
+            resumo, relatorio = gerar_resumo_executivo(texto_completo, arquivo_selecionado)
             st.session_state.resumo_gerado = resumo
+            st.session_state.resumo_relatorio = relatorio
             st.session_state.arquivo_resumido = arquivo_selecionado
         else:
             st.error(f"Não foi possível reconstruir o texto do contrato '{arquivo_selecionado}' a partir da coleção.")
@@ -146,6 +200,7 @@ def render_resumo_tab(vector_store, nomes_arquivos):
     if 'arquivo_resumido' in st.session_state and st.session_state.arquivo_resumido == arquivo_selecionado:
         st.subheader(f"Resumo do Contrato: {st.session_state.arquivo_resumido}")
         st.markdown(st.session_state.resumo_gerado)
+        _mostrar_relatorio_chamadas(st.session_state.get('resumo_relatorio'))
 
 def render_riscos_tab(vector_store, nomes_arquivos):
     st.header("🚩 Análise de Cláusulas de Risco")
@@ -157,48 +212,34 @@ def render_riscos_tab(vector_store, nomes_arquivos):
         index=None
     )
     
-    if st.button("🔎 Analisar Riscos", key="btn_riscos", use_container_width=True, disabled=not arquivo_selecionado):
-        with st.spinner(f"A preparar o texto de '{arquivo_selecionado}' para análise de riscos..."):
-            texto_completo = _get_full_text_from_vector_store(vector_store, arquivo_selecionado)
+    chave, trabalho = _trabalho_da_colecao("riscos", vector_store, nome_arquivo=arquivo_selecionado) if arquivo_selecionado else (None, None)
+    em_curso = trabalho is not None and trabalho['estado'] in ESTADOS_ATIVOS
+    if st.button("🔎 Analisar Riscos", key="btn_riscos", use_container_width=True, disabled=not arquivo_selecionado or em_curso):
+        from llm_utils import trabalho_riscos
+        trabalho = _iniciar_trabalho("riscos", chave, trabalho_riscos, vector_store, arquivo_selecionado)
 
-        if texto_completo:
-            analise = analisar_documento_para_riscos(texto_completo, arquivo_selecionado)
-            st.session_state.analise_riscos_resultado = {
-                "nome_arquivo": arquivo_selecionado,
-                "analise": analise
-            }
-        else:
-            st.error(f"Não foi possível reconstruir o texto para análise de riscos do contrato '{arquivo_selecionado}'.")
-
-    if 'analise_riscos_resultado' in st.session_state and st.session_state.analise_riscos_resultado['nome_arquivo'] == arquivo_selecionado:
-        resultado = st.session_state.analise_riscos_resultado
+    if _mostrar_estado_trabalho(trabalho, "A análise de riscos", mostrar_parciais=False):
+        resultado = trabalho['resultado']
         with st.expander(f"Riscos Identificados em: {resultado['nome_arquivo']}", expanded=True):
             st.markdown(resultado['analise'])
+        _mostrar_relatorio_chamadas(resultado.get('relatorio'))
 
 def render_prazos_tab(vector_store, nomes_arquivos):
     st.header("🗓️ Monitorização de Prazos e Vencimentos")
     st.info("Esta funcionalidade analisa todos os contratos da coleção de uma vez.")
     
-    if st.button("🔍 Analisar Prazos e Datas em Todos os Contratos", key="btn_prazos", use_container_width=True):
-        textos_docs = []
-        for nome_arquivo in nomes_arquivos:
-            with st.spinner(f"A reconstruir o texto de '{nome_arquivo}'..."):
-                texto = _get_full_text_from_vector_store(vector_store, nome_arquivo)
-                if texto:
-                    textos_docs.append({"nome": nome_arquivo, "texto": texto})
-        
-        if textos_docs:
-            eventos_extraidos = extrair_eventos_dos_contratos(textos_docs)
-            if eventos_extraidos:
-                df = pd.DataFrame(eventos_extraidos)
-                st.session_state.eventos_contratuais_df = df
-            else:
-                st.warning("Nenhum evento ou prazo foi extraído dos documentos.")
-        else:
-            st.error("Falha ao reconstruir os textos dos documentos da coleção.")
+    chave, trabalho = _trabalho_da_colecao("prazos", vector_store, nomes_arquivos=nomes_arquivos)
+    em_curso = trabalho is not None and trabalho['estado'] in ESTADOS_ATIVOS
+    if st.button("🔍 Analisar Prazos e Datas em Todos os Contratos", key="btn_prazos", use_container_width=True, disabled=em_curso):
+        from llm_utils import trabalho_prazos
+        trabalho = _iniciar_trabalho("prazos", chave, trabalho_prazos, vector_store, nomes_arquivos)
 
-    if 'eventos_contratuais_df' in st.session_state and not st.session_state.eventos_contratuais_df.empty:
-        st.dataframe(st.session_state.eventos_contratuais_df, use_container_width=True)
+    if _mostrar_estado_trabalho(trabalho, "A análise de prazos"):
+        if trabalho['resultado']:
+            import pandas as pd
+            st.dataframe(pd.DataFrame(trabalho['resultado']), use_container_width=True)
+        else:
+            st.warning("Nenhum evento ou prazo foi extraído dos documentos.")
 
 def render_conformidade_tab(vector_store, nomes_arquivos):
     st.header("⚖️ Verificador de Conformidade Contratual")
@@ -218,6 +259,7 @@ def render_conformidade_tab(vector_store, nomes_arquivos):
             texto_ana = _get_full_text_from_vector_store(vector_store, doc_ana_nome)
 
         if texto_ref and texto_ana:
+            from llm_utils import verificar_conformidade_documento
             resultado = verificar_conformidade_documento(texto_ref, doc_ref_nome, texto_ana, doc_ana_nome)
             st.session_state.conformidade_resultados = resultado
         else:
@@ -236,6 +278,7 @@ def render_anomalias_tab():
         return
 
     if st.button("🚨 Detetar Anomalias Agora", key="btn_anomalias", use_container_width=True):
+        from llm_utils import detectar_anomalias_no_dataframe
         resultados = detectar_anomalias_no_dataframe(st.session_state.df_dashboard)
         st.session_state.anomalias_resultados = resultados
 
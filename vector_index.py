@@ -0,0 +1,272 @@
+# vector_index.py
+"""
+Tipo do índice vetorial de cada coleção.
+
+O FAISS do LangChain cria sempre um índice plano (pesquisa exata), cujo custo
+por consulta cresce com o número de fragmentos. Acima de INDICE_LIMIAR_ANN
+vetores (ou sempre, se configurado) a coleção passa para um índice aproximado:
+- HNSW: grafo de vizinhança, sem treino; 'efSearch' controla a largura da pesquisa;
+- IVF: vetores agrupados em 'nlist' listas por k-means (treinado na conversão);
+  'nprobe' controla quantas listas são visitadas por consulta.
+
+O índice aproximado é gravado no formato nativo do FAISS, pelo que o tipo e os
+parâmetros persistem com a coleção. Nem o HNSW nem o IVF suportam o 'merge_from'
+e o 'delete' do LangChain (o IVF não renumera as posições), por isso as
+alterações às coleções passam por fundir_vector_stores e apagar_vetores, sempre
+sobre uma cópia (copiar_vector_store) do vector store que as sessões partilham.
+"""
+import copy
+import math
+
+import faiss
+import numpy as np
+
+from config import (INDICE_HNSW_EF_CONSTRUCAO, INDICE_HNSW_EF_PESQUISA, INDICE_HNSW_M, INDICE_IVF_NLIST,
+                    INDICE_IVF_NPROBE, INDICE_LIMIAR_ANN, INDICE_TIPO, INDICE_TIPO_ANN)
+
+TIPOS_INDICE = ("flat", "hnsw", "ivf")
+
+# Vetores de treino do k-means por lista do IVF (o FAISS avisa abaixo de 39)
+_TREINO_POR_LISTA = 64
+
+
+def tipo_do_indice(index):
+    """'flat', 'hnsw', 'ivf' ou o nome da classe FAISS, para outros tipos."""
+    if isinstance(index, faiss.IndexFlat):
+        return "flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return type(index).__name__
+
+
+def escolher_tipo_indice(num_vetores, tipo=INDICE_TIPO, limiar=INDICE_LIMIAR_ANN, tipo_ann=INDICE_TIPO_ANN):
+    """Tipo de índice para uma coleção com 'num_vetores': o configurado, ou em 'auto' pelo tamanho."""
+    if tipo in TIPOS_INDICE:
+        escolhido = tipo
+    else:
+        escolhido = tipo_ann if num_vetores >= limiar else "flat"
+    if escolhido == "ivf" and num_vetores < _TREINO_POR_LISTA:
+        # Poucos vetores para treinar sequer uma lista
+        return "flat"
+    return escolhido
+
+
+def nlist_para(num_vetores, nlist=INDICE_IVF_NLIST):
+    """Número de listas do IVF: o configurado, ou √n, limitado pelos vetores de treino disponíveis."""
+    if not nlist:
+        nlist = int(math.sqrt(num_vetores))
+    return max(1, min(nlist, num_vetores // _TREINO_POR_LISTA))
+
+
+def vetores_do_indice(index):
+    """Matriz float32 (ntotal, d) com os vetores guardados no índice, pela ordem das posições."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def definir_parametros_pesquisa(index, ef_search=INDICE_HNSW_EF_PESQUISA, nprobe=INDICE_IVF_NPROBE):
+    """Ajusta a largura da pesquisa de um índice aproximado. Num índice plano não faz nada."""
+    if isinstance(index, faiss.IndexHNSW) and ef_search:
+        index.hnsw.efSearch = int(ef_search)
+    elif isinstance(index, faiss.IndexIVF) and nprobe:
+        index.nprobe = int(min(nprobe, index.nlist))
+
+
+def parametros_pesquisa(index, ef_search=INDICE_HNSW_EF_PESQUISA, nprobe=INDICE_IVF_NPROBE):
+    """
+    Largura da pesquisa para uma só consulta (SearchParameters do FAISS), ou None num
+    índice plano. Ao contrário de definir_parametros_pesquisa, não altera o índice, que
+    pode estar a ser pesquisado por outras sessões com outros valores.
+    """
+    if isinstance(index, faiss.IndexHNSW) and ef_search:
+        parametros = faiss.SearchParametersHNSW()
+        parametros.efSearch = int(ef_search)
+        return parametros
+    if isinstance(index, faiss.IndexIVF) and nprobe:
+        parametros = faiss.SearchParametersIVF()
+        parametros.nprobe = int(min(nprobe, index.nlist))
+        return parametros
+    return None
+
+
+def pesquisar_com_pontuacao(vector_store, vetor, k, ef_search=INDICE_HNSW_EF_PESQUISA, nprobe=INDICE_IVF_NPROBE):
+    """
+    (documento, pontuação) dos 'k' vizinhos de 'vetor', como o similarity_search_with_score_by_vector
+    do LangChain, mas com a largura da pesquisa passada na consulta em vez de gravada no índice.
+    """
+    consulta = np.array([vetor], dtype=np.float32)
+    if getattr(vector_store, '_normalize_L2', False):
+        faiss.normalize_L2(consulta)
+    index = vector_store.index
+    parametros = parametros_pesquisa(index, ef_search, nprobe)
+    if parametros is None:
+        pontuacoes, posicoes = index.search(consulta, k)
+    else:
+        pontuacoes, posicoes = index.search(consulta, k, params=parametros)
+    resultados = []
+    for pontuacao, posicao in zip(pontuacoes[0], posicoes[0]):
+        if posicao == -1:
+            continue
+        doc_id = vector_store.index_to_docstore_id[int(posicao)]
+        doc = vector_store.docstore.search(doc_id)
+        if isinstance(doc, str):
+            raise ValueError(f"Documento {doc_id} do índice não encontrado no docstore.")
+        resultados.append((doc, float(pontuacao)))
+    return resultados
+
+
+def descrever_indice(index):
+    """Tipo e parâmetros de um índice, para o manifest e os metadados da coleção."""
+    descricao = {"tipo": tipo_do_indice(index), "num_vetores": int(index.ntotal)}
+    if isinstance(index, faiss.IndexHNSW):
+        descricao.update(m=int(index.hnsw.nb_neighbors(1)), ef_construcao=int(index.hnsw.efConstruction),
+                         ef_pesquisa=int(index.hnsw.efSearch))
+    elif isinstance(index, faiss.IndexIVF):
+        descricao.update(nlist=int(index.nlist), nprobe=int(index.nprobe))
+    return descricao
+
+
+def bytes_estimados_indice(index):
+    """Memória aproximada do índice: vetores mais, no HNSW, as ligações do grafo e, no IVF, os ids."""
+    total = index.ntotal * index.d * 4
+    if isinstance(index, faiss.IndexHNSW):
+        total += index.ntotal * index.hnsw.nb_neighbors(0) * 4
+    elif isinstance(index, faiss.IndexIVF):
+        total += index.ntotal * 8 + index.nlist * index.d * 4
+    return total
+
+
+def construir_indice(vetores, tipo, metrica=faiss.METRIC_L2, hnsw_m=INDICE_HNSW_M,
+                     ef_construcao=INDICE_HNSW_EF_CONSTRUCAO, nlist=INDICE_IVF_NLIST):
+    """Cria um índice do 'tipo' pedido com os vetores dados (o IVF é treinado sobre uma amostra)."""
+    vetores = np.ascontiguousarray(vetores, dtype=np.float32)
+    total, dimensao = vetores.shape
+    if tipo == "flat":
+        index = faiss.IndexFlat(dimensao, metrica)
+    elif tipo == "hnsw":
+        index = faiss.IndexHNSWFlat(dimensao, hnsw_m, metrica)
+        index.hnsw.efConstruction = ef_construcao
+    elif tipo == "ivf":
+        listas = nlist_para(total, nlist)
+        index = faiss.IndexIVFFlat(faiss.IndexFlat(dimensao, metrica), dimensao, listas, metrica)
+        amostra = vetores
+        if total > listas * _TREINO_POR_LISTA:
+            escolhidos = np.random.default_rng(0).choice(total, listas * _TREINO_POR_LISTA, replace=False)
+            amostra = vetores[np.sort(escolhidos)]
+        index.train(amostra)
+        # Mapa posição -> lista, necessário para reconstruir vetores (extração dirigida, conversões)
+        index.make_direct_map()
+    else:
+        raise ValueError(f"Tipo de índice desconhecido: '{tipo}' (válidos: {', '.join(TIPOS_INDICE)}).")
+    if total:
+        index.add(vetores)
+    definir_parametros_pesquisa(index)
+    return index
+
+
+def _mesmo_tipo_com(index, vetores):
+    """Índice do mesmo tipo e parâmetros que 'index', só com 'vetores'. O IVF reutiliza o treino."""
+    tipo = tipo_do_indice(index)
+    if tipo == "ivf":
+        novo = faiss.clone_index(index)
+        novo.reset()
+        novo.make_direct_map()
+        if len(vetores):
+            novo.add(np.ascontiguousarray(vetores, dtype=np.float32))
+        return novo
+    if tipo == "hnsw":
+        novo = construir_indice(vetores, "hnsw", index.metric_type, hnsw_m=index.hnsw.nb_neighbors(1),
+                                ef_construcao=index.hnsw.efConstruction)
+        novo.hnsw.efSearch = index.hnsw.efSearch
+        return novo
+    return construir_indice(vetores, "flat", index.metric_type)
+
+
+def _substituir_indice(vector_store, index):
+    vector_store.index = index
+    if hasattr(vector_store, '_indice_mapeado'):
+        # O novo índice está em memória (ver collection_format.FAISSPreguicoso)
+        vector_store._indice_mapeado = False
+
+
+def copiar_vector_store(vector_store):
+    """
+    Cópia de um vector store que pode ser alterada sem mexer no original, que outras
+    sessões podem estar a pesquisar. O índice FAISS é copiado para memória; o docstore,
+    o mapa de posições e o índice de documentos são copiados sem duplicar os Documents.
+    """
+    novo = copy.copy(vector_store)
+    _substituir_indice(novo, faiss.deserialize_index(faiss.serialize_index(vector_store.index)))
+    docstore = vector_store.docstore
+    if isinstance(getattr(docstore, '_dict', None), dict):
+        novo.docstore = type(docstore)(dict(docstore._dict))
+    else:
+        novo.docstore = copy.copy(docstore)
+    mapa = vector_store.index_to_docstore_id
+    novo.index_to_docstore_id = dict(mapa) if isinstance(mapa, dict) else copy.copy(mapa)
+    indice = getattr(vector_store, 'indice_documentos', None)
+    if indice is not None:
+        novo.indice_documentos = copy.copy(indice)
+    return novo
+
+
+def converter_indice(vector_store, tipo=None):
+    """
+    Passa o índice do vector store para 'tipo' (por omissão, o escolhido pelo tamanho).
+    Os vetores, as posições e o docstore mantêm-se. Devolve o tipo final.
+    """
+    index = vector_store.index
+    tipo = tipo or escolher_tipo_indice(index.ntotal)
+    if tipo_do_indice(index) == tipo:
+        return tipo
+    _substituir_indice(vector_store, construir_indice(vetores_do_indice(index), tipo, index.metric_type))
+    return tipo
+
+
+def fundir_vector_stores(vector_store, vs_delta):
+    """
+    'merge_from' que funciona com qualquer combinação de tipos de índice. O 'merge_from'
+    do FAISS só aceita dois índices planos da mesma classe e esvazia o de origem, o que
+    aborta o processo num índice mapeado do disco (collection_format.FAISSPreguicoso);
+    nos outros casos os vetores do delta são reconstruídos e acrescentados. Falha antes
+    de alterar o destino se os índices não forem compatíveis ou se algum id do delta já existir.
+    """
+    index, index_delta = vector_store.index, vs_delta.index
+    if index.d != index_delta.d or index.metric_type != index_delta.metric_type:
+        raise ValueError(f"Índices incompatíveis: dimensão {index.d} e {index_delta.d}, "
+                         f"métrica {index.metric_type} e {index_delta.metric_type}.")
+    mapeado = getattr(vector_store, '_indice_mapeado', False) or getattr(vs_delta, '_indice_mapeado', False)
+    if tipo_do_indice(index) == "flat" and type(index) is type(index_delta) and not mapeado:
+        vector_store.merge_from(vs_delta)
+        return
+    repetidos = set(vs_delta.index_to_docstore_id.values()) & set(vector_store.index_to_docstore_id.values())
+    if repetidos:
+        raise ValueError(f"Ids já presentes no vector store: {sorted(repetidos)[:5]}")
+    documentos = {doc_id: vs_delta.docstore.search(doc_id) for doc_id in vs_delta.index_to_docstore_id.values()}
+    vetores = vetores_do_indice(index_delta)
+    if hasattr(vector_store, '_tornar_editavel'):
+        vector_store._tornar_editavel()
+    inicio = len(vector_store.index_to_docstore_id)
+    vector_store.index.add(vetores)
+    for posicao, doc_id in vs_delta.index_to_docstore_id.items():
+        vector_store.index_to_docstore_id[inicio + posicao] = doc_id
+    vector_store.docstore.add(documentos)
+
+
+def apagar_vetores(vector_store, ids):
+    """
+    'delete' que funciona com qualquer tipo de índice. Num índice aproximado, a remoção
+    é feita sobre uma cópia plana e o índice é reconstruído com os vetores restantes.
+    """
+    index = vector_store.index
+    if tipo_do_indice(index) == "flat":
+        vector_store.delete(ids)
+        return
+    plano = faiss.IndexFlat(index.d, index.metric_type)
+    plano.add(vetores_do_indice(index))
+    _substituir_indice(vector_store, plano)
+    vector_store.delete(ids)
+    vector_store.index = _mesmo_tipo_com(index, vetores_do_indice(plano))
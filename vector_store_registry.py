@@ -0,0 +1,253 @@
+# vector_store_registry.py
+"""
+Registo, partilhado pelo processo, dos vector stores em memória e dos bytes que ocupam.
+
+Cada entrada conta os bytes aproximados do vector store (vetores do índice, texto e
+metadados do docstore e páginas do índice de documentos) e as sessões que o estão a
+usar. O total respeita um orçamento global: acima dele, saem primeiro as entradas
+usadas há mais tempo (LRU) que nenhuma sessão tem em uso. Uma sessão deixa de contar
+como utilizadora quando escolhe outro vector store, quando sai, ou ao fim de
+VECTOR_STORES_SESSAO_TTL_SEGUNDOS sem atividade (o Streamlit não avisa quando uma
+sessão termina). Entradas com chave (coleções abertas do Storage) podem ser
+reutilizadas por outras sessões; as sem chave (uploads) só existem enquanto usadas.
+
+Os vector stores registados nunca são alterados no lugar, porque outras sessões
+podem estar a pesquisá-los: quem altera uma coleção trabalha numa cópia
+(vector_index.copiar_vector_store) e publica-a com substituir.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from config import VECTOR_STORES_MEMORIA_MAX_BYTES, VECTOR_STORES_SESSAO_TTL_SEGUNDOS
+from telemetry import registar_medidor
+from vector_index import bytes_estimados_indice
+
+# Objeto Document, entrada do docstore e id no mapa índice -> docstore, medidos com tracemalloc
+BYTES_POR_DOCUMENTO = 1024
+
+
+def tamanho_pasta(pasta):
+    return sum(f.stat().st_size for f in Path(pasta).rglob("*") if f.is_file())
+
+
+def tamanho_estimado_vector_store(vector_store, pasta=None):
+    """
+    Bytes aproximados de um vector store: vetores do índice, texto e metadados do docstore
+    e páginas do índice de documentos. Com 'pasta' (índice mapeado do disco), conta-se
+    pelo menos o tamanho dos ficheiros.
+    """
+    index = getattr(vector_store, 'index', None)
+    total = bytes_estimados_indice(index) if index is not None else 0
+    if pasta is not None:
+        return max(total, tamanho_pasta(pasta))
+    docstore = getattr(vector_store, 'docstore', None)
+    for doc in getattr(docstore, '_dict', {}).values():
+        total += len(doc.page_content.encode('utf-8')) + len(json.dumps(doc.metadata, default=str)) + BYTES_POR_DOCUMENTO
+    indice = getattr(vector_store, 'indice_documentos', None)
+    for paginas in getattr(indice, 'paginas_por_fonte', {}).values():
+        total += sum(len(texto.encode('utf-8')) for _, texto in paginas)
+    return total
+
+
+def vector_stores_de(vector_store):
+    """Vector stores que ocupam memória: numa pesquisa federada, os de cada coleção."""
+    colecoes = getattr(vector_store, 'colecoes', None)
+    return list(colecoes.values()) if isinstance(colecoes, dict) else [vector_store]
+
+
+class _Entrada:
+    __slots__ = ("vector_store", "nomes_arquivos", "bytes", "chave", "sessoes")
+
+    def __init__(self, vector_store, nomes_arquivos, tamanho, chave):
+        self.vector_store = vector_store
+        self.nomes_arquivos = list(nomes_arquivos or [])
+        self.bytes = tamanho
+        self.chave = chave
+        self.sessoes = set()
+
+
+class RegistoVectorStores:
+    """Vector stores em memória com orçamento global em bytes, LRU e contagem de sessões. Seguro entre threads."""
+
+    def __init__(self, max_bytes=VECTOR_STORES_MEMORIA_MAX_BYTES, ttl_sessao=VECTOR_STORES_SESSAO_TTL_SEGUNDOS,
+                 relogio=time.monotonic, medir=tamanho_estimado_vector_store):
+        self.max_bytes = max_bytes
+        self.ttl_sessao = ttl_sessao
+        self._relogio = relogio
+        self._medir = medir
+        self._entradas = OrderedDict()  # id(vector_store) -> _Entrada, da menos para a mais recente
+        self._por_chave = {}  # chave -> id(vector_store)
+        self._sessoes = {}  # sessão -> (ids em uso, instante da última atividade)
+        self._lock = threading.Lock()
+        self.metricas = {"hits": 0, "misses": 0, "evicoes": 0, "sessoes_expiradas": 0}
+
+    # --- entradas partilháveis (por chave) ---
+
+    def obter(self, chave):
+        """(vector_store, nomes_arquivos) guardado com esta chave, ou None."""
+        with self._lock:
+            entrada = self._entradas.get(self._por_chave.get(chave))
+            if entrada is None:
+                self.metricas["misses"] += 1
+                return None
+            self._entradas.move_to_end(id(entrada.vector_store))
+            self.metricas["hits"] += 1
+            return entrada.vector_store, list(entrada.nomes_arquivos)
+
+    def guardar(self, chave, vector_store, nomes_arquivos, tamanho=None):
+        """Guarda um vector store reutilizável com 'chave'; 'tamanho' evita voltar a medi-lo."""
+        tamanho = self._medir(vector_store) if tamanho is None else tamanho
+        with self._lock:
+            entrada = self._entrada_para(vector_store, nomes_arquivos, tamanho)
+            anterior = self._por_chave.get(chave)
+            if anterior is not None and anterior != id(vector_store):
+                self._retirar_chave(anterior)
+            entrada.chave = chave
+            self._por_chave[chave] = id(vector_store)
+            self._limitar()
+
+    def _entrada_para(self, vector_store, nomes_arquivos, tamanho):
+        entrada = self._entradas.get(id(vector_store))
+        if entrada is None:
+            entrada = self._entradas[id(vector_store)] = _Entrada(vector_store, nomes_arquivos, tamanho, None)
+        self._entradas.move_to_end(id(vector_store))
+        return entrada
+
+    def _retirar_chave(self, ident):
+        """A entrada deixa de ser reutilizável; sem sessões, sai do registo."""
+        entrada = self._entradas.get(ident)
+        if entrada is None:
+            return
+        if entrada.chave is not None and self._por_chave.get(entrada.chave) == ident:
+            del self._por_chave[entrada.chave]
+        entrada.chave = None
+        if not entrada.sessoes:
+            del self._entradas[ident]
+
+    def substituir(self, sessao, antigo, novo, nomes_arquivos=None):
+        """
+        Publica 'novo', cópia alterada de 'antigo', como o vector store de 'sessao', numa
+        só operação: 'antigo' deixa de ser entregue por chave e a sessão passa a usar 'novo'.
+        As outras sessões que já usam 'antigo' continuam com ele, inalterado.
+        """
+        if novo is antigo:
+            raise ValueError("Um vector store registado não pode ser alterado no lugar: publique uma cópia.")
+        tamanho = self._medir(novo)
+        with self._lock:
+            self._retirar_chave(id(antigo))
+            entrada = self._entrada_para(novo, nomes_arquivos, tamanho)
+            entrada.sessoes.add(sessao)
+            anteriores, _ = self._sessoes.get(sessao, (set(), None))
+            self._libertar(sessao, anteriores - {id(novo)})
+            self._sessoes[sessao] = ({id(novo)}, self._relogio())
+            self._limitar()
+
+    # --- uso pelas sessões ---
+
+    def usar_na_sessao(self, sessao, vector_store, nomes_arquivos=None):
+        """
+        Regista que 'sessao' está a usar 'vector_store' (e deixou de usar o anterior).
+        Chamado em cada rerun: também renova a atividade da sessão. Vector stores ainda
+        não registados são medidos aqui, fora do lock.
+        """
+        por_medir = []
+        with self._lock:
+            for vs in vector_stores_de(vector_store):
+                if id(vs) not in self._entradas:
+                    por_medir.append(vs)
+        tamanhos = {id(vs): self._medir(vs) for vs in por_medir}
+        with self._lock:
+            ids = set()
+            for vs in vector_stores_de(vector_store):
+                entrada = self._entradas.get(id(vs))
+                if entrada is None:
+                    # Pode ter saído do registo entre as duas secções com lock
+                    tamanho = tamanhos[id(vs)] if id(vs) in tamanhos else self._medir(vs)
+                    entrada = self._entrada_para(vs, nomes_arquivos, tamanho)
+                self._entradas.move_to_end(id(vs))
+                entrada.sessoes.add(sessao)
+                ids.add(id(vs))
+            anteriores, _ = self._sessoes.get(sessao, (set(), None))
+            self._libertar(sessao, anteriores - ids)
+            self._sessoes[sessao] = (ids, self._relogio())
+            self._expirar_sessoes()
+            self._limitar()
+
+    def libertar_sessao(self, sessao):
+        """A sessão deixou de usar vector stores (logout, ou nada carregado)."""
+        with self._lock:
+            ids, _ = self._sessoes.pop(sessao, (set(), None))
+            self._libertar(sessao, ids)
+            self._limitar()
+
+    def _libertar(self, sessao, ids):
+        for ident in ids:
+            entrada = self._entradas.get(ident)
+            if entrada is None:
+                continue
+            entrada.sessoes.discard(sessao)
+            if not entrada.sessoes and entrada.chave is None:
+                # Sem chave ninguém o volta a pedir: não vale a pena guardá-lo
+                del self._entradas[ident]
+
+    def _expirar_sessoes(self):
+        limite = self._relogio() - self.ttl_sessao
+        for sessao in [s for s, (_, instante) in self._sessoes.items() if instante < limite]:
+            ids, _ = self._sessoes.pop(sessao)
+            self._libertar(sessao, ids)
+            self.metricas["sessoes_expiradas"] += 1
+
+    def _limitar(self):
+        total = sum(e.bytes for e in self._entradas.values())
+        for ident in list(self._entradas):
+            if total <= self.max_bytes:
+                break
+            entrada = self._entradas[ident]
+            if entrada.sessoes:
+                continue
+            self._retirar_chave(ident)
+            total -= entrada.bytes
+            self.metricas["evicoes"] += 1
+
+    # --- utilização ---
+
+    def estatisticas(self):
+        with self._lock:
+            self._expirar_sessoes()
+            entradas = list(self._entradas.values())
+            sessoes = len(self._sessoes)
+        bytes_total = sum(e.bytes for e in entradas)
+        return {
+            **self.metricas,
+            "entradas": len(entradas),
+            "entradas_em_uso": sum(1 for e in entradas if e.sessoes),
+            "bytes": bytes_total,
+            "bytes_em_uso": sum(e.bytes for e in entradas if e.sessoes),
+            "max_bytes": self.max_bytes,
+            "acima_do_orcamento": bytes_total > self.max_bytes,
+            "sessoes": sessoes,
+        }
+
+
+_registo = None
+_registo_lock = threading.Lock()
+
+
+def obter_registo_vector_stores():
+    """Instância única por processo do registo de vector stores."""
+    global _registo
+    with _registo_lock:
+        if _registo is None:
+            _registo = RegistoVectorStores()
+            for nome, campo, descricao in (
+                ("vector_stores_bytes", "bytes", "Bytes estimados dos vector stores em memória."),
+                ("vector_stores_bytes_em_uso", "bytes_em_uso", "Bytes dos vector stores em uso por alguma sessão."),
+                ("vector_stores_max_bytes", "max_bytes", "Orçamento de memória dos vector stores."),
+                ("vector_stores_entradas", "entradas", "Vector stores em memória."),
+                ("vector_stores_sessoes", "sessoes", "Sessões com um vector store em uso."),
+            ):
+                registar_medidor(nome, descricao, lambda campo=campo: obter_registo_vector_stores().estatisticas()[campo])
+        return _registo